@@ -0,0 +1,245 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def content_key(*parts: Any) -> str:
+    """Stable sha256 key over bytes and JSON-serialisable parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, (bytes, bytearray, memoryview)):
+            digest.update(bytes(part))
+        else:
+            digest.update(json.dumps(part, sort_keys=True, default=str).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def normalize_text(text: Any) -> str:
+    """
+    Width- and whitespace-insensitive form of free text for cache keys. Case and
+    punctuation are kept: 'CO' and 'Co', or a case-sensitive code answer, grade differently.
+    """
+    text = unicodedata.normalize("NFKC", str(text or ""))
+    return " ".join(text.split())
+
+
+class DiskLRUCache:
+    """
+    Content-addressed JSON cache on local disk.
+
+    Each entry is one file named by its key; reads refresh the file's mtime,
+    and when the directory grows past `max_bytes` the least recently used
+    entries are deleted until it is back under 90% of the limit.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._sizes = {path.stem: path.stat().st_size for path in self.directory.glob("*/*.json")}
+        self._total_bytes = sum(self._sizes.values())
+        logger.info(f"Cache at {self.directory}: {len(self._sizes)} entries, {self._total_bytes} bytes")
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any):
+        path = self._path(key)
+        data = json.dumps(value).encode("utf-8")
+        path.parent.mkdir(exist_ok=True)
+        temp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        with self._lock:
+            self._total_bytes += len(data) - self._sizes.get(key, 0)
+            self._sizes[key] = len(data)
+            over_limit = self._total_bytes > self.max_bytes
+        if over_limit:
+            self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for key in list(self._sizes):
+                try:
+                    entries.append((self._path(key).stat().st_mtime, key))
+                except OSError:
+                    self._total_bytes -= self._sizes.pop(key)
+            entries.sort()
+            target = self.max_bytes * 0.9
+            for _, key in entries:
+                if self._total_bytes <= target:
+                    break
+                try:
+                    self._path(key).unlink()
+                except OSError:
+                    pass
+                self._total_bytes -= self._sizes.pop(key)
+                self.evictions += 1
+        logger.info(f"Cache at {self.directory} evicted down to {self._total_bytes} bytes")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._sizes),
+                "bytes": self._total_bytes,
+                "maxBytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hitRate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+class TTLCache:
+    """
+    Two-tier response cache: a bounded in-memory LRU in front of an optional
+    DiskLRUCache. Entries expire `ttl_seconds` after they were stored, in both
+    tiers; disk hits are promoted into memory.
+    """
+
+    def __init__(self, ttl_seconds: int, max_entries: int, disk: Optional[DiskLRUCache] = None):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.disk = disk
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+                self.expired += 1
+        if self.disk is not None:
+            stored = self.disk.get(key)
+            if stored is not None and stored.get("expiresAt", 0) > now:
+                self._remember(key, stored["value"], stored["expiresAt"])
+                with self._lock:
+                    self.hits += 1
+                return stored["value"]
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _remember(self, key: str, value: Any, expires_at: float):
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def set(self, key: str, value: Any):
+        expires_at = time.time() + self.ttl_seconds
+        self._remember(key, value, expires_at)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, {"expiresAt": expires_at, "value": value})
+            except OSError as e:
+                logger.warning(f"Failed to write cache entry to disk: {str(e)}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "entries": len(self._entries),
+                "maxEntries": self.max_entries,
+                "ttlSeconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "hitRate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats()
+        return stats
+
+
+class RequestDeduplicator:
+    """
+    Runs the work for each key at most once per TTL. Completed results are
+    kept in a TTLCache and replayed for repeats; concurrent duplicates of a
+    request still in flight await the same task instead of starting their own.
+    Failures are not stored, so a retry after an error runs again.
+    """
+
+    def __init__(self, results: TTLCache):
+        self.results = results
+        self.joined = 0
+        self._in_flight = {}
+
+    async def run(self, key: str, work: Callable[[], Awaitable[Any]]) -> Tuple[Any, str]:
+        """Returns (result, outcome) where outcome is 'stored', 'joined' or 'fresh'."""
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.joined += 1
+            return await asyncio.shield(task), "joined"
+
+        stored = await asyncio.to_thread(self.results.get, key)
+        if stored is not None:
+            return stored, "stored"
+
+        # Re-check: another request may have started the work while the store was read
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.joined += 1
+            return await asyncio.shield(task), "joined"
+
+        async def run_and_store():
+            try:
+                result = await work()
+                await asyncio.to_thread(self.results.set, key, result)
+                return result
+            finally:
+                self._in_flight.pop(key, None)
+
+        # The shared task keeps running if the request that started it disconnects
+        task = asyncio.ensure_future(run_and_store())
+        self._in_flight[key] = task
+        return await asyncio.shield(task), "fresh"
+
+    def stats(self) -> dict:
+        return {
+            "inFlight": len(self._in_flight),
+            "joined": self.joined,
+            **self.results.stats()
+        }
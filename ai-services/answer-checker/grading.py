@@ -0,0 +1,764 @@
+import asyncio
+import json
+import logging
+import re
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from cache import TTLCache, content_key, normalize_text
+from gemini_client import GeminiError
+from segmentation import UNCLEAR_ANSWER, is_readable_answer
+
+logger = logging.getLogger(__name__)
+
+
+def parse_status(feedback: str) -> str:
+    feedback_lower = feedback.lower()
+    if "status: correct" in feedback_lower:
+        return "Correct"
+    if "status: wrong" in feedback_lower:
+        return "Wrong"
+    if "status: unclear" in feedback_lower:
+        return "Unclear"
+    return ""
+
+
+def award_marks(status: str, question_marks: int) -> int:
+    if status == "Correct":
+        return question_marks  # Full marks
+    if status == "Unclear":
+        return question_marks // 2  # Half marks, rounded down
+    return 0  # Zero marks, also for unparseable feedback
+
+
+def unreadable_result(question_text: Optional[str], question_marks: int) -> Tuple[dict, int]:
+    """
+    (result, marks awarded) for an answer segment with nothing readable in it, without calling Gemini.
+    Graded "Unclear", as Gemini grades illegible answers: the segment may only be empty because its
+    question number was missed when the sheet was split.
+    """
+    marks_awarded = award_marks("Unclear", question_marks)
+    result_item = {
+        "extractedText": UNCLEAR_ANSWER,
+        "feedback": "No readable answer was found for this question.",
+        "marks": f"{marks_awarded}/{question_marks}",
+        "status": "Unclear"
+    }
+    if question_text is not None:
+        result_item = {"questionText": question_text, **result_item}
+    return result_item, marks_awarded
+
+
+GRADING_MODES = ("per_question", "fused")
+
+# Bump a version whenever its prompt template changes so cached responses are not reused
+PROMPT_VERSIONS = {
+    "enhance": 1,
+    "check": 1,
+    "fused": 1,
+    "batch": 1
+}
+
+
+def ocr_confidence_note(ocr_confidence: Optional[float], min_confidence: float = 60) -> str:
+    """Prompt note on the sheet's OCR confidence; below `min_confidence` (the OCR retry threshold) it warns of misreadings."""
+    if ocr_confidence is None:
+        return ""
+    note = f"OCR confidence for this sheet: {ocr_confidence:.0f}/100."
+    if ocr_confidence < min_confidence:
+        note += " Expect frequent misreadings."
+    return note
+
+
+def question_fingerprint(question: dict) -> str:
+    """Identity of a /check-answers question: everything its grade depends on, normalised."""
+    return content_key(
+        "batch",
+        PROMPT_VERSIONS["batch"],
+        normalize_text(question.get('text', '')),
+        question.get('marks', 0),
+        normalize_text(question.get('expectedAnswer', '')),
+        normalize_text(question.get('studentAnswer', ''))
+    )
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough prompt token count (~4 characters per token for English text)."""
+    return len(text) // 4 + 1
+
+
+BATCH_PROMPT_HEADER = """You are an expert examiner evaluating student answers.
+
+Total Marks: {total_marks}
+
+For each question, provide:
+1. Marks awarded (based on the maximum marks for that question)
+2. Brief feedback explaining the evaluation
+
+Evaluate fairly and constructively. Award partial marks where appropriate.
+
+Questions and Answers:
+"""
+
+BATCH_PROMPT_FOOTER = """
+
+Provide your evaluation in the following JSON format:
+{
+  "questionEvaluations": [
+    {
+      "questionNumber": 1,
+      "marksAwarded": <marks>,
+      "maxMarks": <max_marks>,
+      "feedback": "<feedback>"
+    },
+    ...
+  ],
+  "overallFeedback": "<general comments about the student's performance>"
+}
+"""
+# Tokens of the /check-answers prompt template itself (plus the total marks filled in),
+# taken off the budget before questions are chunked
+BATCH_PROMPT_TOKENS = estimate_tokens(BATCH_PROMPT_HEADER + BATCH_PROMPT_FOOTER) + 5
+
+
+def chunk_by_token_budget(numbered_questions: List[Tuple[int, dict]], budget: int) -> List[List[Tuple[int, dict]]]:
+    """
+    Split (question number, question) pairs into consecutive chunks whose
+    estimated prompt tokens stay under `budget`. A question larger than the
+    budget gets a chunk of its own.
+    """
+    chunks, current, used = [], [], 0
+    for idx, q in numbered_questions:
+        # ~30 tokens of per-question framing and JSON output on top of the text itself
+        cost = 30 + sum(estimate_tokens(str(q.get(field) or '')) for field in ('text', 'expectedAnswer', 'studentAnswer'))
+        if current and used + cost > budget:
+            chunks.append(current)
+            current, used = [], 0
+        current.append((idx, q))
+        used += cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class GradingEngine:
+    """
+    Async Gemini fan-out for answer sheets.
+
+    Every question runs its enhance -> check chain concurrently with the
+    others; a shared semaphore caps how many Gemini requests are in flight
+    so one large sheet cannot exhaust the quota for the whole service.
+    Rate limiting, retries and the circuit breaker live in the shared
+    GeminiClient passed in as `client`.
+    """
+
+    def __init__(self, client, concurrency: int = 8, cache: Optional[TTLCache] = None,
+                 batch_token_budget: int = 6000, batch_max_reasks: int = 1, ocr_min_confidence: float = 60,
+                 pregrader: Optional[Callable[[List[dict]], Dict[int, dict]]] = None):
+        self.client = client
+        self.concurrency = max(1, concurrency)
+        self.cache = cache
+        self.batch_token_budget = batch_token_budget
+        # What is left of the budget for the questions once the prompt template is counted
+        self.batch_question_budget = max(1, batch_token_budget - BATCH_PROMPT_TOKENS)
+        self.batch_max_reasks = batch_max_reasks
+        self.ocr_min_confidence = ocr_min_confidence
+        self.pregrader = pregrader
+        self.pregrade_stats = {"questions": 0, "decidedLocally": 0, "llmPromptsSaved": 0}
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+
+    def confidence_note(self, ocr_confidence: Optional[float]) -> str:
+        return ocr_confidence_note(ocr_confidence, self.ocr_min_confidence)
+
+    def cache_key(self, template: str, *parts: Any) -> str:
+        return content_key(self.client.model_name, template, PROMPT_VERSIONS[template], *parts)
+
+    async def cache_get(self, key: str) -> Optional[Any]:
+        return await asyncio.to_thread(self.cache.get, key) if self.cache else None
+
+    async def cache_set(self, key: str, value: Any):
+        if self.cache:
+            await asyncio.to_thread(self.cache.set, key, value)
+
+    def pregrade(self, numbered_questions: List[Tuple[Any, dict]]) -> Dict[Any, dict]:
+        """Run the local pre-grader over (key, question) pairs; returns {key: evaluation} for the clear-cut ones."""
+        if not self.pregrader or not numbered_questions:
+            return {}
+        decided = self.pregrader([q for _, q in numbered_questions])
+        self.pregrade_stats["questions"] += len(numbered_questions)
+        self.pregrade_stats["decidedLocally"] += len(decided)
+        return {numbered_questions[i][0]: ev for i, ev in decided.items()}
+
+    def count_prompts_saved(self, before: List[List[Tuple[int, dict]]], after: List[List[Tuple[int, dict]]]):
+        """Record how many token-budget chunks (= Gemini prompts) local decisions removed, per prompt group."""
+        prompts_before = sum(len(chunk_by_token_budget(group, self.batch_question_budget)) for group in before if group)
+        prompts_after = sum(len(chunk_by_token_budget(group, self.batch_question_budget)) for group in after if group)
+        self.pregrade_stats["llmPromptsSaved"] += prompts_before - prompts_after
+        if prompts_before != prompts_after:
+            logger.info(f"Pre-grader saved {prompts_before - prompts_after} of {prompts_before} Gemini prompts")
+
+    async def generate(self, prompt: str) -> str:
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            return await self.client.generate_async(prompt)
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    async def enhance_extracted_text(self, raw_text: str, ocr_confidence: Optional[float] = None) -> str:
+        key = self.cache_key("enhance", normalize_text(raw_text), self.confidence_note(ocr_confidence))
+        cached = await self.cache_get(key)
+        if cached is not None:
+            return cached
+        try:
+            prompt = f"""
+            You are an expert in interpreting garbled or poorly extracted text from handwritten answer sheets using OCR. The following text was extracted and may contain errors or misreadings due to OCR limitations. Your task is to correct and enhance it into a coherent answer based on common knowledge or context. If the text is unintelligible, provide a best guess or mark it as unclear.
+
+            {self.confidence_note(ocr_confidence)}
+            Extracted Text: {raw_text}
+
+            Respond with the enhanced text only. If no meaningful enhancement is possible, return 'Unclear answer'.
+            """
+            enhanced_text = (await self.generate(prompt)).strip()
+            logger.info(f"Enhanced text from '{raw_text[:50]}...' to '{enhanced_text[:50]}...'")
+            enhanced_text = enhanced_text if enhanced_text else "Unclear answer"
+            await self.cache_set(key, enhanced_text)
+            return enhanced_text
+        except Exception as e:
+            logger.error(f"Failed to enhance text: {str(e)}")
+            return raw_text or "Unclear answer"
+
+    async def check_answer_with_gemini(self, question_text: str, answer_text: str, question_num: int) -> dict:
+        key = self.cache_key("check", normalize_text(question_text), normalize_text(answer_text))
+        cached = await self.cache_get(key)
+        if cached is not None:
+            return {"status": "", "feedback": cached}
+        try:
+            prompt = f"""
+            You are an expert answer checker for handwritten answer sheets. The following is the question and the enhanced extracted answer for Question {question_num}. Evaluate the answer's correctness.
+
+            Question: {question_text or 'No question provided'}
+            Enhanced Extracted Answer: {answer_text}
+
+            Respond in the following format:
+            Status: [Correct/Wrong/Unclear]
+            Feedback: [Brief explanation of why the answer is correct, incorrect, or unclear]
+
+            If you cannot determine correctness due to unclear text or lack of context, use:
+            Status: Unclear
+            Feedback: [Explanation of why evaluation was not possible]
+            """
+            feedback = await self.generate(prompt)
+            logger.info(f"Gemini API response for Question {question_num}: {feedback[:100]}...")
+            if parse_status(feedback):
+                await self.cache_set(key, feedback)
+            return {"status": "", "feedback": feedback}
+        except Exception as e:
+            logger.error(f"Gemini API failed for Question {question_num}: {str(e)}")
+            return {"status": "Error", "feedback": f"Error during answer checking: {str(e)}"}
+
+    async def grade(self, answers: List[str], marks_list: List[int], questions: Optional[List[str]] = None,
+                    mode: str = "per_question", ocr_confidence: Optional[float] = None) -> Tuple[List[dict], int]:
+        if mode == "fused":
+            return await self.grade_sheet_fused(answers, marks_list, questions, ocr_confidence=ocr_confidence)
+        return await self.grade_sheet(answers, marks_list, questions, ocr_confidence=ocr_confidence)
+
+    def grade_iter(self, answers: List[str], marks_list: List[int], questions: Optional[List[str]] = None,
+                   mode: str = "per_question", ocr_confidence: Optional[float] = None) -> AsyncIterator[Tuple[int, dict, int]]:
+        """
+        Like grade(), but yields (question number, result item, marks awarded)
+        for each question as soon as it is graded, in completion order.
+        """
+        if mode == "fused":
+            return self.iter_sheet_fused(answers, marks_list, questions, ocr_confidence=ocr_confidence)
+        return self.iter_sheet(answers, marks_list, questions, ocr_confidence=ocr_confidence)
+
+    @staticmethod
+    async def collect(graded: AsyncIterator[Tuple[int, dict, int]], count: int) -> Tuple[List[dict], int]:
+        """Gather grade_iter() output back into question order plus the total marks awarded."""
+        results = [None] * count
+        total_awarded = 0
+        async for question_num, result_item, marks_awarded in graded:
+            results[question_num - 1] = result_item
+            total_awarded += marks_awarded
+        return results, total_awarded
+
+    async def enhance_and_check_sheet(self, items: List[Tuple[int, Optional[str], str]],
+                                      ocr_confidence: Optional[float] = None) -> Dict[int, dict]:
+        """
+        Fused enhance + check for many answers in a single Gemini prompt.
+        `items` are (question number, question text, raw OCR answer) tuples.
+        Returns {question number: {"cleanedText", "status", "feedback"}} for every
+        question the model answered; missing or malformed entries are left out.
+        """
+        prompt = """You are an expert answer checker for handwritten answer sheets. The answers below were extracted with OCR and may contain errors or misreadings.
+
+For each question:
+1. Correct the extracted answer into coherent text based on common knowledge or context. If it is unintelligible, use 'Unclear answer'.
+2. Evaluate the corrected answer's correctness against the question (if provided).
+
+Use status Unclear when correctness cannot be determined due to unclear text or lack of context.
+"""
+        prompt += f"{self.confidence_note(ocr_confidence)}\n\nAnswers:\n"
+        for question_num, question_text, answer in items:
+            prompt += f"\nQuestion {question_num}: {question_text or 'No question provided'}\n"
+            prompt += f"Extracted Answer {question_num}: {answer}\n"
+        prompt += """
+Respond only with JSON in the following format:
+{
+  "results": [
+    {
+      "questionNumber": 1,
+      "cleanedText": "<corrected answer>",
+      "status": "Correct|Wrong|Unclear",
+      "feedback": "<brief explanation of why the answer is correct, incorrect, or unclear>"
+    },
+    ...
+  ]
+}
+"""
+        response_text = (await self.generate(prompt)).strip()
+        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+        if not json_match:
+            logger.warning("Could not parse fused grading response as JSON")
+            return {}
+
+        expected = {question_num for question_num, _, _ in items}
+        graded = {}
+        for entry in json.loads(json_match.group()).get('results', []):
+            try:
+                question_num = int(entry.get('questionNumber'))
+            except (TypeError, ValueError):
+                continue
+            status = str(entry.get('status', '')).strip().capitalize()
+            if question_num not in expected or status not in ("Correct", "Wrong", "Unclear"):
+                continue
+            graded[question_num] = {
+                "cleanedText": str(entry.get('cleanedText') or '').strip() or "Unclear answer",
+                "status": status,
+                "feedback": f"Status: {status}\nFeedback: {entry.get('feedback', '')}"
+            }
+        return graded
+
+    async def grade_sheet_fused(self, answers: List[str], marks_list: List[int], questions: Optional[List[str]] = None,
+                                max_reasks: int = 1, ocr_confidence: Optional[float] = None) -> Tuple[List[dict], int]:
+        return await self.collect(
+            self.iter_sheet_fused(answers, marks_list, questions, max_reasks, ocr_confidence), len(answers)
+        )
+
+    async def iter_sheet_fused(self, answers: List[str], marks_list: List[int], questions: Optional[List[str]] = None,
+                               max_reasks: int = 1, ocr_confidence: Optional[float] = None) -> AsyncIterator[Tuple[int, dict, int]]:
+        """
+        Grade a whole sheet with one fused enhance + check prompt.
+        Questions missing from the reply are re-asked on their own up to
+        `max_reasks` times, then fall back to the per-question chain.
+        Cached questions are yielded first, then each reply's questions as it arrives.
+        """
+        question_texts = questions if questions is not None else [None] * len(answers)
+        note = self.confidence_note(ocr_confidence)
+        keys = {
+            i: self.cache_key("fused", normalize_text(question_text), normalize_text(answer), note)
+            for i, (question_text, answer) in enumerate(zip(question_texts, answers), 1)
+            if is_readable_answer(answer)
+        }
+
+        def fused_result(question_num: int, entry: dict) -> Tuple[int, dict, int]:
+            question_text = question_texts[question_num - 1]
+            question_marks = marks_list[question_num - 1]
+            marks_awarded = award_marks(entry['status'], question_marks)
+            result_item = {
+                "extractedText": entry['cleanedText'],
+                "feedback": entry['feedback'],
+                "marks": f"{marks_awarded}/{question_marks}",
+                "status": entry['status']
+            }
+            if question_text is not None:
+                result_item = {"questionText": question_text, **result_item}
+            logger.info(f"Question {question_num}: Status: {entry['status']}, Marks: {marks_awarded}/{question_marks}")
+            return question_num, result_item, marks_awarded
+
+        graded = set()
+        for question_num in range(1, len(answers) + 1):
+            if question_num not in keys:
+                graded.add(question_num)
+                yield (question_num, *unreadable_result(question_texts[question_num - 1], marks_list[question_num - 1]))
+        cache_hits = 0
+        for question_num, key in keys.items():
+            cached = await self.cache_get(key)
+            if cached is not None:
+                graded.add(question_num)
+                cache_hits += 1
+                yield fused_result(question_num, cached)
+        if cache_hits:
+            logger.info(f"Fused grading cache hit for {cache_hits}/{len(answers)} questions")
+
+        pending = [(i, question_text, answer) for i, (question_text, answer) in enumerate(zip(question_texts, answers), 1)
+                   if i not in graded]
+        for attempt in range(max_reasks + 1):
+            if not pending:
+                break
+            try:
+                fresh = await self.enhance_and_check_sheet(pending, ocr_confidence)
+            except Exception as e:
+                logger.error(f"Fused grading attempt {attempt + 1} failed: {str(e)}")
+                fresh = {}
+            for question_num, entry in sorted(fresh.items()):
+                await self.cache_set(keys[question_num], entry)
+                graded.add(question_num)
+                yield fused_result(question_num, entry)
+            pending = [item for item in pending if item[0] not in graded]
+            if pending:
+                logger.warning(f"Fused grading missing questions {[item[0] for item in pending]} after attempt {attempt + 1}")
+
+        fallback = [
+            (question_num, self.grade_question(question_text, answer, marks_list[question_num - 1], question_num, ocr_confidence))
+            for question_num, question_text, answer in pending
+        ]
+        async for item in self.as_completed(fallback):
+            yield item
+
+    @staticmethod
+    async def as_completed(numbered: List[Tuple[int, Awaitable[Tuple[dict, int]]]]) -> AsyncIterator[Tuple[int, dict, int]]:
+        """Run (question number, grading coroutine) pairs concurrently and yield each as it finishes."""
+        async def run(question_num: int, coro: Awaitable[Tuple[dict, int]]) -> Tuple[int, dict, int]:
+            result_item, marks_awarded = await coro
+            return question_num, result_item, marks_awarded
+
+        tasks = [asyncio.ensure_future(run(question_num, coro)) for question_num, coro in numbered]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Consumer stopped early (e.g. streaming client disconnected): stop the remaining Gemini calls
+            for task in tasks:
+                task.cancel()
+
+    async def grade_question(self, question_text: Optional[str], answer: str, question_marks: int, question_num: int,
+                             ocr_confidence: Optional[float] = None) -> Tuple[dict, int]:
+        if not is_readable_answer(answer):
+            logger.info(f"Question {question_num}: no readable answer, not sent to Gemini")
+            return unreadable_result(question_text, question_marks)
+        enhanced_answer = await self.enhance_extracted_text(answer, ocr_confidence)
+        logger.info(f"Original: '{answer[:50]}...' -> Enhanced: '{enhanced_answer[:50]}...'")
+
+        result = await self.check_answer_with_gemini(question_text or "", enhanced_answer, question_num)
+        status = parse_status(result['feedback'])
+        marks_awarded = award_marks(status, question_marks)
+        status = status or "Unclear"
+        logger.info(f"Question {question_num}: Status: {status}, Marks: {marks_awarded}/{question_marks}")
+
+        result_item = {
+            "extractedText": enhanced_answer,
+            "feedback": result['feedback'],
+            "marks": f"{marks_awarded}/{question_marks}",
+            "status": status
+        }
+        if question_text is not None:
+            result_item = {"questionText": question_text, **result_item}
+        return result_item, marks_awarded
+
+    async def grade_sheet(self, answers: List[str], marks_list: List[int], questions: Optional[List[str]] = None,
+                          ocr_confidence: Optional[float] = None) -> Tuple[List[dict], int]:
+        """
+        Grade every answer of a sheet concurrently.
+        Returns the per-question results in question order and the total marks awarded.
+        """
+        return await self.collect(self.iter_sheet(answers, marks_list, questions, ocr_confidence), len(answers))
+
+    def iter_sheet(self, answers: List[str], marks_list: List[int], questions: Optional[List[str]] = None,
+                   ocr_confidence: Optional[float] = None) -> AsyncIterator[Tuple[int, dict, int]]:
+        questions = questions if questions is not None else [None] * len(answers)
+        return self.as_completed([
+            (i, self.grade_question(question_text, answer, question_marks, i, ocr_confidence))
+            for i, (question_text, answer, question_marks) in enumerate(zip(questions, answers, marks_list), 1)
+        ])
+
+    async def evaluate_answers(self, questions: List[dict], total_marks: int,
+                               previous: Optional[Dict[str, dict]] = None) -> dict:
+        """
+        Batch evaluation for /check-answers.
+        A question is only sent to Gemini when its fingerprint is not in
+        `previous` (the attempt's stored evaluations, by fingerprint), the local
+        pre-grader cannot decide it and it is not in the response cache.
+        Returns {"questionEvaluations", "overallFeedback", "fingerprints",
+        "regraded", "locallyGraded"}, numbered by each question's 1-based
+        position in `questions`.
+        """
+        previous = previous or {}
+        fingerprints = {idx: question_fingerprint(q) for idx, q in enumerate(questions, 1)}
+        keys = {idx: self.cache_key("batch", fingerprint) for idx, fingerprint in fingerprints.items()}
+        overall_key = self.cache_key("batch", "overall", sorted(keys.values()))
+
+        evaluations = {}
+        for idx, fingerprint in fingerprints.items():
+            stored = previous.get(fingerprint)
+            if stored is None:
+                stored = await self.cache_get(keys[idx])
+            if stored is not None:
+                evaluations[idx] = {"questionNumber": idx, **stored}
+        if evaluations:
+            logger.info(f"Batch evaluation reused {len(evaluations)}/{len(questions)} stored question results")
+
+        undecided = [(idx, q) for idx, q in enumerate(questions, 1) if idx not in evaluations]
+        locally_graded = self.pregrade(undecided)
+        for idx, ev in locally_graded.items():
+            evaluations[idx] = {"questionNumber": idx, **ev}
+        if locally_graded:
+            self.count_prompts_saved([undecided], [[(idx, q) for idx, q in undecided if idx not in locally_graded]])
+
+        overall_feedback = await self.cache_get(overall_key)
+        pending = [(idx, q) for idx, q in enumerate(questions, 1) if idx not in evaluations]
+        regraded = []
+        if pending:
+            chunks = chunk_by_token_budget(pending, self.batch_question_budget)
+            if len(chunks) > 1:
+                logger.info(f"Evaluating {len(pending)} questions in {len(chunks)} chunks of <= {self.batch_token_budget} tokens")
+            # Stored marks are only listed as context when a single prompt sees the whole attempt
+            chunk_results = await asyncio.gather(*[
+                self.evaluate_chunk(chunk, total_marks, graded=evaluations if len(chunks) == 1 else None)
+                for chunk in chunks
+            ])
+            chunk_feedback = []
+            for chunk_evaluations, feedback in chunk_results:
+                for idx, ev in chunk_evaluations.items():
+                    evaluations[idx] = ev
+                    regraded.append(idx)
+                    await self.cache_set(keys[idx], {
+                        "marksAwarded": ev.get('marksAwarded', 0),
+                        "maxMarks": ev.get('maxMarks'),
+                        "feedback": ev.get('feedback', 'Evaluated')
+                    })
+                if feedback:
+                    chunk_feedback.append(feedback)
+            if chunk_feedback:
+                overall_feedback = " ".join(chunk_feedback)
+            if overall_feedback and len(evaluations) == len(questions):
+                await self.cache_set(overall_key, overall_feedback)
+
+        return {
+            "questionEvaluations": [evaluations[idx] for idx in sorted(evaluations)],
+            "overallFeedback": overall_feedback or "Evaluation completed",
+            "fingerprints": fingerprints,
+            "regraded": sorted(regraded + list(locally_graded)),
+            "locallyGraded": sorted(locally_graded)
+        }
+
+    async def evaluate_chunk(self, chunk: List[Tuple[int, dict]], total_marks: int,
+                             graded: Optional[Dict[int, dict]] = None) -> Tuple[Dict[int, dict], Optional[str]]:
+        """
+        Evaluate one chunk, re-asking only the questions missing from an
+        unparseable or truncated reply up to `batch_max_reasks` times.
+        Returns ({question number: evaluation}, overall feedback); questions
+        still missing, or in a chunk Gemini failed on, are left to the caller's fallback.
+        """
+        expected = {idx for idx, _ in chunk}
+        evaluations = {}
+        overall_feedback = None
+        pending = chunk
+        for attempt in range(self.batch_max_reasks + 1):
+            try:
+                eval_result = await self.evaluate_with_gemini(pending, total_marks, graded=graded)
+            except GeminiError as e:
+                # Already retried by the client: the other chunks keep their results and these
+                # questions go to the caller's fallback instead of failing the whole attempt
+                logger.error(f"Batch chunk {[idx for idx, _ in pending]} failed: {str(e)}")
+                break
+            except ValueError as e:
+                logger.warning(f"Batch chunk {[idx for idx, _ in pending]} unparseable on attempt {attempt + 1}: {str(e)}")
+                eval_result = {}
+            for ev in eval_result.get('questionEvaluations') or []:
+                try:
+                    idx = int(ev.get('questionNumber'))
+                except (TypeError, ValueError):
+                    continue
+                if idx in expected and idx not in evaluations:
+                    evaluations[idx] = {**ev, "questionNumber": idx}
+            overall_feedback = overall_feedback or eval_result.get('overallFeedback')
+            pending = [(idx, q) for idx, q in pending if idx not in evaluations]
+            if not pending:
+                break
+        if pending:
+            logger.warning(f"Batch evaluation missing questions {[idx for idx, _ in pending]} after re-asks")
+        return evaluations, overall_feedback
+
+    async def evaluate_with_gemini(self, numbered_questions: List[Tuple[int, dict]], total_marks: int,
+                                   graded: Optional[Dict[int, dict]] = None) -> dict:
+        # Build evaluation prompt
+        evaluation_prompt = BATCH_PROMPT_HEADER.format(total_marks=total_marks)
+
+        for idx, q in numbered_questions:
+            q_text = q.get('text', '')
+            q_marks = q.get('marks', 0)
+            expected = q.get('expectedAnswer', '')
+            student = q.get('studentAnswer', '')
+
+            evaluation_prompt += f"\n\nQuestion {idx} (Max {q_marks} marks):\n{q_text}\n"
+            if expected:
+                evaluation_prompt += f"Expected Answer: {expected}\n"
+            evaluation_prompt += f"Student Answer: {student}\n"
+
+        if graded:
+            # Unchanged questions keep their stored marks; listed only so the overall feedback covers the whole attempt
+            evaluation_prompt += "\n\nAlready evaluated (do not include these in questionEvaluations):\n"
+            for idx, ev in sorted(graded.items()):
+                evaluation_prompt += f"Question {idx}: {ev.get('marksAwarded', 0)}/{ev.get('maxMarks')} marks - {ev.get('feedback', '')}\n"
+
+        evaluation_prompt += BATCH_PROMPT_FOOTER
+
+        # Call Gemini AI
+        response_text = (await self.generate(evaluation_prompt)).strip()
+
+        # Extract JSON from response
+        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+        if not json_match:
+            raise ValueError("No JSON object in response")
+        # json.JSONDecodeError is a ValueError: truncated replies are re-asked by evaluate_chunk
+        return json.loads(json_match.group())
+
+    async def evaluate_attempts(self, questions: List[dict], attempts: List[List[str]]) -> List[Dict[int, dict]]:
+        """
+        Grade several attempts of one exam together. `questions` carry the shared
+        text, marks and expected answer; each attempt is its student answers in
+        question order. For every question the distinct answers across all
+        attempts go into shared prompts (see evaluate_question_group), so identical
+        answers are graded once. Returns, per attempt, {question number: evaluation};
+        blank answers and questions Gemini did not grade are left to the caller's fallback.
+        """
+        fingerprints = [
+            {idx: question_fingerprint({**q, "studentAnswer": answer})
+             for idx, (q, answer) in enumerate(zip(questions, answers), 1) if str(answer or '').strip()}
+            for answers in attempts
+        ]
+        # Distinct (question number, question with answer) across the cohort, by fingerprint
+        distinct = {}
+        for answers, attempt_fingerprints in zip(attempts, fingerprints):
+            for idx, fingerprint in attempt_fingerprints.items():
+                distinct.setdefault(fingerprint, (idx, {**questions[idx - 1], "studentAnswer": answers[idx - 1]}))
+        locally_graded = self.pregrade([(fingerprint, q) for fingerprint, (_, q) in distinct.items()])
+        graded = dict(locally_graded)
+
+        groups = {}
+        for fingerprint, (idx, q) in distinct.items():
+            if fingerprint in graded:
+                continue
+            cached = await self.cache_get(self.cache_key("batch", fingerprint))
+            if cached is not None:
+                graded[fingerprint] = cached
+            else:
+                groups.setdefault(idx, {})[fingerprint] = q["studentAnswer"]
+
+        if locally_graded:
+            # Per question, the prompts the locally decided answers would otherwise have shared
+            before = {}
+            for fingerprint, (idx, q) in distinct.items():
+                if fingerprint in locally_graded or fingerprint in groups.get(idx, {}):
+                    before.setdefault(idx, []).append(q["studentAnswer"])
+            self.count_prompts_saved(
+                [[(n, {"studentAnswer": answer}) for n, answer in enumerate(answers)] for answers in before.values()],
+                [[(n, {"studentAnswer": answer}) for n, answer in enumerate(group.values())] for group in groups.values()]
+            )
+        ungraded = sum(len(group) for group in groups.values())
+        logger.info(f"Bulk evaluation of {len(attempts)} attempts: {len(graded)} answers decided locally or cached, "
+                    f"{ungraded} distinct answers across {len(groups)} questions to grade")
+
+        group_results = await asyncio.gather(*[
+            self.evaluate_question_group(idx, questions[idx - 1], group) for idx, group in groups.items()
+        ])
+        for group_graded in group_results:
+            for fingerprint, ev in group_graded.items():
+                graded[fingerprint] = ev
+                await self.cache_set(self.cache_key("batch", fingerprint), ev)
+
+        return [
+            {idx: {"questionNumber": idx, **graded[fingerprint]}
+             for idx, fingerprint in attempt_fingerprints.items() if fingerprint in graded}
+            for attempt_fingerprints in fingerprints
+        ]
+
+    async def evaluate_question_group(self, question_num: int, question: dict, answers: Dict[str, str]) -> Dict[str, dict]:
+        """
+        Grade many students' answers to one question, in prompts chunked by the
+        token budget and run concurrently. `answers` maps answer fingerprint to
+        answer text. Answers missing from a reply are re-asked up to
+        `batch_max_reasks` times. Returns {fingerprint: evaluation}.
+        """
+        question_text = question.get('text', '')
+        marks = question.get('marks', 0)
+        expected = question.get('expectedAnswer', '')
+        header = f"""You are an expert examiner grading many students' answers to the same question.
+
+Question (Max {marks} marks):
+{question_text}
+"""
+        if expected:
+            header += f"Expected Answer: {expected}\n"
+        header += """
+Grade each student answer independently of the others. Evaluate fairly and constructively and award partial marks where appropriate.
+
+Student Answers:
+"""
+        numbered = list(enumerate(answers.items(), 1))
+        budget = max(1, self.batch_token_budget - estimate_tokens(header))
+        chunks = chunk_by_token_budget([(n, {"studentAnswer": answer}) for n, (_, answer) in numbered], budget)
+        fingerprint_of = {n: fingerprint for n, (fingerprint, _) in numbered}
+
+        async def grade_chunk(chunk: List[Tuple[int, dict]]) -> Dict[str, dict]:
+            evaluations = {}
+            pending = chunk
+            for attempt in range(self.batch_max_reasks + 1):
+                prompt = header
+                for n, item in pending:
+                    prompt += f"\nAnswer {n}:\n{item['studentAnswer']}\n"
+                prompt += """
+Provide your evaluation in the following JSON format:
+{
+  "evaluations": [
+    {
+      "answerNumber": 1,
+      "marksAwarded": <marks>,
+      "feedback": "<feedback>"
+    },
+    ...
+  ]
+}
+"""
+                try:
+                    response_text = (await self.generate(prompt)).strip()
+                    json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+                    if not json_match:
+                        raise ValueError("No JSON object in response")
+                    entries = json.loads(json_match.group()).get('evaluations') or []
+                except GeminiError as e:
+                    # These answers go to the caller's fallback; the other chunks keep their results
+                    logger.error(f"Question {question_num} answers {[n for n, _ in pending]} failed: {str(e)}")
+                    break
+                except ValueError as e:
+                    logger.warning(f"Question {question_num} answers {[n for n, _ in pending]} unparseable on attempt {attempt + 1}: {str(e)}")
+                    entries = []
+                expected_numbers = {n for n, _ in pending}
+                for entry in entries:
+                    try:
+                        n = int(entry.get('answerNumber'))
+                    except (TypeError, ValueError):
+                        continue
+                    if n in expected_numbers and fingerprint_of[n] not in evaluations:
+                        evaluations[fingerprint_of[n]] = {
+                            "marksAwarded": entry.get('marksAwarded', 0),
+                            "maxMarks": marks,
+                            "feedback": entry.get('feedback', 'Evaluated')
+                        }
+                pending = [(n, item) for n, item in pending if fingerprint_of[n] not in evaluations]
+                if not pending:
+                    break
+            return evaluations
+
+        graded = {}
+        for chunk_graded in await asyncio.gather(*[grade_chunk(chunk) for chunk in chunks]):
+            graded.update(chunk_graded)
+        return graded
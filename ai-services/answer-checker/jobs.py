@@ -0,0 +1,235 @@
+import asyncio
+import json
+import logging
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ("queued", "running", "succeeded", "failed")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+"""
+
+
+class JobStore:
+    """
+    SQLite-backed job table. One connection shared behind a lock; callers on
+    the event loop go through asyncio.to_thread.
+    """
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+
+    def _row_to_job(self, row: sqlite3.Row) -> dict:
+        return {
+            "jobId": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "payload": json.loads(row["payload"]),
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "attempts": row["attempts"],
+            "createdAt": row["created_at"],
+            "updatedAt": row["updated_at"]
+        }
+
+    def create(self, job_id: str, kind: str, payload: dict) -> dict:
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, kind, status, payload, created_at, updated_at) VALUES (?, ?, 'queued', ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), now, now)
+            )
+            self._db.commit()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def mark_running(self, job_id: str):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (time.time(), job_id)
+            )
+            self._db.commit()
+
+    def mark_finished(self, job_id: str, result: Optional[dict] = None, error: Optional[str] = None):
+        status = "failed" if error is not None else "succeeded"
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id)
+            )
+            self._db.commit()
+
+    def unfinished(self) -> List[dict]:
+        """Jobs that were queued or running when the service last stopped, oldest first."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def purge(self, older_than: float) -> List[str]:
+        """Delete finished jobs last updated before `older_than`; returns their ids."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id FROM jobs WHERE status IN ('succeeded', 'failed') AND updated_at < ?",
+                (older_than,)
+            ).fetchall()
+            job_ids = [row["id"] for row in rows]
+            self._db.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in job_ids])
+            self._db.commit()
+        return job_ids
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        counts = {status: 0 for status in JOB_STATUSES}
+        counts.update({row["status"]: row["n"] for row in rows})
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+JobHandler = Callable[[dict], Awaitable[dict]]
+
+
+class JobManager:
+    """
+    Runs persisted jobs on a fixed number of asyncio workers.
+
+    Uploaded files are written under `data_dir/<job id>/` before the job is
+    queued, so a restarted service can pick up queued and interrupted jobs
+    from the store. A job interrupted `max_attempts` times is marked failed.
+    """
+
+    def __init__(self, store: JobStore, handlers: Dict[str, JobHandler], data_dir: str,
+                 workers: int = 2, max_attempts: int = 3, retention_seconds: int = 24 * 3600):
+        self.store = store
+        self.handlers = handlers
+        self.data_dir = Path(data_dir)
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retention_seconds = retention_seconds
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._last_purge = 0.0
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        await self.purge()
+        for job in await asyncio.to_thread(self.store.unfinished):
+            if job["attempts"] >= self.max_attempts:
+                logger.warning(f"Job {job['jobId']} interrupted {job['attempts']} times, marking failed")
+                await self._finish(job["jobId"], error="Job was interrupted too many times")
+                continue
+            self._queue.put_nowait(job["jobId"])
+        if self._queue.qsize():
+            logger.info(f"Recovered {self._queue.qsize()} unfinished jobs")
+        self._tasks = [asyncio.create_task(self._worker(n)) for n in range(self.workers)]
+        logger.info(f"Job manager started with {self.workers} workers")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, kind: str, payload: dict, files: Optional[Dict[str, bytes]] = None) -> dict:
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = uuid.uuid4().hex
+        if files:
+            payload = {**payload, "files": await asyncio.to_thread(self._write_files, job_id, files)}
+        job = await asyncio.to_thread(self.store.create, job_id, kind, payload)
+        self._queue.put_nowait(job_id)
+        logger.info(f"Queued {kind} job {job_id} ({self._queue.qsize()} waiting)")
+        return job
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    def _write_files(self, job_id: str, files: Dict[str, bytes]) -> Dict[str, str]:
+        job_dir = self.data_dir / job_id
+        job_dir.mkdir(parents=True, exist_ok=True)
+        paths = {}
+        for name, data in files.items():
+            path = job_dir / name
+            path.write_bytes(data)
+            paths[name] = str(path)
+        return paths
+
+    async def _finish(self, job_id: str, result: Optional[dict] = None, error: Optional[str] = None):
+        await asyncio.to_thread(self.store.mark_finished, job_id, result, error)
+        await asyncio.to_thread(shutil.rmtree, self.data_dir / job_id, True)
+
+    async def _worker(self, worker_id: int):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                job = await asyncio.to_thread(self.store.get, job_id)
+                if job is None or job["status"] not in ("queued", "running"):
+                    continue
+                await asyncio.to_thread(self.store.mark_running, job_id)
+                logger.info(f"Worker {worker_id} running {job['kind']} job {job_id}")
+                started = time.perf_counter()
+                try:
+                    result = await self.handlers[job["kind"]](job["payload"])
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Job {job_id} failed: {str(e)}")
+                    await self._finish(job_id, error=str(e))
+                else:
+                    await self._finish(job_id, result=result)
+                    logger.info(f"Job {job_id} finished in {time.perf_counter() - started:.2f}s")
+                if time.time() - self._last_purge > 3600:
+                    await self.purge()
+            finally:
+                self._queue.task_done()
+
+    async def purge(self):
+        self._last_purge = time.time()
+        purged = await asyncio.to_thread(self.store.purge, self._last_purge - self.retention_seconds)
+        for job_id in purged:
+            await asyncio.to_thread(shutil.rmtree, self.data_dir / job_id, True)
+        if purged:
+            logger.info(f"Purged {len(purged)} finished jobs")
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue else 0,
+            **self.store.counts()
+        }
@@ -1,24 +1,41 @@
 from fastapi import FastAPI, File, UploadFile, Form, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-import google.generativeai as genai
-from PIL import Image, ImageEnhance, ImageFilter
-import pytesseract
-import PyPDF2
+from starlette.background import BackgroundTask
+from PIL import Image
+import asyncio
+import functools
+import hashlib
 import io
 import os
 import logging
-from pdf2image import convert_from_bytes
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-import uuid
+import tempfile
+import time
+import zipfile
+from pathlib import Path
 import json
-import re
-from typing import List
+import sys
+from typing import AsyncIterator, Callable, List, Optional, Set, Tuple
 from dotenv import load_dotenv
 
+# Modules shared between the AI services (ai-services/shared; copied next to main.py in the image),
+# added to the path first because the local modules import them too
+sys.path.append(str(Path(__file__).resolve().parent.parent / "shared"))
+from admission import AdmissionController, AdmissionMiddleware, AdmissionRejected, content_length  # noqa: E402
+from gemini_client import GeminiClient  # noqa: E402
+from metrics import CONTENT_TYPE, Registry, admission_families, gemini_client_families, instrument_app  # noqa: E402
+from cache import DiskLRUCache, RequestDeduplicator, TTLCache, content_key  # noqa: E402
+from grading import GradingEngine, GRADING_MODES, question_fingerprint  # noqa: E402
+from jobs import JOB_STATUSES, JobManager, JobStore  # noqa: E402
+from ocr import OCREngine, OCR_MODES, count_pdf_pages, has_text_layer, read_text_layer_words, read_text_layers  # noqa: E402
+from ocr_backends import OCR_BACKENDS  # noqa: E402
+from pipeline import Pipeline, Stage  # noqa: E402
+from pregrader import pregrade  # noqa: E402
+from preprocessing import PREPROCESSORS, THRESHOLD_METHODS  # noqa: E402
+from reports import ReportStore, purge_files  # noqa: E402
+from segmentation import SEGMENTATION_MODES, UNCLEAR_ANSWER, segment_by_layout, split_answers  # noqa: E402
+
 # Load environment variables
 load_dotenv()
 
@@ -28,6 +45,17 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
+# Prometheus metrics served on /metrics: per-stage latency histograms here, queue depths,
+# cache hit rates and Gemini counters read from their owners at scrape time (see the end of the file)
+metrics_registry = Registry("answer_checker_")
+STAGE_SECONDS = metrics_registry.histogram(
+    "stage_duration_seconds", "Time spent in each pipeline stage", ("stage",))
+OCR_PSM_SECONDS = metrics_registry.histogram(
+    "ocr_psm_duration_seconds", "Time spent in Tesseract per page segmentation mode", ("psm",))
+SEGMENTATION_TOTAL = metrics_registry.counter(
+    "segmentations", "Documents split into answers, by method (layout anchors or regex fallback)", ("method",))
+http_in_flight = instrument_app(app, metrics_registry)
+
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 logger.info("Static files mounted at /static from directory: static")
@@ -41,251 +69,413 @@ if not GEMINI_API_KEY:
     logger.error("GEMINI_API_KEY not set. Please set it in .env file.")
     raise RuntimeError("GEMINI_API_KEY environment variable is required")
 
+# Maximum number of Gemini requests in flight across all requests
+GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", 8))
+# Shared client limits: requests/tokens per minute (token bucket), retries with jittered
+# backoff on transient errors, and a circuit breaker that fails fast while Gemini is down
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-pro")
+# Alternative API endpoint reached over REST, e.g. the local mock in ai-services/benchmarks
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT") or None
+GEMINI_RPM = int(os.getenv("GEMINI_RPM") or 60)
+GEMINI_TPM = int(os.getenv("GEMINI_TPM") or 1000000)
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES") or 3)
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS") or 60)
+GEMINI_BREAKER_THRESHOLD = int(os.getenv("GEMINI_BREAKER_THRESHOLD") or 5)
+GEMINI_BREAKER_RESET_SECONDS = float(os.getenv("GEMINI_BREAKER_RESET_SECONDS") or 30)
+
 try:
-    genai.configure(api_key=GEMINI_API_KEY)
-    model = genai.GenerativeModel('gemini-pro')
+    gemini = GeminiClient(
+        GEMINI_MODEL,
+        api_key=GEMINI_API_KEY,
+        api_endpoint=GEMINI_API_ENDPOINT,
+        requests_per_minute=GEMINI_RPM,
+        tokens_per_minute=GEMINI_TPM,
+        max_retries=GEMINI_MAX_RETRIES,
+        timeout=GEMINI_TIMEOUT_SECONDS,
+        failure_threshold=GEMINI_BREAKER_THRESHOLD,
+        reset_timeout=GEMINI_BREAKER_RESET_SECONDS,
+        latency_observer=lambda seconds: STAGE_SECONDS.observe(seconds, stage="gemini")
+    )
     logger.info("Gemini API initialized successfully")
 except Exception as e:
     logger.error(f"Failed to initialize Gemini API: {str(e)}")
     raise
 
-# Text extraction functions
-async def preprocess_image(image: Image.Image) -> Image.Image:
-    try:
-        img = image.convert("L")
-        enhancer = ImageEnhance.Contrast(img)
-        img = enhancer.enhance(3.0)
-        img = img.point(lambda x: 255 if x > 130 else 0, "1")
-        img = img.filter(ImageFilter.MedianFilter(size=5))
-        img = img.filter(ImageFilter.UnsharpMask(radius=2, percent=150, threshold=3))
-        logger.info("Image preprocessed successfully")
-        return img
-    except Exception as e:
-        logger.error(f"Image preprocessing failed: {str(e)}")
-        return image
+# Gemini response cache keyed by prompt template version + normalised question/answer text
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS") or 7 * 24 * 3600)
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES") or 10000)
+LLM_CACHE_DISK = os.getenv("LLM_CACHE_DISK", "true").lower() == "true"
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", "cache/llm")
+LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB") or 64)
+llm_cache = None
+if LLM_CACHE_ENABLED:
+    llm_cache = TTLCache(
+        LLM_CACHE_TTL_SECONDS,
+        LLM_CACHE_MAX_ENTRIES,
+        disk=DiskLRUCache(LLM_CACHE_DIR, LLM_CACHE_MAX_MB * 1024 * 1024) if LLM_CACHE_DISK else None
+    )
+
+# /check-answers splits attempts into prompts of at most BATCH_TOKEN_BUDGET estimated tokens,
+# graded in parallel; a chunk whose reply is truncated or unparseable is re-asked BATCH_MAX_REASKS times
+BATCH_TOKEN_BUDGET = int(os.getenv("BATCH_TOKEN_BUDGET") or 6000)
+BATCH_MAX_REASKS = int(os.getenv("BATCH_MAX_REASKS") or 1)
+
+# Local pre-grader for /check-answers: blank, exact, numeric, MCQ and same-key-terms answers are
+# decided without Gemini; only ambiguous answers reach the LLM. PREGRADE_NUMERIC_TOLERANCE is an
+# absolute tolerance for decimals (default: half a unit in the expected answer's last decimal place)
+PREGRADE_ENABLED = os.getenv("PREGRADE_ENABLED", "true").lower() == "true"
+PREGRADE_THRESHOLDS = {
+    "reject_similarity": float(os.getenv("PREGRADE_REJECT_SIMILARITY") or 0.0),
+    "numeric_tolerance": float(os.getenv("PREGRADE_NUMERIC_TOLERANCE")) if os.getenv("PREGRADE_NUMERIC_TOLERANCE") else None,
+}
 
-async def extract_text_from_image(image: Image.Image) -> str:
+# /check-answers results keyed by attemptId + payload hash: backend retries replay the stored
+# result and concurrent duplicates share one in-flight grading
+IDEMPOTENCY_ENABLED = os.getenv("IDEMPOTENCY_ENABLED", "true").lower() == "true"
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS") or 24 * 3600)
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES") or 5000)
+IDEMPOTENCY_DIR = os.getenv("IDEMPOTENCY_DIR", "cache/idempotency")
+IDEMPOTENCY_MAX_MB = int(os.getenv("IDEMPOTENCY_MAX_MB") or 32)
+# Last evaluation of each attempt keyed by per-question fingerprint, so an edited question
+# regrades on its own instead of the whole attempt
+ATTEMPT_RESULTS_TTL_SECONDS = int(os.getenv("ATTEMPT_RESULTS_TTL_SECONDS") or 30 * 24 * 3600)
+ATTEMPT_RESULTS_MAX_ENTRIES = int(os.getenv("ATTEMPT_RESULTS_MAX_ENTRIES") or 5000)
+ATTEMPT_RESULTS_DIR = os.getenv("ATTEMPT_RESULTS_DIR", "cache/attempts")
+ATTEMPT_RESULTS_MAX_MB = int(os.getenv("ATTEMPT_RESULTS_MAX_MB") or 64)
+attempt_results = TTLCache(
+    ATTEMPT_RESULTS_TTL_SECONDS,
+    ATTEMPT_RESULTS_MAX_ENTRIES,
+    disk=DiskLRUCache(ATTEMPT_RESULTS_DIR, ATTEMPT_RESULTS_MAX_MB * 1024 * 1024) if ATTEMPT_RESULTS_MAX_MB > 0 else None
+)
+
+attempt_dedup = None
+if IDEMPOTENCY_ENABLED:
+    attempt_dedup = RequestDeduplicator(TTLCache(
+        IDEMPOTENCY_TTL_SECONDS,
+        IDEMPOTENCY_MAX_ENTRIES,
+        disk=DiskLRUCache(IDEMPOTENCY_DIR, IDEMPOTENCY_MAX_MB * 1024 * 1024) if IDEMPOTENCY_MAX_MB > 0 else None
+    ))
+
+# Default sheet grading mode: 'per_question' (enhance + check per answer) or 'fused' (one prompt per sheet)
+GRADING_MODE = os.getenv("GRADING_MODE", "per_question")
+if GRADING_MODE not in GRADING_MODES:
+    logger.warning(f"Unknown GRADING_MODE '{GRADING_MODE}', using per_question")
+    GRADING_MODE = "per_question"
+
+# OCR runs in a process pool sized to the cores; extra page jobs queue up to OCR_MAX_QUEUE
+OCR_WORKERS = int(os.getenv("OCR_WORKERS") or 0) or os.cpu_count() or 1
+OCR_MAX_QUEUE = int(os.getenv("OCR_MAX_QUEUE") or OCR_WORKERS * 2)
+# OCR_MODE: 'cascade' (PSM 6/4/7 until text is found) or 'confidence' (single pass, retry below OCR_MIN_CONFIDENCE)
+OCR_MODE = os.getenv("OCR_MODE", "cascade")
+if OCR_MODE not in OCR_MODES:
+    logger.warning(f"Unknown OCR_MODE '{OCR_MODE}', using cascade")
+    OCR_MODE = "cascade"
+OCR_MIN_CONFIDENCE = float(os.getenv("OCR_MIN_CONFIDENCE", 60))
+# OCR_BACKEND: 'auto' (warm tesserocr engine per worker when installed), 'tesserocr' or 'pytesseract'
+OCR_BACKEND = os.getenv("OCR_BACKEND", "auto")
+if OCR_BACKEND not in OCR_BACKENDS:
+    logger.warning(f"Unknown OCR_BACKEND '{OCR_BACKEND}', using auto")
+    OCR_BACKEND = "auto"
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+# PREPROCESS_ENGINE: 'pil' (original PIL chain) or 'numpy' (vectorised); requests may override it
+PREPROCESS_ENGINE = os.getenv("PREPROCESS_ENGINE", "pil")
+if PREPROCESS_ENGINE not in PREPROCESSORS:
+    logger.warning(f"Unknown PREPROCESS_ENGINE '{PREPROCESS_ENGINE}', using pil")
+    PREPROCESS_ENGINE = "pil"
+PREPROCESS_OPTIONS = {
+    "threshold": os.getenv("PREPROCESS_THRESHOLD", "otsu"),
+    "deskew": os.getenv("PREPROCESS_DESKEW", "false").lower() == "true",
+    "max_pixels": int(os.getenv("PREPROCESS_MAX_PIXELS", 34_000_000))
+}
+if PREPROCESS_OPTIONS["threshold"] not in THRESHOLD_METHODS:
+    logger.warning(f"Unknown PREPROCESS_THRESHOLD '{PREPROCESS_OPTIONS['threshold']}', using otsu")
+    PREPROCESS_OPTIONS["threshold"] = "otsu"
+# SEGMENTATION_MODE: 'regex' (default) splits the extracted text; 'layout' cuts answers at question
+# numbers found in the left margin of the OCR / text-layer word boxes, falling back to regex splitting.
+# Layout is opt-in because cascade OCR then reads pages with image_to_data, whose rebuilt lines can
+# differ from image_to_string's text. Anchors must start within LAYOUT_ANCHOR_MARGIN of the page's
+# text width from its left edge, and at least LAYOUT_MIN_ANCHOR_RATIO of the questions need one
+# before the layout split is used
+SEGMENTATION_MODE = os.getenv("SEGMENTATION_MODE", "regex")
+if SEGMENTATION_MODE not in SEGMENTATION_MODES:
+    logger.warning(f"Unknown SEGMENTATION_MODE '{SEGMENTATION_MODE}', using regex")
+    SEGMENTATION_MODE = "regex"
+LAYOUT_ANCHOR_MARGIN = float(os.getenv("LAYOUT_ANCHOR_MARGIN") or 0.12)
+LAYOUT_MIN_ANCHOR_RATIO = float(os.getenv("LAYOUT_MIN_ANCHOR_RATIO") or 0.5)
+# Content-addressed OCR result cache on local disk with LRU eviction past OCR_CACHE_MAX_MB
+OCR_CACHE_ENABLED = os.getenv("OCR_CACHE_ENABLED", "true").lower() == "true"
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", "cache/ocr")
+OCR_CACHE_MAX_MB = int(os.getenv("OCR_CACHE_MAX_MB", 256))
+ocr_cache = DiskLRUCache(OCR_CACHE_DIR, OCR_CACHE_MAX_MB * 1024 * 1024) if OCR_CACHE_ENABLED else None
+
+def observe_ocr_stage(stage: str, psm: Optional[int], seconds: float):
+    if stage == "ocr":
+        OCR_PSM_SECONDS.observe(seconds, psm=psm if psm is not None else "backend")
+    STAGE_SECONDS.observe(seconds, stage=stage)
+
+ocr_engine = OCREngine(
+    max_workers=OCR_WORKERS,
+    max_queue=OCR_MAX_QUEUE,
+    mode=OCR_MODE,
+    min_confidence=OCR_MIN_CONFIDENCE,
+    backend=OCR_BACKEND,
+    lang=OCR_LANG,
+    preprocessor=PREPROCESS_ENGINE,
+    preprocess_options=PREPROCESS_OPTIONS,
+    cache=ocr_cache,
+    stage_observer=observe_ocr_stage,
+    word_boxes=SEGMENTATION_MODE == "layout"
+)
+
+grader = GradingEngine(
+    gemini,
+    concurrency=GEMINI_CONCURRENCY,
+    cache=llm_cache,
+    batch_token_budget=BATCH_TOKEN_BUDGET,
+    batch_max_reasks=BATCH_MAX_REASKS,
+    ocr_min_confidence=OCR_MIN_CONFIDENCE,
+    pregrader=functools.partial(pregrade, thresholds=PREGRADE_THRESHOLDS) if PREGRADE_ENABLED else None
+)
+logger.info(f"Grading engine ready with Gemini concurrency limit {GEMINI_CONCURRENCY}")
+
+# Scanned PDFs are rasterised page by page: at most RASTER_WINDOW pages per request are
+# rendered at once, within OCR_MEMORY_LIMIT_MB, at an adaptive DPI between the bounds below
+OCR_MAX_DPI = int(os.getenv("OCR_MAX_DPI", 600))
+OCR_MIN_DPI = int(os.getenv("OCR_MIN_DPI", 200))
+OCR_MEMORY_LIMIT_MB = int(os.getenv("OCR_MEMORY_LIMIT_MB", 512))
+RASTER_WINDOW = int(os.getenv("RASTER_WINDOW", 2))
+# Pages whose text layer has fewer alphanumeric characters than this are OCR'd
+MIN_TEXT_LAYER_CHARS = int(os.getenv("MIN_TEXT_LAYER_CHARS", 20))
+
+# Admission control per endpoint class ('ocr': /check-answer, /check-answer-sheets(/stream); 'bulk':
+# /check-answer-sheets/bulk; 'llm': /check-answers(/bulk)). Each admits ADMISSION_<CLASS>_MAX_IN_FLIGHT
+# requests and, together, _MAX_PAGES pages / _MAX_MB of uploads at once; the rest wait up to
+# _MAX_WAIT_SECONDS in a queue of _MAX_QUEUE, then get 429 + Retry-After (413 if one request exceeds a
+# budget, checked on Content-Length before the body is parsed). Endpoints take their ticket before they
+# read an upload into memory. Background jobs are not admission-controlled: they already queue durably
+ocr_admission = AdmissionController.from_env("ocr", max_in_flight=OCR_WORKERS, max_queue=OCR_WORKERS * 2,
+                                             max_wait=10, max_pages=200, max_mb=256)
+bulk_admission = AdmissionController.from_env("bulk", max_in_flight=2, max_queue=2, max_wait=5, max_mb=1024)
+llm_admission = AdmissionController.from_env("llm", max_in_flight=GEMINI_CONCURRENCY * 4,
+                                             max_queue=GEMINI_CONCURRENCY * 8, max_wait=10, max_mb=32)
+ADMISSION_CONTROLLERS = (ocr_admission, bulk_admission, llm_admission)
+app.add_middleware(AdmissionMiddleware, hold=False, routes={
+    "/check-answer": ocr_admission,
+    "/check-answer-sheets": ocr_admission,
+    "/check-answer-sheets/stream": ocr_admission,
+    "/check-answer-sheets/bulk": bulk_admission,
+    "/check-answers": llm_admission,
+    "/check-answers/bulk": llm_admission,
+})
+
+def admission_error(e: AdmissionRejected) -> JSONResponse:
+    return JSONResponse(status_code=e.status_code, content={"error": str(e), "retryAfter": e.retry_after}, headers=e.headers)
+
+async def upload_pages(filename: str, upload: UploadFile) -> int:
+    """Pages of an upload, counted from its spooled file before the body is read into memory."""
+    return await asyncio.to_thread(count_pdf_pages, upload.file) if filename.endswith('.pdf') else 1
+
+def upload_bytes(*uploads: UploadFile) -> int:
+    return sum(upload.size or 0 for upload in uploads)
+
+@app.on_event("shutdown")
+def shutdown_ocr_engine():
+    ocr_engine.shutdown()
+
+# Text extraction functions. Documents carry the text, OCR confidence and the word boxes
+# ((page, left, top, right, bottom, text)) used for layout-aware segmentation
+async def extract_image_document(image: Image.Image, preprocessing: Optional[str] = None) -> dict:
+    """Returns {"text", "confidence", "words"}: the OCR text and mean word confidence (None outside confidence mode)."""
     try:
-        processed_image = await preprocess_image(image)
-        psm_configs = [
-            r'--oem 3 --psm 6',
-            r'--oem 3 --psm 4',
-            r'--oem 3 --psm 7'
-        ]
-        text = ""
-        for config in psm_configs:
-            text = pytesseract.image_to_string(processed_image, config=config)
-            if text.strip() and not text.startswith("Error"):
-                logger.info(f"Text extracted with {config}: {text[:100]}...")
-                return text
-        logger.warning("No clear text extracted with default PSMs, using last attempt")
-        return text if text.strip() else "No text detected with Tesseract"
+        result = await ocr_engine.ocr(image, preprocessing)
+        words = [(1, *box) for box in result.get('words') or []]
+        if result['text'].strip():
+            return {"text": result['text'], "confidence": result['confidence'], "words": words}
+        logger.warning("No clear text extracted with default PSMs")
+        return {"text": "No text detected with Tesseract", "confidence": result['confidence'], "words": []}
     except Exception as e:
         logger.error(f"Tesseract extraction failed: {str(e)}")
-        return f"Error during Tesseract extraction: {str(e)}"
-
-async def extract_text_from_pdf(pdf_file: UploadFile) -> str:
-    try:
-        pdf_reader = PyPDF2.PdfReader(pdf_file.file)
-        text = ""
-        for page in pdf_reader.pages:
-            page_text = page.extract_text()
-            text += page_text or ""
-        pdf_file.file.seek(0)
-        if text.strip():
-            logger.info("PDF text extracted successfully via PyPDF2")
-            return text
-
-        logger.info("No text extracted via PyPDF2, attempting OCR with pdf2image")
-        pdf_bytes = await pdf_file.read()
-        images = convert_from_bytes(pdf_bytes, dpi=600)
-        if not images:
-            return "No images extracted from PDF"
-        text = ""
-        for img in images:
-            processed_img = await preprocess_image(img)
-            psm_configs = [
-                r'--oem 3 --psm 6',
-                r'--oem 3 --psm 4',
-                r'--oem 3 --psm 7'
-            ]
-            page_text = ""
-            for config in psm_configs:
-                page_text = pytesseract.image_to_string(processed_img, config=config)
-                if page_text.strip() and not page_text.startswith("Error"):
-                    text += page_text + "\n"
-                    break
-            if not page_text.strip():
-                text += "No text detected on this page\n"
-        return text if text.strip() else "No text detected in PDF via OCR"
-    except Exception as e:
-        logger.error(f"PDF text extraction failed: {str(e)}")
-        return f"Error during PDF text extraction: {str(e)}"
-
-async def enhance_extracted_text(raw_text: str) -> str:
-    try:
-        prompt = f"""
-        You are an expert in interpreting garbled or poorly extracted text from handwritten answer sheets using OCR. The following text was extracted and may contain errors or misreadings due to OCR limitations. Your task is to correct and enhance it into a coherent answer based on common knowledge or context. If the text is unintelligible, provide a best guess or mark it as unclear.
-
-        Extracted Text: {raw_text}
-
-        Respond with the enhanced text only. If no meaningful enhancement is possible, return 'Unclear answer'.
-        """
-        response = model.generate_content(prompt)
-        enhanced_text = response.text.strip()
-        logger.info(f"Enhanced text from '{raw_text[:50]}...' to '{enhanced_text[:50]}...'")
-        return enhanced_text if enhanced_text else "Unclear answer"
-    except Exception as e:
-        logger.error(f"Failed to enhance text: {str(e)}")
-        return raw_text or "Unclear answer"
-
-async def check_answer_with_gemini(question_text: str, answer_text: str, question_num: int) -> dict:
-    try:
-        prompt = f"""
-        You are an expert answer checker for handwritten answer sheets. The following is the question and the enhanced extracted answer for Question {question_num}. Evaluate the answer's correctness.
-
-        Question: {question_text or 'No question provided'}
-        Enhanced Extracted Answer: {answer_text}
-
-        Respond in the following format:
-        Status: [Correct/Wrong/Unclear]
-        Feedback: [Brief explanation of why the answer is correct, incorrect, or unclear]
-
-        If you cannot determine correctness due to unclear text or lack of context, use:
-        Status: Unclear
-        Feedback: [Explanation of why evaluation was not possible]
-        """
-        response = model.generate_content(prompt)
-        logger.info(f"Gemini API response for Question {question_num}: {response.text[:100]}...")
-        return {"status": "", "feedback": response.text}
-    except Exception as e:
-        logger.error(f"Gemini API failed for Question {question_num}: {str(e)}")
-        return {"status": "Error", "feedback": f"Error during answer checking: {str(e)}"}
+        return {"text": f"Error during Tesseract extraction: {str(e)}", "confidence": None, "words": []}
 
-def split_answers(extracted_text: str, num_questions: int, delimiter: str = None) -> List[str]:
+async def extract_pdf_document(pdf_bytes: bytes, preprocessing: Optional[str] = None) -> dict:
+    """
+    Returns {"text", "confidence", "words"}: the document text, mean OCR confidence
+    over OCR'd pages (None if unavailable) and, in layout segmentation mode, word boxes
+    from the OCR'd pages and the text layers of the rest.
+    """
     try:
-        cleaned_text = extracted_text.strip()
-        cleaned_text = re.sub(r'[lI|]', '1', cleaned_text)
-        cleaned_text = re.sub(r'[oO]', '0', cleaned_text)
-        cleaned_text = re.sub(r'[sS]', '5', cleaned_text)
-        cleaned_text = re.sub(r'[\s\n]+', '\n', cleaned_text)
-        cleaned_text = re.sub(r'[^\w\s\d\.\)\(\n:]+', '', cleaned_text)
+        with STAGE_SECONDS.time(stage="text_layer"):
+            pages = await asyncio.to_thread(read_text_layers, pdf_bytes)
+        if not pages:
+            return {"text": "No images extracted from PDF", "confidence": None, "words": []}
+
+        # Only pages without a usable text layer are rasterised and OCR'd
+        ocr_page_sizes = {
+            page_number: (width_in, height_in)
+            for page_number, (page_text, width_in, height_in) in enumerate(pages, 1)
+            if not has_text_layer(page_text, MIN_TEXT_LAYER_CHARS)
+        }
+        logger.info(f"PDF has {len(pages)} pages, {len(pages) - len(ocr_page_sizes)} with a text layer, {len(ocr_page_sizes)} need OCR")
+
+        layer_words = {}
+        layer_pages = [n for n in range(1, len(pages) + 1) if n not in ocr_page_sizes]
+        if SEGMENTATION_MODE == "layout" and layer_pages:
+            with STAGE_SECONDS.time(stage="text_layer"):
+                layer_words = await asyncio.to_thread(read_text_layer_words, pdf_bytes, layer_pages)
+
+        ocr_results = {}
+        if ocr_page_sizes:
+            document_hash = hashlib.sha256(pdf_bytes).hexdigest()
+            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temp_pdf:
+                temp_pdf.write(pdf_bytes)
+            del pdf_bytes
+            try:
+                ocr_results = await ocr_engine.ocr_pdf(
+                    temp_pdf.name,
+                    ocr_page_sizes,
+                    max_dpi=OCR_MAX_DPI,
+                    min_dpi=OCR_MIN_DPI,
+                    memory_limit_bytes=OCR_MEMORY_LIMIT_MB * 1024 * 1024,
+                    window=RASTER_WINDOW,
+                    preprocessor=preprocessing,
+                    document_hash=document_hash
+                )
+            finally:
+                os.remove(temp_pdf.name)
 
-        logger.debug(f"Cleaned text: {cleaned_text}")
+        text = ""
+        words = []
+        for page_number, (page_text, _, _) in enumerate(pages, 1):
+            if page_number in ocr_results:
+                ocr_text = ocr_results[page_number]['text']
+                page_text = ocr_text if ocr_text.strip() else "No text detected on this page"
+                page_words = ocr_results[page_number].get('words') or []
+            else:
+                page_words = layer_words.get(page_number, [])
+            text += page_text + "\n"
+            words.extend((page_number, *box) for box in page_words)
 
-        pattern = delimiter if delimiter else r'(?i)(?:\d+\.\s*|\d+\)\s*|q\d+\s*|Question\s*\d+\s*|\d+\s*[:]\s*|Answer\s*:)'
-        try:
-            segments = re.split(pattern, cleaned_text)
-            answers = []
-            current_answer = []
-            for segment in segments:
-                segment = segment.strip()
-                if segment and not re.match(pattern, segment):
-                    current_answer.append(segment)
-                elif current_answer:
-                    answers.append(" ".join(current_answer).strip())
-                    current_answer = []
-            if current_answer:
-                answers.append(" ".join(current_answer).strip())
-            answers = [a for a in answers if a]
-        except re.error:
-            logger.warning(f"Invalid delimiter pattern: {delimiter}. Falling back to default.")
-            pattern = r'(?i)(?:\d+\.\s*|\d+\)\s*|q\d+\s*|Question\s*\d+\s*|\d+\s*[:]\s*|Answer\s*:)'
-            segments = re.split(pattern, cleaned_text)
-            answers = []
-            current_answer = []
-            for segment in segments:
-                segment = segment.strip()
-                if segment and not re.match(pattern, segment):
-                    current_answer.append(segment)
-                elif current_answer:
-                    answers.append(" ".join(current_answer).strip())
-                    current_answer = []
-            if current_answer:
-                answers.append(" ".join(current_answer).strip())
-            answers = [a for a in answers if a]
-
-        if len(answers) >= num_questions:
-            logger.info(f"Split by question markers: {len(answers)} answers found")
-            return answers[:num_questions]
-
-        logger.info("Falling back to line-based splitting")
-        lines = [line.strip() for line in cleaned_text.split('\n') if line.strip()]
-        answers = []
-        if lines:
-            lines_per_answer = max(1, (len(lines) + num_questions - 1) // num_questions)
-            for i in range(0, len(lines), lines_per_answer):
-                chunk = " ".join(lines[i:i + lines_per_answer]).strip()
-                if chunk:
-                    answers.append(chunk)
-            if len(answers) >= num_questions:
-                logger.info(f"Split by lines: {len(answers)} answers found")
-                return answers[:num_questions]
-
-        logger.info("Falling back to word-count-based splitting")
-        words = cleaned_text.split()
-        if words:
-            words_per_answer = max(1, (len(words) + num_questions - 1) // num_questions)
-            answers = []
-            for i in range(0, len(words), words_per_answer):
-                chunk = " ".join(words[i:i + words_per_answer]).strip()
-                answers.append(chunk)
-
-        while len(answers) < num_questions:
-            answers.append("Unclear answer")
-
-        logger.info(f"Final split: {len(answers)} answers: {[a[:50] + '...' for a in answers]}")
-        return answers[:num_questions]
+        confidences = [result['confidence'] for result in ocr_results.values() if result['confidence'] is not None]
+        confidence = sum(confidences) / len(confidences) if confidences else None
+        return {"text": text if text.strip() else "No text detected in PDF", "confidence": confidence, "words": words}
     except Exception as e:
-        logger.error(f"Answer splitting failed: {str(e)}")
-        return [extracted_text.strip() if extracted_text.strip() else "Unclear answer"] * num_questions
-
-def generate_pdf(results: list, total_marks: str) -> str:
+        logger.error(f"PDF text extraction failed: {str(e)}")
+        return {"text": f"Error during PDF text extraction: {str(e)}", "confidence": None, "words": []}
+
+@STAGE_SECONDS.time(stage="split_answers")
+def segment_answers(document: dict, num_questions: int) -> List[str]:
+    """Split an extracted document into answers: by layout when its word boxes have enough question anchors, else by regex."""
+    if SEGMENTATION_MODE == "layout" and document.get("words"):
+        answers = segment_by_layout(document["words"], num_questions, LAYOUT_ANCHOR_MARGIN, LAYOUT_MIN_ANCHOR_RATIO)
+        if answers is not None:
+            SEGMENTATION_TOTAL.inc(method="layout")
+            return answers
+    SEGMENTATION_TOTAL.inc(method="regex")
+    return split_answers(document["text"], num_questions)
+
+# Result reports: rendered in REPORT_WORKERS processes and stored under REPORT_DIR by content hash, so
+# identical results share one file. Reports not served for REPORT_TTL_HOURS are deleted and past
+# REPORT_MAX_MB the least recently served go first, except those saved or served in the last
+# REPORT_GRACE_SECONDS; the janitor runs every REPORT_CLEANUP_SECONDS
+REPORT_DIR = os.getenv("REPORT_DIR", "cache/reports")
+REPORT_MAX_MB = int(os.getenv("REPORT_MAX_MB") or 256)
+REPORT_TTL_HOURS = float(os.getenv("REPORT_TTL_HOURS") or 7 * 24)
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS") or 1)
+REPORT_CLEANUP_SECONDS = float(os.getenv("REPORT_CLEANUP_SECONDS") or 600)
+REPORT_GRACE_SECONDS = float(os.getenv("REPORT_GRACE_SECONDS") or 300)
+report_store = ReportStore(
+    REPORT_DIR,
+    REPORT_MAX_MB * 1024 * 1024,
+    int(REPORT_TTL_HOURS * 3600),
+    workers=REPORT_WORKERS,
+    cleanup_interval=REPORT_CLEANUP_SECONDS,
+    grace_seconds=REPORT_GRACE_SECONDS,
+    render_observer=lambda seconds: STAGE_SECONDS.observe(seconds, stage="pdf_build")
+)
+
+@app.on_event("startup")
+async def start_report_janitor():
+    report_store.start()
+    # Reports used to be written to static/result_<uuid>.pdf and never deleted; expire those too
+    removed = await asyncio.to_thread(purge_files, Path("static").glob("result_*.pdf"),
+                                      time.time() - REPORT_TTL_HOURS * 3600)
+    if removed:
+        logger.info(f"Removed {removed} expired legacy reports from static/")
+
+@app.on_event("shutdown")
+async def stop_report_janitor():
+    await report_store.stop()
+
+async def generate_pdf(results: list, total_marks: str) -> str:
     try:
-        filename = f"result_{uuid.uuid4()}.pdf"
-        filepath = os.path.join("static", filename)
-        doc = SimpleDocTemplate(filepath, pagesize=letter)
-        styles = getSampleStyleSheet()
-        story = []
-
-        story.append(Paragraph("Handwritten Answer Checker Result", styles['Title']))
-        story.append(Spacer(1, 12))
-
-        for i, result in enumerate(results, 1):
-            story.append(Paragraph(f"Question {i}", styles['Heading2']))
-            if 'questionText' in result and result['questionText']:
-                story.append(Paragraph("Question Text:", styles['Heading3']))
-                story.append(Paragraph(result['questionText'].replace("\n", "<br/>"), styles['Normal']))
-            story.append(Paragraph("Extracted Answer:", styles['Heading3']))
-            story.append(Paragraph(result['extractedText'].replace("\n", "<br/>"), styles['Normal']))
-            story.append(Paragraph("Feedback:", styles['Heading3']))
-            story.append(Paragraph(result['feedback'].replace("\n", "<br/>"), styles['Normal']))
-            story.append(Paragraph("Marks Awarded:", styles['Heading3']))
-            story.append(Paragraph(result['marks'], styles['Normal']))
-            story.append(Spacer(1, 12))
-
-        story.append(Paragraph("Total Marks:", styles['Heading2']))
-        story.append(Paragraph(total_marks, styles['Normal']))
-
-        doc.build(story)
-        logger.info(f"PDF generated successfully: {filename}")
-        return filename
+        return await report_store.save(results, total_marks)
     except Exception as e:
         logger.error(f"PDF generation failed: {str(e)}")
         raise
 
+def wants_pdf(request: Request) -> bool:
+    return "application/pdf" in request.headers.get("accept", "")
+
+async def report_response(filename: str, total_marks: Optional[str] = None,
+                          results: Optional[list] = None) -> Response:
+    """
+    Stream a stored report from disk; content-addressed, so clients may cache it for good.
+    A report deleted since it was saved is rendered again when its `results` are at hand.
+    """
+    path = await report_store.open(filename)
+    if path is None and results is not None:
+        logger.info(f"Report {filename} is gone; rendering it again")
+        path = await report_store.open(await generate_pdf(results, total_marks))
+    if path is None:
+        return JSONResponse(status_code=404, content={"error": "Report not found or expired"})
+    headers = {"Cache-Control": "public, max-age=31536000, immutable"}
+    if total_marks is not None:
+        headers["X-Total-Marks"] = total_marks
+    return FileResponse(path, media_type="application/pdf", filename=filename,
+                        content_disposition_type="inline", headers=headers)
+
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
     logger.info("Serving root page")
     return templates.TemplateResponse("index.html", {"request": request})
 
+@app.get("/cache/stats")
+async def cache_stats():
+    return JSONResponse(content={
+        "ocr": ocr_cache.stats() if ocr_cache else None,
+        "llm": llm_cache.stats() if llm_cache else None,
+        "idempotency": attempt_dedup.stats() if attempt_dedup else None,
+        "attempts": attempt_results.stats(),
+        "reports": report_store.stats(),
+        "pregrader": grader.pregrade_stats if grader.pregrader else None
+    })
+
+@app.get("/reports/{filename}")
+async def get_report(filename: str):
+    return await report_response(filename)
+
+@app.get("/gemini/stats")
+async def gemini_stats():
+    return JSONResponse(content=gemini.metrics())
+
 @app.post("/check-answer")
 async def check_answer(
+    request: Request,
     file: UploadFile = File(...),
-    marks: str = Form(...)
+    marks: str = Form(...),
+    grading_mode: str = Form(None),
+    preprocessing: str = Form(None)
 ):
     logger.info(f"Received file: {file.filename}, marks: {marks}")
+    ticket = None
     try:
+        grading_mode = grading_mode or GRADING_MODE
+        if grading_mode not in GRADING_MODES:
+            return JSONResponse(status_code=400, content={"error": f"Invalid grading mode. Use one of: {', '.join(GRADING_MODES)}"})
+        if preprocessing and preprocessing not in PREPROCESSORS:
+            return JSONResponse(status_code=400, content={"error": f"Invalid preprocessing. Use one of: {', '.join(PREPROCESSORS)}"})
+
         try:
             marks_list = json.loads(marks)
             if not isinstance(marks_list, list) or not all(isinstance(m, int) and m > 0 for m in marks_list):
@@ -295,14 +485,18 @@ async def check_answer(
             logger.error("Invalid marks format")
             return JSONResponse(status_code=400, content={"error": "Invalid marks format"})
 
+        ticket = await ocr_admission.acquire(await upload_pages(file.filename, file), upload_bytes(file))
+        data = await file.read()
+
         extracted_text = ""
         if file.filename.endswith('.pdf'):
             logger.info("Processing PDF file")
-            extracted_text = await extract_text_from_pdf(file)
+            document = await extract_pdf_document(data, preprocessing)
         else:
             logger.info("Processing image file")
-            image = Image.open(file.file)
-            extracted_text = await extract_text_from_image(image)
+            image = Image.open(io.BytesIO(data))
+            document = await extract_image_document(image, preprocessing)
+        extracted_text, ocr_confidence = document["text"], document["confidence"]
 
         if extracted_text.startswith("Error") or not extracted_text.strip():
             logger.error(f"Text extraction error or empty: {extracted_text}")
@@ -311,152 +505,499 @@ async def check_answer(
         logger.info(f"Extracted text (first 100 chars): {extracted_text[:100]}...")
         logger.debug(f"Full extracted text: {extracted_text}")
 
-        answers = split_answers(extracted_text, num_questions)
+        answers = segment_answers(document, num_questions)
         if not answers or len(answers) < num_questions:
             logger.warning(f"Insufficient answers extracted: {len(answers)} found, {num_questions} expected")
-            answers = answers + ["Unclear answer"] * (num_questions - len(answers))
+            answers = answers + [UNCLEAR_ANSWER] * (num_questions - len(answers))
 
-        # Enhance every answer with Gemini
-        enhanced_answers = []
-        for answer in answers:
-            enhanced_answer = await enhance_extracted_text(answer)
-            enhanced_answers.append(enhanced_answer)
-            logger.info(f"Original: '{answer[:50]}...' -> Enhanced: '{enhanced_answer[:50]}...'")
-
-        results = []
-        total_awarded = 0
-        for i, (enhanced_answer, question_marks) in enumerate(zip(enhanced_answers, marks_list), 1):
-            result = await check_answer_with_gemini("", enhanced_answer, i)
-            feedback_lower = result['feedback'].lower()
-            status = "Unclear"
-            marks_awarded = 0
-
-            if "status: correct" in feedback_lower:
-                status = "Correct"
-                marks_awarded = question_marks  # Full marks
-                total_awarded += marks_awarded
-            elif "status: wrong" in feedback_lower:
-                status = "Wrong"
-                marks_awarded = 0  # Zero marks
-            elif "status: unclear" in feedback_lower:
-                status = "Unclear"
-                marks_awarded = question_marks // 2  # Half marks, rounded down
-                total_awarded += marks_awarded
-
-            result_item = {
-                "extractedText": enhanced_answer,
-                "feedback": result['feedback'],
-                "marks": f"{marks_awarded}/{question_marks}",
-                "status": status
-            }
-            results.append(result_item)
-            logger.info(f"Question {i}: Status: {status}, Marks: {marks_awarded}/{question_marks}")
+        # Enhance and grade every answer with Gemini
+        results, total_awarded = await grader.grade(answers, marks_list, mode=grading_mode, ocr_confidence=ocr_confidence)
+        enhanced_answers = [result['extractedText'] for result in results]
 
         total_marks = f"{total_awarded}/{sum(marks_list)}"
 
-        pdf_filename = generate_pdf(results, total_marks)
+        pdf_filename = await generate_pdf(results, total_marks)
+        if wants_pdf(request):
+            return await report_response(pdf_filename, total_marks, results)
 
         return JSONResponse(content={
             "results": results,
             "totalMarks": total_marks,
             "pdfFilename": pdf_filename,
+            "reportUrl": f"/reports/{pdf_filename}",
             "splitAnswers": answers,
-            "enhancedAnswers": enhanced_answers
+            "enhancedAnswers": enhanced_answers,
+            "ocrConfidence": ocr_confidence
         })
+    except AdmissionRejected as e:
+        return admission_error(e)
     except Exception as e:
         logger.error(f"General error in check-answer: {str(e)}")
         return JSONResponse(status_code=500, content={"error": f"An error occurred: {str(e)}", "traceback": str(e)})
+    finally:
+        if ticket:
+            ticket.release()
+
+class GradingInputError(ValueError):
+    """Bad or unreadable submission; reported as HTTP 400 / a failed job."""
+
+def parse_marks(marks: str) -> List[int]:
+    marks_list = json.loads(marks) if marks else [1] * 10
+    if not isinstance(marks_list, list) or not all(isinstance(m, int) and m > 0 for m in marks_list):
+        raise ValueError("Marks must be a list of positive integers")
+    return marks_list
+
+def validate_options(grading_mode: Optional[str], preprocessing: Optional[str]) -> str:
+    grading_mode = grading_mode or GRADING_MODE
+    if grading_mode not in GRADING_MODES:
+        raise GradingInputError(f"Invalid grading mode. Use one of: {', '.join(GRADING_MODES)}")
+    if preprocessing and preprocessing not in PREPROCESSORS:
+        raise GradingInputError(f"Invalid preprocessing. Use one of: {', '.join(PREPROCESSORS)}")
+    return grading_mode
+
+async def extract_sheet_items(question_pdf: bytes, answer_pdf: bytes, marks_list: List[int],
+                              preprocessing: Optional[str] = None) -> Tuple[List[str], List[str], List[int], Optional[float]]:
+    """OCR both sheets and split them into aligned (questions, answers, marks) lists plus the answer OCR confidence."""
+    num_questions = len(marks_list)
+
+    question_document = await extract_pdf_document(question_pdf, preprocessing)
+    answer_document = await extract_pdf_document(answer_pdf, preprocessing)
+    require_text(question_document, "question")
+    require_text(answer_document, "answer")
+
+    questions = segment_answers(question_document, num_questions)
+    answers = segment_answers(answer_document, num_questions)
+    return (*align_sheet_items(questions, answers, marks_list), answer_document["confidence"])
+
+def require_text(document: dict, kind: str) -> str:
+    """The document's text; GradingInputError when extraction failed or found nothing."""
+    text = document["text"]
+    if text.startswith("Error") or not text.strip():
+        logger.error(f"{kind.capitalize()} text extraction error or empty: {text}")
+        raise GradingInputError(text or f"No {kind} text extracted")
+    logger.info(f"{kind.capitalize()} text (first 100 chars): {text[:100]}...")
+    logger.debug(f"Full {kind} text: {text}")
+    return text
+
+def align_sheet_items(questions: List[str], answers: List[str],
+                      marks_list: List[int]) -> Tuple[List[str], List[str], List[int]]:
+    min_count = min(len(questions), len(answers), len(marks_list))
+    if len(questions) != len(answers):
+        logger.warning(f"Mismatch: {len(questions)} questions, {len(answers)} answers. Using minimum count: {min_count}")
+    return questions[:min_count], answers[:min_count], marks_list[:min_count]
+
+async def grade_sheet_items(questions: List[str], answers: List[str], marks_list: List[int],
+                            ocr_confidence: Optional[float], grading_mode: str) -> dict:
+    # Enhance and grade every answer with Gemini
+    results, total_awarded = await grader.grade(answers, marks_list, questions, mode=grading_mode, ocr_confidence=ocr_confidence)
+    enhanced_answers = [result['extractedText'] for result in results]
+
+    total_marks = f"{total_awarded}/{sum(marks_list)}"
+
+    pdf_filename = await generate_pdf(results, total_marks)
+
+    return {
+        "results": results,
+        "totalMarks": total_marks,
+        "pdfFilename": pdf_filename,
+        "reportUrl": f"/reports/{pdf_filename}",
+        "splitQuestions": questions,
+        "splitAnswers": answers,
+        "enhancedAnswers": enhanced_answers,
+        "ocrConfidence": ocr_confidence
+    }
+
+async def grade_answer_sheets(question_pdf: bytes, answer_pdf: bytes, marks_list: List[int],
+                              grading_mode: str, preprocessing: Optional[str] = None) -> dict:
+    questions, answers, marks_list, ocr_confidence = await extract_sheet_items(question_pdf, answer_pdf, marks_list, preprocessing)
+    return await grade_sheet_items(questions, answers, marks_list, ocr_confidence, grading_mode)
+
+async def stream_answer_sheets(question_pdf: bytes, answer_pdf: bytes, marks_list: List[int],
+                               grading_mode: str, preprocessing: Optional[str] = None) -> AsyncIterator[dict]:
+    """
+    Events for the streaming endpoint: 'started' once the sheets are split,
+    one 'result' per question as soon as it is graded, then 'summary' with
+    the total and report link. Failures end the stream with an 'error' event.
+    """
+    try:
+        questions, answers, marks_list, ocr_confidence = await extract_sheet_items(question_pdf, answer_pdf, marks_list, preprocessing)
+        yield {
+            "event": "started",
+            "questionCount": len(answers),
+            "splitQuestions": questions,
+            "splitAnswers": answers,
+            "ocrConfidence": ocr_confidence
+        }
+
+        results = [None] * len(answers)
+        total_awarded = 0
+        async for question_num, result_item, marks_awarded in grader.grade_iter(
+                answers, marks_list, questions, mode=grading_mode, ocr_confidence=ocr_confidence):
+            results[question_num - 1] = result_item
+            total_awarded += marks_awarded
+            yield {
+                "event": "result",
+                "questionNumber": question_num,
+                "splitAnswer": answers[question_num - 1],
+                **result_item
+            }
+
+        total_marks = f"{total_awarded}/{sum(marks_list)}"
+        pdf_filename = await generate_pdf(results, total_marks)
+        yield {
+            "event": "summary",
+            "totalMarks": total_marks,
+            "pdfFilename": pdf_filename,
+            "reportUrl": f"/reports/{pdf_filename}" if pdf_filename else None,
+            "enhancedAnswers": [result['extractedText'] for result in results]
+        }
+    except Exception as e:
+        logger.error(f"Streaming check-answer-sheets failed: {str(e)}")
+        yield {"event": "error", "error": str(e)}
+
+def format_ndjson(event: dict) -> str:
+    return json.dumps(event) + "\n"
+
+def format_sse(event: dict) -> str:
+    return f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+@app.post("/check-answer-sheets/stream")
+async def check_answer_sheets_stream(
+    request: Request,
+    question_file: UploadFile = File(...),
+    answer_file: UploadFile = File(...),
+    marks: str = Form(...),
+    grading_mode: str = Form(None),
+    preprocessing: str = Form(None)
+):
+    """
+    Streaming variant of /check-answer-sheets. Responds with NDJSON (one event
+    per line) by default, or Server-Sent Events when the client sends
+    'Accept: text/event-stream'.
+    """
+    logger.info(f"Streaming check for question file: {question_file.filename}, answer file: {answer_file.filename}, marks: {marks}")
+    try:
+        grading_mode = validate_options(grading_mode, preprocessing)
+        marks_list = parse_marks(marks)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    try:
+        ticket = await ocr_admission.acquire(await upload_pages(".pdf", question_file) + await upload_pages(".pdf", answer_file),
+                                             upload_bytes(question_file, answer_file))
+    except AdmissionRejected as e:
+        return admission_error(e)
+    try:
+        question_pdf = await question_file.read()
+        answer_pdf = await answer_file.read()
+    except BaseException:
+        ticket.release()
+        raise
+    if "text/event-stream" in request.headers.get("accept", ""):
+        media_type, formatter = "text/event-stream", format_sse
+    else:
+        media_type, formatter = "application/x-ndjson", format_ndjson
+
+    async def body():
+        try:
+            async for event in stream_answer_sheets(question_pdf, answer_pdf, marks_list, grading_mode, preprocessing):
+                yield formatter(event)
+        finally:
+            ticket.release()
+
+    # X-Accel-Buffering stops nginx from holding events back until the response ends; the background
+    # release also covers clients that disconnect before the body starts
+    return StreamingResponse(body(), media_type=media_type, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+                             background=BackgroundTask(ticket.release))
 
 @app.post("/check-answer-sheets")
 async def check_answer_sheets(
+    request: Request,
     question_file: UploadFile = File(...),
     answer_file: UploadFile = File(...),
-    marks: str = Form(...)
+    marks: str = Form(...),
+    grading_mode: str = Form(None),
+    preprocessing: str = Form(None)
 ):
     logger.info(f"Received question file: {question_file.filename}, answer file: {answer_file.filename}, marks: {marks}")
+    ticket = None
     try:
-        marks_list = json.loads(marks) if marks else [1] * 10
-        if not isinstance(marks_list, list) or not all(isinstance(m, int) and m > 0 for m in marks_list):
-            raise ValueError("Marks must be a list of positive integers")
-        num_questions = len(marks_list)
-
-        question_text = await extract_text_from_pdf(question_file)
-        answer_text = await extract_text_from_pdf(answer_file)
-
-        if question_text.startswith("Error") or not question_text.strip():
-            logger.error(f"Question text extraction error or empty: {question_text}")
-            return JSONResponse(status_code=400, content={"error": question_text or "No question text extracted"})
-        if answer_text.startswith("Error") or not answer_text.strip():
-            logger.error(f"Answer text extraction error or empty: {answer_text}")
-            return JSONResponse(status_code=400, content={"error": answer_text or "No answer text extracted"})
-
-        logger.info(f"Question text (first 100 chars): {question_text[:100]}...")
-        logger.debug(f"Full question text: {question_text}")
-        logger.info(f"Answer text (first 100 chars): {answer_text[:100]}...")
-        logger.debug(f"Full answer text: {answer_text}")
-
-        questions = split_answers(question_text, num_questions)
-        answers = split_answers(answer_text, num_questions)
-
-        min_count = min(len(questions), len(answers), num_questions)
-        questions = questions[:min_count]
-        answers = answers[:min_count]
-        marks_list = marks_list[:min_count]
-        if len(questions) != len(answers):
-            logger.warning(f"Mismatch: {len(questions)} questions, {len(answers)} answers. Using minimum count: {min_count}")
-
-        # Enhance every answer with Gemini
-        enhanced_answers = []
-        for answer in answers:
-            enhanced_answer = await enhance_extracted_text(answer)
-            enhanced_answers.append(enhanced_answer)
-            logger.info(f"Original: '{answer[:50]}...' -> Enhanced: '{enhanced_answer[:50]}...'")
-
-        results = []
-        total_awarded = 0
-        for i, (question_text, enhanced_answer, question_marks) in enumerate(zip(questions, enhanced_answers, marks_list), 1):
-            result = await check_answer_with_gemini(question_text, enhanced_answer, i)
-            feedback_lower = result['feedback'].lower()
-            status = "Unclear"
-            marks_awarded = 0
-
-            if "status: correct" in feedback_lower:
-                status = "Correct"
-                marks_awarded = question_marks  # Full marks
-                total_awarded += marks_awarded
-            elif "status: wrong" in feedback_lower:
-                status = "Wrong"
-                marks_awarded = 0  # Zero marks
-            elif "status: unclear" in feedback_lower:
-                status = "Unclear"
-                marks_awarded = question_marks // 2  # Half marks, rounded down
-                total_awarded += marks_awarded
-
-            result_item = {
-                "questionText": question_text,
-                "extractedText": enhanced_answer,
-                "feedback": result['feedback'],
-                "marks": f"{marks_awarded}/{question_marks}",
-                "status": status
-            }
-            results.append(result_item)
-            logger.info(f"Question {i}: Status: {status}, Marks: {marks_awarded}/{question_marks}")
+        grading_mode = validate_options(grading_mode, preprocessing)
+        marks_list = parse_marks(marks)
+        ticket = await ocr_admission.acquire(await upload_pages(".pdf", question_file) + await upload_pages(".pdf", answer_file),
+                                             upload_bytes(question_file, answer_file))
+        question_pdf = await question_file.read()
+        answer_pdf = await answer_file.read()
+        result = await grade_answer_sheets(question_pdf, answer_pdf, marks_list, grading_mode, preprocessing)
+        if wants_pdf(request):
+            return await report_response(result["pdfFilename"], result["totalMarks"], result["results"])
+        return JSONResponse(content=result)
+    except GradingInputError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except AdmissionRejected as e:
+        return admission_error(e)
+    except Exception as e:
+        logger.error(f"General error in check-answer-sheets: {str(e)}")
+        return JSONResponse(status_code=500, content={"error": f"An error occurred: {str(e)}", "traceback": str(e)})
+    finally:
+        if ticket:
+            ticket.release()
+
+# Bulk answer sheet ingestion (POST /check-answer-sheets/bulk): the question paper is read once, then
+# every answer file goes through unpack -> extract (rasterise + OCR) -> split -> grade stages joined by
+# queues of BULK_SHEET_QUEUE files, so OCR of later sheets overlaps Gemini grading of earlier ones.
+# BULK_OCR_SHEETS sheets are extracted at once (their pages share the OCR pool) and BULK_GRADE_SHEETS
+# graded at once. Uploads may be ZIP archives; at most BULK_MAX_FILES sheets of BULK_MAX_FILE_MB each
+BULK_SHEET_QUEUE = int(os.getenv("BULK_SHEET_QUEUE") or 4)
+BULK_OCR_SHEETS = int(os.getenv("BULK_OCR_SHEETS") or 2)
+BULK_GRADE_SHEETS = int(os.getenv("BULK_GRADE_SHEETS") or 4)
+BULK_MAX_FILES = int(os.getenv("BULK_MAX_FILES") or 200)
+BULK_MAX_FILE_MB = int(os.getenv("BULK_MAX_FILE_MB") or 50)
+SHEET_EXTENSIONS = (".pdf", ".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".webp")
+# Bulk pipelines currently running; their per-stage busy workers and queue depths are exported on /metrics
+bulk_pipelines: Set[Pipeline] = set()
+
+def list_sheet_files(uploads: List[Tuple[str, bytes]]) -> List[Tuple[str, Callable[[], bytes]]]:
+    """
+    (name, reader) per answer sheet in the uploads, in upload order; ZIP archives are
+    expanded (folders kept in the name) without decompressing anything yet.
+    """
+    sheets = []
+    for filename, data in uploads:
+        if filename.lower().endswith(".zip") or zipfile.is_zipfile(io.BytesIO(data)):
+            try:
+                archive = zipfile.ZipFile(io.BytesIO(data))
+            except zipfile.BadZipFile:
+                raise GradingInputError(f"{filename}: not a valid ZIP archive")
+            for info in sorted(archive.infolist(), key=lambda info: info.filename):
+                name = info.filename
+                if info.is_dir() or name.startswith("__MACOSX/") or Path(name).name.startswith("."):
+                    continue
+                if not name.lower().endswith(SHEET_EXTENSIONS):
+                    logger.info(f"Skipping {filename}/{name}: not a PDF or image")
+                    continue
+                if info.file_size > BULK_MAX_FILE_MB * 1024 * 1024:
+                    raise GradingInputError(f"{filename}/{name} is larger than {BULK_MAX_FILE_MB} MB")
+                sheets.append((f"{filename}/{name}", functools.partial(archive.read, info)))
+        elif filename.lower().endswith(SHEET_EXTENSIONS):
+            if len(data) > BULK_MAX_FILE_MB * 1024 * 1024:
+                raise GradingInputError(f"{filename} is larger than {BULK_MAX_FILE_MB} MB")
+            sheets.append((filename, functools.partial(bytes, data)))
+        else:
+            raise GradingInputError(f"{filename}: expected a PDF, an image or a ZIP archive of them")
+        if len(sheets) > BULK_MAX_FILES:
+            raise GradingInputError(f"Too many answer sheets (limit {BULK_MAX_FILES})")
+    if not sheets:
+        raise GradingInputError("No answer sheets found in the upload")
+    return sheets
+
+async def stream_bulk_sheets(questions: List[str], marks_list: List[int], sheets: List[Tuple[str, Callable[[], bytes]]],
+                             grading_mode: str, preprocessing: Optional[str] = None) -> AsyncIterator[dict]:
+    """'started', then one 'sheet' per graded file or 'error' per failed one as they complete, then 'summary'."""
+    started = time.perf_counter()
+    num_questions = len(marks_list)
+
+    async def unpack(item: dict) -> dict:
+        return {**item, "data": await asyncio.to_thread(item["read"])}
+
+    async def extract(item: dict) -> dict:
+        if item["file"].lower().endswith(".pdf"):
+            document = await extract_pdf_document(item["data"], preprocessing)
+        else:
+            image = await asyncio.to_thread(Image.open, io.BytesIO(item["data"]))
+            document = await extract_image_document(image, preprocessing)
+        require_text(document, "answer")
+        return {"index": item["index"], "file": item["file"], "document": document}
+
+    async def split(item: dict) -> dict:
+        answers = segment_answers(item["document"], num_questions)
+        return {**item, "items": align_sheet_items(questions, answers, marks_list)}
+
+    async def grade(item: dict) -> dict:
+        sheet_questions, answers, sheet_marks = item["items"]
+        result = await grade_sheet_items(sheet_questions, answers, sheet_marks,
+                                         item["document"]["confidence"], grading_mode)
+        return {"index": item["index"], "file": item["file"], **result}
+
+    async def source():
+        for index, (name, read) in enumerate(sheets):
+            yield {"index": index, "file": name, "read": read}
+
+    # One unpack worker: a ZipFile must not be read from several threads at once
+    pipeline = Pipeline([
+        Stage("unpack", unpack),
+        Stage("extract", extract, BULK_OCR_SHEETS),
+        Stage("split", split),
+        Stage("grade", grade, BULK_GRADE_SHEETS)
+    ], queue_size=BULK_SHEET_QUEUE)
+    logger.info(f"Bulk checking {len(sheets)} answer sheets x {num_questions} questions")
+    yield {"event": "started", "fileCount": len(sheets), "questionCount": len(questions), "splitQuestions": questions}
+
+    graded = failed = 0
+    bulk_pipelines.add(pipeline)
+    try:
+        async for item, error in pipeline.run(source()):
+            if error:
+                failed += 1
+                yield {"event": "error", "index": item and item["index"], "file": item and item["file"], "error": str(error)}
+            else:
+                graded += 1
+                yield {"event": "sheet", **item}
+    finally:
+        bulk_pipelines.discard(pipeline)
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"Bulk sheet checking finished: {graded} sheets graded, {failed} failed in {elapsed:.1f}s")
+    yield {"event": "summary", "files": len(sheets), "graded": graded, "failed": failed, "seconds": round(elapsed, 2)}
+
+@app.post("/check-answer-sheets/bulk")
+async def check_answer_sheets_bulk(
+    request: Request,
+    question_file: UploadFile = File(...),
+    answer_files: List[UploadFile] = File(...),
+    marks: str = Form(...),
+    grading_mode: str = Form(None),
+    preprocessing: str = Form(None)
+):
+    """
+    Grade a whole class's answer sheets against one question paper. answer_files
+    takes several PDFs/images and/or ZIP archives of them. The question paper is
+    OCR'd and split once before the response starts (failures are a 400); results
+    then stream per file as NDJSON (or SSE with 'Accept: text/event-stream').
+    """
+    logger.info(f"Bulk check for question file: {question_file.filename}, {len(answer_files)} answer uploads, marks: {marks}")
+    ticket = None
+    try:
+        grading_mode = validate_options(grading_mode, preprocessing)
+        marks_list = parse_marks(marks)
+        ticket = await bulk_admission.acquire(nbytes=upload_bytes(question_file, *answer_files))
+        uploads = [(upload.filename or f"upload{n}", await upload.read()) for n, upload in enumerate(answer_files, 1)]
+        question_pdf = await question_file.read()
+        sheets = await asyncio.to_thread(list_sheet_files, uploads)
+        question_document = await extract_pdf_document(question_pdf, preprocessing)
+        require_text(question_document, "question")
+        questions = segment_answers(question_document, len(marks_list))
+    except Exception as e:
+        # The stream releases the ticket once it starts; failures before that release it here
+        if ticket:
+            ticket.release()
+        if isinstance(e, AdmissionRejected):
+            return admission_error(e)
+        if isinstance(e, ValueError):
+            return JSONResponse(status_code=400, content={"error": str(e)})
+        logger.error(f"General error in check-answer-sheets/bulk: {str(e)}")
+        return JSONResponse(status_code=500, content={"error": f"An error occurred: {str(e)}"})
+
+    if "text/event-stream" in request.headers.get("accept", ""):
+        media_type, formatter = "text/event-stream", format_sse
+    else:
+        media_type, formatter = "application/x-ndjson", format_ndjson
+
+    async def body():
+        try:
+            async for event in stream_bulk_sheets(questions, marks_list, sheets, grading_mode, preprocessing):
+                yield formatter(event)
+        finally:
+            ticket.release()
+
+    return StreamingResponse(body(), media_type=media_type, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+                             background=BackgroundTask(ticket.release))
+
+def score_attempt(questions: List[dict], evaluations: dict) -> Tuple[int, List[dict]]:
+    """Total score and per-question feedback from {question number: evaluation}, with the substring fallback for gaps."""
+    total_score = 0
+    processed_feedback = []
+    
+    for idx, q in enumerate(questions):
+        q_id = q.get('id', f'q{idx+1}')
+        q_marks = q.get('marks', 0)
+        
+        # Find evaluation for this question
+        eval_data = evaluations.get(idx + 1)
+        
+        if eval_data:
+            awarded = eval_data.get('marksAwarded', 0)
+            feedback = eval_data.get('feedback', 'Evaluated')
+        else:
+            # Fallback: simple comparison
+            student = q.get('studentAnswer', '').lower()
+            expected = q.get('expectedAnswer', '').lower()
+            
+            if not student or student == '':
+                awarded = 0
+                feedback = "No answer provided"
+            elif expected and expected in student:
+                awarded = q_marks
+                feedback = "Correct answer"
+            elif expected:
+                awarded = int(q_marks * 0.5)  # Partial credit
+                feedback = "Partially correct"
+            else:
+                awarded = int(q_marks * 0.7)  # No expected answer to compare
+                feedback = "Answer provided"
+        
+        total_score += awarded
+        processed_feedback.append({
+            "questionId": q_id,
+            "suggestedMarks": awarded,
+            "maxMarks": q_marks,
+            "feedback": feedback
+        })
+    return total_score, processed_feedback
 
-        total_marks = f"{total_awarded}/{sum(marks_list)}"
+async def evaluate_answer_batch(data: dict) -> dict:
+    questions = data.get('questions', [])
+    total_marks = data.get('totalMarks', 0)
+    attempt_id = data.get('attemptId', 'unknown')
 
-        pdf_filename = generate_pdf(results, total_marks)
+    logger.info(f"Batch checking {len(questions)} answers for attempt {attempt_id}")
 
-        return JSONResponse(content={
-            "results": results,
-            "totalMarks": total_marks,
-            "pdfFilename": pdf_filename,
-            "splitQuestions": questions,
-            "splitAnswers": answers,
-            "enhancedAnswers": enhanced_answers
+    if not questions:
+        raise GradingInputError("No questions provided")
+
+    # Per-question results of this attempt's previous evaluation, by fingerprint: only changed questions are regraded
+    attempt_key = content_key("attempt-evaluations", str(attempt_id)) if attempt_results and data.get('attemptId') else None
+    previous = await asyncio.to_thread(attempt_results.get, attempt_key) if attempt_key else None
+
+    eval_result = await grader.evaluate_answers(questions, total_marks, previous=previous)
+
+    if attempt_key:
+        fingerprints = eval_result['fingerprints']
+        await asyncio.to_thread(attempt_results.set, attempt_key, {
+            fingerprints[ev['questionNumber']]: {key: value for key, value in ev.items() if key != 'questionNumber'}
+            for ev in eval_result['questionEvaluations']
         })
-    except Exception as e:
-        logger.error(f"General error in check-answer-sheets: {str(e)}")
-        return JSONResponse(status_code=500, content={"error": f"An error occurred: {str(e)}", "traceback": str(e)})
+    if previous:
+        logger.info(f"Attempt {attempt_id}: regraded questions {eval_result['regraded']} of {len(questions)}")
+
+    evaluations = {ev.get('questionNumber'): ev for ev in eval_result.get('questionEvaluations') or []}
+    total_score, processed_feedback = score_attempt(questions, evaluations)
+
+    logger.info(f"AI evaluation complete: {total_score}/{total_marks}")
+
+    return {
+        "totalScore": total_score,
+        "maxMarks": total_marks,
+        "overallFeedback": eval_result.get('overallFeedback', 'Evaluation completed'),
+        "questionFeedback": processed_feedback,
+        "regradedQuestionIds": [questions[idx - 1].get('id', f'q{idx}') for idx in eval_result.get('regraded', [])],
+        "locallyGradedQuestionIds": [questions[idx - 1].get('id', f'q{idx}') for idx in eval_result.get('locallyGraded', [])]
+    }
+
+async def evaluate_answer_batch_once(data: dict) -> Tuple[dict, str]:
+    """
+    evaluate_answer_batch() behind the attempt deduplicator. Returns the result and
+    how it was served: 'fresh', 'stored' (repeat within the TTL), 'joined' (merged
+    into an identical request in flight) or 'bypass' (no attemptId / disabled).
+    """
+    attempt_id = data.get('attemptId')
+    if attempt_dedup is None or not attempt_id or not data.get('questions'):
+        return await evaluate_answer_batch(data), "bypass"
+    key = content_key("check-answers", str(attempt_id), data)
+    result, outcome = await attempt_dedup.run(key, lambda: evaluate_answer_batch(data))
+    if outcome != "fresh":
+        logger.info(f"Attempt {attempt_id}: served {outcome} result without regrading")
+    return result, outcome
 
 @app.post("/check-answers")
 async def check_answers_batch(request: Request):
@@ -466,136 +1007,381 @@ async def check_answers_batch(request: Request):
     Returns suggested scores and feedback
     """
     try:
-        data = await request.json()
-        questions = data.get('questions', [])
-        total_marks = data.get('totalMarks', 0)
-        attempt_id = data.get('attemptId', 'unknown')
-
-        logger.info(f"Batch checking {len(questions)} answers for attempt {attempt_id}")
-
-        if not questions:
-            return JSONResponse(status_code=400, content={
-                "error": "No questions provided"
-            })
-
-        # Build evaluation prompt
-        evaluation_prompt = f"""You are an expert examiner evaluating student answers.
-
-Total Marks: {total_marks}
-
-For each question, provide:
-1. Marks awarded (based on the maximum marks for that question)
-2. Brief feedback explaining the evaluation
-
-Evaluate fairly and constructively. Award partial marks where appropriate.
-
-Questions and Answers:
-"""
-
-        question_feedback = []
-        for idx, q in enumerate(questions, 1):
-            q_text = q.get('text', '')
-            q_marks = q.get('marks', 0)
-            expected = q.get('expectedAnswer', '')
-            student = q.get('studentAnswer', '')
-
-            evaluation_prompt += f"\n\nQuestion {idx} (Max {q_marks} marks):\n{q_text}\n"
-            if expected:
-                evaluation_prompt += f"Expected Answer: {expected}\n"
-            evaluation_prompt += f"Student Answer: {student}\n"
-
-        evaluation_prompt += """
-
-Provide your evaluation in the following JSON format:
-{
-  "questionEvaluations": [
-    {
-      "questionNumber": 1,
-      "marksAwarded": <marks>,
-      "maxMarks": <max_marks>,
-      "feedback": "<feedback>"
-    },
-    ...
-  ],
-  "overallFeedback": "<general comments about the student's performance>"
-}
-"""
+        async with llm_admission.admit(nbytes=content_length(request.scope)):
+            data = await request.json()
+            result, outcome = await evaluate_answer_batch_once(data)
+        return JSONResponse(content=result, headers={"X-Idempotency": outcome})
+
+    except GradingInputError as e:
+        return JSONResponse(status_code=400, content={
+            "error": str(e)
+        })
+    except AdmissionRejected as e:
+        return admission_error(e)
+    except Exception as e:
+        logger.error(f"Batch checking error: {str(e)}")
+        return JSONResponse(status_code=500, content={
+            "error": f"AI checking failed: {str(e)}"
+        })
 
-        # Call Gemini AI
-        model = genai.GenerativeModel("gemini-pro")
-        response = model.generate_content(evaluation_prompt)
-        response_text = response.text.strip()
+# Bulk grading: attempts are graded in cohorts of BULK_COHORT_SIZE, BULK_WORKERS cohorts at a time;
+# within a cohort every question's distinct answers share prompts, and attempts stream back per cohort
+BULK_COHORT_SIZE = int(os.getenv("BULK_COHORT_SIZE") or 25)
+BULK_WORKERS = int(os.getenv("BULK_WORKERS") or 2)
 
-        # Extract JSON from response
-        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-        if json_match:
-            eval_result = json.loads(json_match.group())
+def parse_bulk_request(data: dict) -> Tuple[List[dict], int, List[Tuple[str, bool, List[dict]]]]:
+    """
+    Validate a bulk request. Returns the shared questions, total marks and
+    (attemptId, whether the caller sent it, questions with that attempt's
+    studentAnswer) per attempt; attempts without an id are labelled attempt<n>.
+    Attempt answers are either {questionId: answer} or a list in question order.
+    """
+    if not isinstance(data, dict):
+        raise GradingInputError("Request body must be a JSON object")
+    questions = data.get('questions') or []
+    attempts = data.get('attempts') or []
+    if not questions:
+        raise GradingInputError("No questions provided")
+    if not attempts:
+        raise GradingInputError("No attempts provided")
+    if not all(isinstance(q, dict) for q in questions):
+        raise GradingInputError("Questions must be objects")
+    total_marks = data.get('totalMarks') or sum(q.get('marks', 0) for q in questions)
+
+    parsed = []
+    for n, attempt in enumerate(attempts, 1):
+        if not isinstance(attempt, dict):
+            raise GradingInputError(f"Attempt {n}: expected an object with attemptId and answers")
+        named = bool(attempt.get('attemptId'))
+        attempt_id = str(attempt['attemptId']) if named else f'attempt{n}'
+        answers = attempt.get('answers') or {}
+        if isinstance(answers, list):
+            student_answers = [str(answer or '') for answer in answers] + [''] * (len(questions) - len(answers))
+        elif isinstance(answers, dict):
+            student_answers = [str(answers.get(q.get('id', f'q{idx}')) or '') for idx, q in enumerate(questions, 1)]
         else:
-            logger.warning("Could not parse AI response as JSON, using fallback")
-            eval_result = {
-                "questionEvaluations": [],
-                "overallFeedback": "AI evaluation completed but format was unclear"
-            }
-
-        # Calculate total score
-        total_score = 0
-        processed_feedback = []
-        
-        for idx, q in enumerate(questions):
-            q_id = q.get('id', f'q{idx+1}')
-            q_marks = q.get('marks', 0)
-            
-            # Find evaluation for this question
-            eval_data = None
-            if eval_result.get('questionEvaluations'):
-                for ev in eval_result['questionEvaluations']:
-                    if ev.get('questionNumber') == idx + 1:
-                        eval_data = ev
-                        break
-            
-            if eval_data:
-                awarded = eval_data.get('marksAwarded', 0)
-                feedback = eval_data.get('feedback', 'Evaluated')
-            else:
-                # Fallback: simple comparison
-                student = q.get('studentAnswer', '').lower()
-                expected = q.get('expectedAnswer', '').lower()
-                
-                if not student or student == '':
-                    awarded = 0
-                    feedback = "No answer provided"
-                elif expected and expected in student:
-                    awarded = q_marks
-                    feedback = "Correct answer"
-                elif expected:
-                    awarded = int(q_marks * 0.5)  # Partial credit
-                    feedback = "Partially correct"
-                else:
-                    awarded = int(q_marks * 0.7)  # No expected answer to compare
-                    feedback = "Answer provided"
-            
-            total_score += awarded
-            processed_feedback.append({
-                "questionId": q_id,
-                "suggestedMarks": awarded,
-                "maxMarks": q_marks,
-                "feedback": feedback
+            raise GradingInputError(f"Attempt {attempt_id}: answers must be an object or a list")
+        parsed.append((attempt_id, named, [{**q, "studentAnswer": answer} for q, answer in zip(questions, student_answers)]))
+    return questions, total_marks, parsed
+
+def summarize_attempt(processed_feedback: List[dict], total_score: int, total_marks: int) -> str:
+    """Overall feedback for a bulk-graded attempt (no per-attempt prompt): where it earned and lost marks."""
+    full = [f['questionId'] for f in processed_feedback if f['maxMarks'] and f['suggestedMarks'] >= f['maxMarks']]
+    lost = [f"{f['questionId']} ({f['suggestedMarks']}/{f['maxMarks']}: {str(f['feedback']).rstrip('. ')})"
+            for f in processed_feedback if f['suggestedMarks'] < f['maxMarks']]
+    summary = f"Scored {total_score}/{total_marks}."
+    if full:
+        summary += f" Full marks on {', '.join(full)}."
+    if lost:
+        summary += f" Marks lost on {'; '.join(lost)}."
+    return summary
+
+async def grade_cohort(questions: List[dict], total_marks: int, cohort: List[Tuple[str, bool, List[dict]]]) -> List[dict]:
+    evaluations = await grader.evaluate_attempts(
+        questions, [[q['studentAnswer'] for q in attempt_questions] for _, _, attempt_questions in cohort]
+    )
+    results = []
+    for (attempt_id, named, attempt_questions), attempt_evaluations in zip(cohort, evaluations):
+        total_score, processed_feedback = score_attempt(attempt_questions, attempt_evaluations)
+        # Stored like /check-answers results so a later single-attempt regrade only re-asks edited questions;
+        # generated attempt<n> labels are not ids and would collide across exams
+        if attempt_results and named:
+            await asyncio.to_thread(attempt_results.set, content_key("attempt-evaluations", attempt_id), {
+                question_fingerprint(attempt_questions[idx - 1]): {key: value for key, value in ev.items() if key != 'questionNumber'}
+                for idx, ev in attempt_evaluations.items()
             })
-
-        logger.info(f"AI evaluation complete: {total_score}/{total_marks}")
-
-        return JSONResponse(content={
+        results.append({
+            "attemptId": attempt_id,
             "totalScore": total_score,
             "maxMarks": total_marks,
-            "overallFeedback": eval_result.get('overallFeedback', 'Evaluation completed'),
+            "overallFeedback": summarize_attempt(processed_feedback, total_score, total_marks),
             "questionFeedback": processed_feedback
         })
+    return results
+
+async def stream_bulk_evaluation(questions: List[dict], total_marks: int,
+                                 attempts: List[Tuple[str, bool, List[dict]]]) -> AsyncIterator[dict]:
+    """One 'attempt' event per graded attempt as its cohort finishes, 'error' per failed cohort, then 'summary'."""
+    started = time.perf_counter()
+    cohorts = [attempts[i:i + BULK_COHORT_SIZE] for i in range(0, len(attempts), BULK_COHORT_SIZE)]
+    slots = asyncio.Semaphore(BULK_WORKERS)
+    logger.info(f"Bulk checking {len(attempts)} attempts x {len(questions)} questions in {len(cohorts)} cohorts")
+
+    async def run(cohort: List[Tuple[str, bool, List[dict]]]):
+        async with slots:
+            try:
+                return cohort, await grade_cohort(questions, total_marks, cohort), None
+            except Exception as e:
+                logger.error(f"Bulk cohort failed: {str(e)}")
+                return cohort, [], str(e)
+
+    tasks = [asyncio.ensure_future(run(cohort)) for cohort in cohorts]
+    graded = failed = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            cohort, results, error = await next_done
+            if error:
+                failed += len(cohort)
+                yield {"event": "error", "attemptIds": [attempt_id for attempt_id, _, _ in cohort], "error": error}
+            for result in results:
+                graded += 1
+                yield {"event": "attempt", **result}
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"Bulk checking finished: {graded} attempts graded, {failed} failed in {elapsed:.1f}s")
+    yield {"event": "summary", "attempts": len(attempts), "graded": graded, "failed": failed, "seconds": round(elapsed, 2)}
+
+@app.post("/check-answers/bulk")
+async def check_answers_bulk(request: Request):
+    """
+    Grade many attempts of one exam in a single call. Body: shared
+    {questions: [{id, text, marks, expectedAnswer}], totalMarks} plus
+    attempts: [{attemptId, answers: {questionId: answer}}]. Results stream as
+    NDJSON (or SSE with 'Accept: text/event-stream'), one event per attempt.
+    """
+    try:
+        ticket = await llm_admission.acquire(nbytes=content_length(request.scope))
+    except AdmissionRejected as e:
+        return admission_error(e)
+    try:
+        questions, total_marks, attempts = parse_bulk_request(await request.json())
+    except (GradingInputError, ValueError) as e:
+        ticket.release()
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except BaseException:
+        ticket.release()
+        raise
 
+    if "text/event-stream" in request.headers.get("accept", ""):
+        media_type, formatter = "text/event-stream", format_sse
+    else:
+        media_type, formatter = "application/x-ndjson", format_ndjson
+
+    async def body():
+        try:
+            async for event in stream_bulk_evaluation(questions, total_marks, attempts):
+                yield formatter(event)
+        finally:
+            ticket.release()
+
+    return StreamingResponse(body(), media_type=media_type, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+                             background=BackgroundTask(ticket.release))
+
+# Asynchronous grading jobs: submit returns a job id at once, workers grade in the background
+# and results persist in SQLite so queued/interrupted jobs resume after a restart
+JOB_WORKERS = int(os.getenv("JOB_WORKERS") or 2)
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "cache/jobs/jobs.sqlite3")
+JOB_DATA_DIR = os.getenv("JOB_DATA_DIR", "cache/jobs/files")
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS") or 3)
+JOB_RETENTION_HOURS = int(os.getenv("JOB_RETENTION_HOURS") or 24)
+
+async def run_answer_sheets_job(payload: dict) -> dict:
+    files = payload["files"]
+    question_pdf = await asyncio.to_thread(Path(files["question.pdf"]).read_bytes)
+    answer_pdf = await asyncio.to_thread(Path(files["answer.pdf"]).read_bytes)
+    return await grade_answer_sheets(question_pdf, answer_pdf, payload["marks"],
+                                     payload["gradingMode"], payload.get("preprocessing"))
+
+async def run_check_answers_job(payload: dict) -> dict:
+    result, _ = await evaluate_answer_batch_once(payload["request"])
+    return result
+
+job_manager = JobManager(
+    JobStore(JOB_DB_PATH),
+    {"check-answer-sheets": run_answer_sheets_job, "check-answers": run_check_answers_job},
+    JOB_DATA_DIR,
+    workers=JOB_WORKERS,
+    max_attempts=JOB_MAX_ATTEMPTS,
+    retention_seconds=JOB_RETENTION_HOURS * 3600
+)
+
+@app.on_event("startup")
+async def start_job_manager():
+    await job_manager.start()
+
+@app.on_event("shutdown")
+async def stop_job_manager():
+    await job_manager.stop()
+    job_manager.store.close()
+
+def job_status(job: dict) -> dict:
+    return {
+        "jobId": job["jobId"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "error": job["error"],
+        "createdAt": job["createdAt"],
+        "updatedAt": job["updatedAt"],
+        "statusUrl": f"/jobs/{job['jobId']}",
+        "resultUrl": f"/jobs/{job['jobId']}/result"
+    }
+
+@app.post("/jobs/check-answer-sheets")
+async def submit_answer_sheets_job(
+    question_file: UploadFile = File(...),
+    answer_file: UploadFile = File(...),
+    marks: str = Form(...),
+    grading_mode: str = Form(None),
+    preprocessing: str = Form(None)
+):
+    try:
+        grading_mode = validate_options(grading_mode, preprocessing)
+        marks_list = parse_marks(marks)
+        job = await job_manager.submit(
+            "check-answer-sheets",
+            {"marks": marks_list, "gradingMode": grading_mode, "preprocessing": preprocessing},
+            files={"question.pdf": await question_file.read(), "answer.pdf": await answer_file.read()}
+        )
+        return JSONResponse(status_code=202, content=job_status(job))
+    except (GradingInputError, ValueError) as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
     except Exception as e:
-        logger.error(f"Batch checking error: {str(e)}")
-        return JSONResponse(status_code=500, content={
-            "error": f"AI checking failed: {str(e)}"
-        })
+        logger.error(f"Failed to queue answer sheet job: {str(e)}")
+        return JSONResponse(status_code=500, content={"error": f"An error occurred: {str(e)}"})
+
+@app.post("/jobs/check-answers")
+async def submit_check_answers_job(request: Request):
+    try:
+        data = await request.json()
+        if not data.get('questions'):
+            return JSONResponse(status_code=400, content={"error": "No questions provided"})
+        job = await job_manager.submit("check-answers", {"request": data})
+        return JSONResponse(status_code=202, content=job_status(job))
+    except Exception as e:
+        logger.error(f"Failed to queue batch checking job: {str(e)}")
+        return JSONResponse(status_code=500, content={"error": f"An error occurred: {str(e)}"})
+
+@app.get("/jobs/stats")
+async def jobs_stats():
+    return JSONResponse(content=await asyncio.to_thread(job_manager.stats))
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await job_manager.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Job not found"})
+    return JSONResponse(content=job_status(job))
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    job = await job_manager.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Job not found"})
+    if job["status"] == "succeeded":
+        return JSONResponse(content=job["result"])
+    if job["status"] == "failed":
+        return JSONResponse(status_code=500, content={"error": job["error"], "jobId": job_id})
+    # Not finished yet: poll again later
+    return JSONResponse(status_code=202, content=job_status(job), headers={"Retry-After": "2"})
+
+# /ready reports "saturated" (503) once a pool's (in flight + waiting) / capacity reaches these
+# ratios, so a load balancer can steer new work elsewhere; /health only reports liveness
+READY_MAX_OCR_SATURATION = float(os.getenv("READY_MAX_OCR_SATURATION") or 1.0)
+READY_MAX_GEMINI_SATURATION = float(os.getenv("READY_MAX_GEMINI_SATURATION") or 4.0)
+# Admission classes count as saturated once every slot and queue place is taken (new requests get 429)
+READY_MAX_ADMISSION_SATURATION = float(os.getenv("READY_MAX_ADMISSION_SATURATION") or 1.0)
+
+def pool_saturation() -> dict:
+    ocr_capacity = ocr_engine.max_workers + ocr_engine.max_queue
+    return {
+        "ocr": {
+            "inFlight": ocr_engine.in_flight,
+            "waiting": ocr_engine.waiting,
+            "capacity": ocr_capacity,
+            "saturation": round((ocr_engine.in_flight + ocr_engine.waiting) / ocr_capacity, 4)
+        },
+        "gemini": {
+            "inFlight": grader.in_flight,
+            "waiting": grader.waiting,
+            "capacity": grader.concurrency,
+            "saturation": round((grader.in_flight + grader.waiting) / grader.concurrency, 4)
+        }
+    }
+
+@metrics_registry.collector
+def collect_runtime_metrics():
+    pools = pool_saturation()
+    families = [
+        ("pool_in_flight", "gauge", "Work items running in a worker pool",
+         [({"pool": name}, pool["inFlight"]) for name, pool in pools.items()]),
+        ("pool_waiting", "gauge", "Work items queued for a worker pool slot",
+         [({"pool": name}, pool["waiting"]) for name, pool in pools.items()]),
+        ("pool_capacity", "gauge", "Slots in a worker pool",
+         [({"pool": name}, pool["capacity"]) for name, pool in pools.items()]),
+    ]
+    stages = {}
+    for pipeline in list(bulk_pipelines):
+        for name, stage in pipeline.stats().items():
+            totals = stages.setdefault(name, {"busy": 0, "queued": 0})
+            totals["busy"] += stage["busy"]
+            totals["queued"] += stage["queued"]
+    families.append(("bulk_stage_busy", "gauge", "Bulk sheet pipeline workers handling an item, by stage",
+                     [({"stage": name}, totals["busy"]) for name, totals in stages.items()]))
+    families.append(("bulk_stage_queued", "gauge", "Items waiting in front of a bulk sheet pipeline stage",
+                     [({"stage": name}, totals["queued"]) for name, totals in stages.items()]))
+    jobs = job_manager.stats()
+    families.append(("jobs_queued", "gauge", "Background jobs waiting for a job worker", [({}, jobs["queued"])]))
+    families.append(("jobs", "gauge", "Background jobs in the store by status",
+                     [({"status": status}, jobs[status]) for status in JOB_STATUSES]))
+
+    caches = {"llm": llm_cache, "ocr": ocr_cache, "attempts": attempt_results}
+    if attempt_dedup:
+        caches["idempotency"] = attempt_dedup
+    cache_stats = {name: cache.stats() for name, cache in caches.items() if cache is not None}
+    families.append(("cache_hits", "counter", "Cache lookups that found an entry",
+                     [({"cache": name}, stats["hits"]) for name, stats in cache_stats.items()]))
+    families.append(("cache_misses", "counter", "Cache lookups that found nothing",
+                     [({"cache": name}, stats["misses"]) for name, stats in cache_stats.items()]))
+    families.append(("cache_hit_ratio", "gauge", "Cache hits / lookups since start",
+                     [({"cache": name}, stats["hitRate"]) for name, stats in cache_stats.items()]))
+    reports = report_store.stats()
+    families.append(("reports_stored", "gauge", "Result report PDFs on disk", [({}, reports["reports"])]))
+    families.append(("reports_bytes", "gauge", "Disk space used by stored result reports", [({}, reports["bytes"])]))
+    families.append(("reports_rendered", "counter", "Result reports rendered rather than reused from the store",
+                     [({}, reports["renders"])]))
+    families.append(("reports_removed", "counter", "Stored result reports deleted by the janitor",
+                     [({"reason": "expired"}, reports["expired"]), ({"reason": "quota"}, reports["evictions"])]))
+    if grader.pregrader:
+        families.append(("pregrader_questions", "counter", "Questions seen by the local pre-grader",
+                         [({}, grader.pregrade_stats["questions"])]))
+        families.append(("pregrader_decided_locally", "counter", "Questions graded without Gemini",
+                         [({}, grader.pregrade_stats["decidedLocally"])]))
+    families.extend(admission_families(ADMISSION_CONTROLLERS))
+    families.extend(gemini_client_families(gemini))
+    return families
+
+@app.get("/metrics")
+async def metrics():
+    # Collectors read the job store (SQLite), so render off the event loop
+    return Response(content=await asyncio.to_thread(metrics_registry.render), media_type=CONTENT_TYPE)
+
+@app.get("/health")
+async def health():
+    return JSONResponse(content={"status": "ok"})
+
+@app.get("/ready")
+async def ready():
+    pools = pool_saturation()
+    saturated = [
+        name for name, limit in (("ocr", READY_MAX_OCR_SATURATION), ("gemini", READY_MAX_GEMINI_SATURATION))
+        if pools[name]["saturation"] >= limit
+    ]
+    admission = {controller.name: controller.stats() for controller in ADMISSION_CONTROLLERS}
+    saturated += [f"admission:{name}" for name, stats in admission.items() if stats["saturation"] >= READY_MAX_ADMISSION_SATURATION]
+    jobs = await asyncio.to_thread(job_manager.stats)
+    return JSONResponse(status_code=503 if saturated else 200, content={
+        "status": "saturated" if saturated else "ready",
+        "saturated": saturated,
+        "pools": pools,
+        "admission": admission,
+        "jobsQueued": jobs["queued"],
+        "geminiCircuit": gemini.breaker.state,
+        "httpInFlight": http_in_flight.value()
+    })
 
 if __name__ == "__main__":
     import uvicorn
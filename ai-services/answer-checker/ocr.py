@@ -0,0 +1,435 @@
+import asyncio
+import io
+import logging
+import math
+import os
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple, Union
+
+from PIL import Image
+import PyPDF2
+import pdfplumber
+from pdf2image import convert_from_path
+
+from cache import DiskLRUCache, content_key
+from ocr_backends import get_backend, init_backend
+from preprocessing import preprocess_image
+
+logger = logging.getLogger(__name__)
+
+# Page segmentation modes: 6 = uniform block, 4 = single column, 7 = single line
+PSM_CASCADE = [6, 4, 7]
+
+# 'cascade' tries PSM_CASCADE in order and keeps the first non-empty text;
+# 'confidence' runs a single image_to_data pass with a layout-picked PSM and
+# only retries other PSMs when mean word confidence is below the threshold.
+OCR_MODES = ("cascade", "confidence")
+
+# Rasterisation: pages are rendered in grayscale, and preprocessing keeps a few
+# copies of the page alive, so budget several bytes per rendered pixel.
+BYTES_PER_PIXEL = 4
+PROBE_DPI = 100
+# Tesseract is most accurate when capital letters are roughly 30px tall
+TARGET_TEXT_HEIGHT_PX = 30
+
+
+# Worker-side functions: these run inside the OCR process pool and must stay
+# importable at module level so they can be pickled. Results carry a
+# "timings" list of (stage, psm, seconds) that the parent process records as
+# metrics and strips before caching. With word_boxes, results also carry
+# "words": [left, top, right, bottom, text] in page pixels for layout-aware
+# answer segmentation.
+def ocr_cascade(image: Image.Image, word_boxes: bool = False) -> dict:
+    text = ""
+    timings = []
+    for psm in PSM_CASCADE:
+        if word_boxes:
+            # image_to_data costs about the same as image_to_string and also returns the boxes
+            result = ocr_with_data(image, psm, word_boxes=True)
+            timings.extend(result['timings'])
+            text = result['text']
+        else:
+            started = time.perf_counter()
+            text = get_backend().image_to_string(image, psm)
+            timings.append(("ocr", psm, time.perf_counter() - started))
+        if text.strip() and not text.startswith("Error"):
+            logger.info(f"Text extracted with PSM {psm}: {text[:100]}...")
+            if word_boxes:
+                return {**result, "confidence": None, "timings": timings}
+            return {"text": text, "confidence": None, "psm": psm, "timings": timings}
+    empty = {"text": text if text.strip() else "", "confidence": None, "psm": None, "timings": timings}
+    return {**empty, "words": []} if word_boxes else empty
+
+
+def pick_psm(image: Image.Image) -> int:
+    """
+    Choose a segmentation mode from the page's horizontal projection profile:
+    one text band is a single line (7), bands of very uneven height are a
+    single column of mixed sizes (4), anything else a uniform block (6).
+    """
+    gray = image.convert("L")
+    rows = max(1, min(gray.height, 1000))
+    # Resizing to one column averages every row band into a single pixel
+    profile = list(gray.resize((1, rows), Image.BOX).getdata())
+    threshold = (max(profile) + min(profile)) / 2
+    bands = []
+    band_start = None
+    for row, value in enumerate(profile + [255]):
+        if value < threshold and band_start is None:
+            band_start = row
+        elif value >= threshold and band_start is not None:
+            bands.append(row - band_start)
+            band_start = None
+    if len(bands) <= 1:
+        return 7
+    mean_height = statistics.mean(bands)
+    if statistics.pstdev(bands) > 0.5 * mean_height:
+        return 4
+    return 6
+
+
+def ocr_with_data(image: Image.Image, psm: int, word_boxes: bool = False) -> dict:
+    """One image_to_data pass: rebuild the text line by line and average word confidence."""
+    started = time.perf_counter()
+    data = get_backend().image_to_data(image, psm)
+    elapsed = time.perf_counter() - started
+    lines = {}
+    confidences = []
+    boxes = []
+    for i, word in enumerate(data['text']):
+        confidence = float(data['conf'][i])
+        if not word.strip() or confidence < 0:
+            continue
+        key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        lines.setdefault(key, []).append(word)
+        confidences.append(confidence)
+        if word_boxes:
+            left, top = data['left'][i], data['top'][i]
+            boxes.append([left, top, left + data['width'][i], top + data['height'][i], word])
+    text = "\n".join(" ".join(words) for _, words in sorted(lines.items()))
+    result = {
+        "text": text,
+        "confidence": statistics.mean(confidences) if confidences else 0.0,
+        "psm": psm,
+        "timings": [("ocr", psm, elapsed)]
+    }
+    if word_boxes:
+        result["words"] = boxes
+    return result
+
+
+def ocr_by_confidence(image: Image.Image, min_confidence: float, word_boxes: bool = False) -> dict:
+    psm = pick_psm(image)
+    best = ocr_with_data(image, psm, word_boxes)
+    timings = list(best['timings'])
+    if best['confidence'] >= min_confidence:
+        return best
+    for fallback_psm in PSM_CASCADE:
+        if fallback_psm == psm:
+            continue
+        logger.info(f"OCR confidence {best['confidence']:.1f} below {min_confidence}, retrying with PSM {fallback_psm}")
+        result = ocr_with_data(image, fallback_psm, word_boxes)
+        timings.extend(result['timings'])
+        if result['confidence'] > best['confidence']:
+            best = result
+        if best['confidence'] >= min_confidence:
+            break
+    return {**best, "timings": timings}
+
+
+def ocr_image(image: Image.Image, mode: str = "cascade", min_confidence: float = 60.0,
+              preprocessor: str = "pil", preprocess_options: Optional[dict] = None, word_boxes: bool = False) -> dict:
+    """
+    Preprocess one page and OCR it.
+    Returns {"text", "confidence", "psm", "timings"} (plus "words" with
+    word_boxes); text is '' when nothing was read and confidence is None in
+    cascade mode.
+    """
+    started = time.perf_counter()
+    processed_image = preprocess_image(image, preprocessor, preprocess_options)
+    preprocess_seconds = time.perf_counter() - started
+    try:
+        if mode == "confidence":
+            result = ocr_by_confidence(processed_image, min_confidence, word_boxes)
+        else:
+            result = ocr_cascade(processed_image, word_boxes)
+    except Exception as e:
+        # Some OCR backend errors cannot be unpickled and would break the pool
+        raise RuntimeError(str(e)) from None
+    if result['confidence'] is not None:
+        logger.info(f"OCR with PSM {result['psm']}: confidence {result['confidence']:.1f}")
+    return {**result, "timings": [("preprocess", None, preprocess_seconds)] + result['timings']}
+
+
+def read_text_layers(pdf_bytes: bytes) -> List[Tuple[str, float, float]]:
+    """Per-page (text layer, width in inches, height in inches); PDF user space is 1/72 inch."""
+    pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
+    pages = []
+    for page in pdf_reader.pages:
+        try:
+            page_text = page.extract_text() or ""
+        except Exception as e:
+            logger.warning(f"Text layer extraction failed for a page: {str(e)}")
+            page_text = ""
+        pages.append((page_text, float(page.mediabox.width) / 72, float(page.mediabox.height) / 72))
+    return pages
+
+
+def read_text_layer_words(pdf_bytes: bytes, page_numbers: List[int]) -> Dict[int, List[list]]:
+    """Word boxes [left, top, right, bottom, text] in PDF points for the given 1-based pages' text layers."""
+    words = {}
+    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+        for page_number in page_numbers:
+            try:
+                page_words = pdf.pages[page_number - 1].extract_words()
+            except Exception as e:
+                logger.warning(f"Text layer word extraction failed for page {page_number}: {str(e)}")
+                page_words = []
+            words[page_number] = [[w['x0'], w['top'], w['x1'], w['bottom'], w['text']] for w in page_words]
+    return words
+
+
+def count_pdf_pages(pdf: Union[bytes, BinaryIO]) -> int:
+    """
+    Page count from the page tree alone; 1 for unreadable files, whose extraction reports the error.
+    A file object (e.g. a spooled upload) is read in place and rewound.
+    """
+    stream = io.BytesIO(pdf) if isinstance(pdf, bytes) else pdf
+    try:
+        return len(PyPDF2.PdfReader(stream).pages)
+    except Exception:
+        return 1
+    finally:
+        stream.seek(0)
+
+
+def has_text_layer(page_text: str, min_chars: int) -> bool:
+    return sum(c.isalnum() for c in page_text) >= min_chars
+
+
+def render_pdf_page(pdf_path: str, page_number: int, dpi: int) -> Image.Image:
+    images = convert_from_path(pdf_path, dpi=dpi, first_page=page_number, last_page=page_number, grayscale=True)
+    return images[0] if images else None
+
+
+def ocr_pdf_page(pdf_path: str, page_number: int, dpi: int, mode: str = "cascade", min_confidence: float = 60.0,
+                 preprocessor: str = "pil", preprocess_options: Optional[dict] = None, word_boxes: bool = False) -> dict:
+    """Rasterise a single PDF page inside the worker and OCR it; the page image never leaves the process."""
+    started = time.perf_counter()
+    image = render_pdf_page(pdf_path, page_number, dpi)
+    rasterise = ("rasterise", None, time.perf_counter() - started)
+    if image is None:
+        empty = {"text": "", "confidence": None, "psm": None, "timings": [rasterise]}
+        return {**empty, "words": []} if word_boxes else empty
+    try:
+        result = ocr_image(image, mode, min_confidence, preprocessor, preprocess_options, word_boxes)
+        return {**result, "timings": [rasterise] + result['timings']}
+    finally:
+        image.close()
+
+
+def measure_text_height(pdf_path: str, page_number: int, dpi: int = PROBE_DPI) -> Optional[float]:
+    """Median word height in pixels on a low-resolution render, or None when no words were found."""
+    image = render_pdf_page(pdf_path, page_number, dpi)
+    if image is None:
+        return None
+    try:
+        data = get_backend().image_to_data(image, 6)
+    except Exception as e:
+        logger.warning(f"Text height probe failed: {str(e)}")
+        return None
+    finally:
+        image.close()
+    heights = [h for h, word in zip(data['height'], data['text']) if word.strip() and h > 0]
+    return statistics.median(heights) if heights else None
+
+
+def choose_dpi(page_width_in: float, page_height_in: float, max_dpi: int, min_dpi: int,
+               page_memory_bytes: int, text_height_px: Optional[float] = None, probe_dpi: int = PROBE_DPI) -> int:
+    """
+    Pick a rasterisation DPI for one page.
+    Scales the probe resolution so text lands near TARGET_TEXT_HEIGHT_PX, never
+    exceeds max_dpi, and keeps the rendered page within page_memory_bytes.
+    """
+    dpi = max_dpi
+    if text_height_px:
+        dpi = min(dpi, int(probe_dpi * TARGET_TEXT_HEIGHT_PX / text_height_px))
+    area = max(page_width_in * page_height_in, 1e-6)
+    memory_dpi = int(math.sqrt(page_memory_bytes / BYTES_PER_PIXEL / area))
+    return max(min(dpi, memory_dpi), min(min_dpi, memory_dpi), 1)
+
+
+class OCREngine:
+    """
+    Process pool for CPU-bound Tesseract and PIL work.
+
+    Page-level jobs are dispatched to worker processes so OCR never runs on
+    the event loop. At most `max_workers + max_queue` jobs are handed to the
+    pool at once; further jobs wait on the event loop until a slot frees up.
+    With a cache, results are looked up by page content plus OCR settings
+    before any rasterisation or Tesseract work is scheduled.
+    `stage_observer(stage, psm, seconds)` receives the workers' per-stage
+    timings (rasterise, preprocess, ocr) for every freshly OCR'd page.
+    With `word_boxes`, results include Tesseract word boxes ("words").
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_queue: Optional[int] = None,
+                 mode: str = "cascade", min_confidence: float = 60.0, backend: str = "auto", lang: str = "eng",
+                 preprocessor: str = "pil", preprocess_options: Optional[dict] = None,
+                 cache: Optional[DiskLRUCache] = None,
+                 stage_observer: Optional[Callable[[str, Optional[int], float], None]] = None,
+                 word_boxes: bool = False):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.cache = cache
+        self.preprocessor = preprocessor
+        self.preprocess_options = preprocess_options
+        self.backend = backend
+        self.lang = lang
+        self.mode = mode
+        self.min_confidence = min_confidence
+        self.stage_observer = stage_observer
+        self.word_boxes = word_boxes
+        self.max_queue = self.max_workers * 2 if max_queue is None else max_queue
+        self._slots = asyncio.Semaphore(self.max_workers + self.max_queue)
+        self._pool = None
+        self.in_flight = 0
+        self.waiting = 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Each worker warms up its own OCR engine once and keeps it for its lifetime
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers, initializer=init_backend,
+                                             initargs=(self.backend, self.lang))
+            logger.info(f"OCR process pool started with {self.max_workers} workers")
+        return self._pool
+
+    async def submit(self, fn, *args):
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_pool(), fn, *args)
+        except BrokenProcessPool:
+            logger.error("OCR process pool crashed; it will be restarted on the next job")
+            self._pool = None
+            raise
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+    def _record_timings(self, result: dict) -> dict:
+        """Report and strip the worker's stage timings so they never reach the cache or callers."""
+        timings = result.pop("timings", None) or []
+        if self.stage_observer:
+            for stage, psm, seconds in timings:
+                self.stage_observer(stage, psm, seconds)
+        return result
+
+    def _settings(self, preprocessor: str) -> dict:
+        return {
+            "mode": self.mode,
+            "min_confidence": self.min_confidence,
+            "backend": self.backend,
+            "lang": self.lang,
+            "preprocessor": preprocessor,
+            "preprocess_options": self.preprocess_options if preprocessor == "numpy" else None,
+            "word_boxes": self.word_boxes
+        }
+
+    async def _cache_get(self, key: str) -> Optional[dict]:
+        return await asyncio.to_thread(self.cache.get, key) if self.cache else None
+
+    async def _cache_set(self, key: str, result: dict):
+        if self.cache:
+            try:
+                await asyncio.to_thread(self.cache.set, key, result)
+            except OSError as e:
+                logger.warning(f"Failed to store OCR result in cache: {str(e)}")
+
+    async def ocr(self, image: Image.Image, preprocessor: Optional[str] = None) -> dict:
+        preprocessor = preprocessor or self.preprocessor
+        key = None
+        if self.cache:
+            key = await asyncio.to_thread(content_key, "image", image.mode, image.size, image.tobytes(),
+                                          self._settings(preprocessor))
+            cached = await self._cache_get(key)
+            if cached is not None:
+                logger.info("OCR cache hit for image")
+                return cached
+        result = self._record_timings(await self.submit(ocr_image, image, self.mode, self.min_confidence,
+                                                        preprocessor, self.preprocess_options, self.word_boxes))
+        if key:
+            await self._cache_set(key, result)
+        return result
+
+    async def ocr_pdf(self, pdf_path: str, page_sizes: Dict[int, Tuple[float, float]], max_dpi: int, min_dpi: int,
+                      memory_limit_bytes: int, window: int = 2, preprocessor: Optional[str] = None,
+                      document_hash: Optional[str] = None) -> Dict[int, dict]:
+        """
+        Stream the given pages of a scanned PDF through OCR.
+        `page_sizes` maps 1-based page numbers to (width, height) in inches.
+        At most `window` pages of this document are rendered at once and each
+        rendered page is held to memory_limit_bytes / window, so peak memory
+        stays bounded no matter how many pages the document has.
+        `document_hash` (sha256 of the PDF bytes) enables per-page caching.
+        """
+        if not page_sizes:
+            return {}
+        preprocessor = preprocessor or self.preprocessor
+        window = max(1, window)
+        page_memory_bytes = memory_limit_bytes // window
+
+        # The DPI is chosen from the text height measured on the first requested page, whether or
+        # not that page is cached, so the document, page number, probe page and DPI inputs fully
+        # determine the rendered page and stand in for the page image in the cache key
+        probe_page = min(page_sizes)
+        results = {}
+        page_keys = {}
+        if self.cache and document_hash:
+            settings = self._settings(preprocessor)
+            for page_number in page_sizes:
+                page_keys[page_number] = content_key("pdf-page", document_hash, page_number, probe_page, max_dpi,
+                                                     min_dpi, page_memory_bytes, settings)
+                cached = await self._cache_get(page_keys[page_number])
+                if cached is not None:
+                    results[page_number] = cached
+            if results:
+                logger.info(f"OCR cache hit for {len(results)}/{len(page_sizes)} pages")
+            page_sizes = {n: size for n, size in page_sizes.items() if n not in results}
+            if not page_sizes:
+                return results
+
+        text_height = await self.submit(measure_text_height, pdf_path, probe_page)
+        if text_height:
+            logger.info(f"Detected median text height {text_height:.1f}px at {PROBE_DPI} DPI")
+
+        pages_in_window = asyncio.Semaphore(window)
+
+        async def run_page(page_number: int, width_in: float, height_in: float) -> dict:
+            dpi = choose_dpi(width_in, height_in, max_dpi, min_dpi, page_memory_bytes, text_height)
+            async with pages_in_window:
+                logger.info(f"OCR page {page_number} at {dpi} DPI")
+                result = self._record_timings(await self.submit(ocr_pdf_page, pdf_path, page_number, dpi, self.mode,
+                                                                self.min_confidence, preprocessor, self.preprocess_options,
+                                                                self.word_boxes))
+            if page_number in page_keys:
+                await self._cache_set(page_keys[page_number], result)
+            return result
+
+        page_numbers = sorted(page_sizes)
+        page_results = await asyncio.gather(*(run_page(n, *page_sizes[n]) for n in page_numbers))
+        results.update(zip(page_numbers, page_results))
+        return results
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            logger.info("OCR process pool stopped")
@@ -0,0 +1,113 @@
+import logging
+
+from PIL import Image
+import pytesseract
+
+try:
+    from tesserocr import PyTessBaseAPI, OEM, PSM, RIL, iterate_level
+except ImportError:  # Optional: falls back to the pytesseract subprocess backend
+    PyTessBaseAPI = None
+
+logger = logging.getLogger(__name__)
+
+OCR_BACKENDS = ("auto", "tesserocr", "pytesseract")
+
+
+class PytesseractBackend:
+    """Runs the tesseract CLI per call: forks a process and reloads the language model every time."""
+
+    name = "pytesseract"
+
+    def __init__(self, lang: str = "eng"):
+        self.lang = lang
+
+    def image_to_string(self, image: Image.Image, psm: int) -> str:
+        return pytesseract.image_to_string(image, lang=self.lang, config=f'--oem 3 --psm {psm}')
+
+    def image_to_data(self, image: Image.Image, psm: int) -> dict:
+        return pytesseract.image_to_data(image, lang=self.lang, config=f'--oem 3 --psm {psm}',
+                                         output_type=pytesseract.Output.DICT)
+
+
+class TesserocrBackend:
+    """
+    Keeps one initialised libtesseract engine alive for the life of the
+    worker process and hands it images in memory, so the per-call cost is
+    recognition only.
+    """
+
+    name = "tesserocr"
+
+    def __init__(self, lang: str = "eng"):
+        self.lang = lang
+        self._api = PyTessBaseAPI(lang=lang, psm=PSM.SINGLE_BLOCK, oem=OEM.DEFAULT)
+
+    def _recognize(self, image: Image.Image, psm: int):
+        self._api.SetPageSegMode(psm)
+        self._api.SetImage(image)
+        self._api.Recognize()
+
+    def image_to_string(self, image: Image.Image, psm: int) -> str:
+        self._recognize(image, psm)
+        return self._api.GetUTF8Text()
+
+    def image_to_data(self, image: Image.Image, psm: int) -> dict:
+        """Word-level results in the same shape as pytesseract's Output.DICT."""
+        self._recognize(image, psm)
+        data = {key: [] for key in ("block_num", "par_num", "line_num", "left", "top", "width", "height", "conf", "text")}
+        block_num = par_num = line_num = 0
+        iterator = self._api.GetIterator()
+        for word in iterate_level(iterator, RIL.WORD):
+            if word.Empty(RIL.WORD):
+                continue
+            if word.IsAtBeginningOf(RIL.BLOCK):
+                block_num += 1
+            if word.IsAtBeginningOf(RIL.PARA):
+                par_num += 1
+            if word.IsAtBeginningOf(RIL.TEXTLINE):
+                line_num += 1
+            left, top, right, bottom = word.BoundingBox(RIL.WORD)
+            data['block_num'].append(block_num)
+            data['par_num'].append(par_num)
+            data['line_num'].append(line_num)
+            data['left'].append(left)
+            data['top'].append(top)
+            data['width'].append(right - left)
+            data['height'].append(bottom - top)
+            data['conf'].append(word.Confidence(RIL.WORD))
+            data['text'].append(word.GetUTF8Text(RIL.WORD) or "")
+        return data
+
+    def close(self):
+        self._api.End()
+
+
+def create_backend(name: str = "auto", lang: str = "eng"):
+    if name in ("auto", "tesserocr"):
+        if PyTessBaseAPI is None:
+            if name == "tesserocr":
+                logger.warning("tesserocr is not installed; falling back to pytesseract")
+        else:
+            try:
+                return TesserocrBackend(lang)
+            except Exception as e:
+                logger.warning(f"Failed to initialise tesserocr ({str(e)}); falling back to pytesseract")
+    return PytesseractBackend(lang)
+
+
+# One backend per process; OCR pool workers create theirs in the pool initializer
+_backend = None
+_backend_config = ("auto", "eng")
+
+
+def init_backend(name: str = "auto", lang: str = "eng"):
+    global _backend, _backend_config
+    _backend_config = (name, lang)
+    _backend = create_backend(name, lang)
+    logger.info(f"OCR backend ready: {_backend.name}")
+
+
+def get_backend():
+    if _backend is None:
+        init_backend(*_backend_config)
+    return _backend
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class Stage:
+    """One pipeline step: `handler(item)` returns the item passed to the next stage, run by `workers` tasks."""
+
+    def __init__(self, name: str, handler: Callable[[Any], Awaitable[Any]], workers: int = 1):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.busy = 0
+
+
+class Pipeline:
+    """
+    Bounded multi-stage asyncio pipeline.
+
+    Items from the source pass through the stages in order, joined by queues
+    of at most `queue_size` items. A full queue blocks the stage feeding it,
+    so a fast stage (unpacking, OCR) never runs more than `queue_size` items
+    ahead of a slow one (Gemini) while all stages keep working at once.
+    run() yields (result, None) per item in completion order, or
+    (item, error) with the input of the stage that raised; a failed item
+    skips the remaining stages. A Pipeline instance runs once.
+    """
+
+    def __init__(self, stages: List[Stage], queue_size: int = 4):
+        self.stages = stages
+        self.queue_size = max(1, queue_size)
+        self._queues: List[asyncio.Queue] = []
+
+    async def run(self, source: AsyncIterable[Any]) -> AsyncIterator[Tuple[Any, Optional[Exception]]]:
+        # queues[i] feeds stage i; the last queue collects finished and failed items
+        self._queues = [asyncio.Queue(self.queue_size) for _ in range(len(self.stages) + 1)]
+        results = self._queues[-1]
+        running = [stage.workers for stage in self.stages]
+
+        async def close(index: int):
+            # The next stage's workers (or the reader of results) each get one end marker
+            count = self.stages[index].workers if index < len(self.stages) else 1
+            for _ in range(count):
+                await self._queues[index].put(_DONE)
+
+        async def feed():
+            try:
+                async for item in source:
+                    await self._queues[0].put(item)
+            except Exception as e:
+                logger.error(f"Pipeline source failed: {str(e)}")
+                await results.put((None, e))
+            finally:
+                await close(0)
+
+        async def work(index: int, stage: Stage):
+            inbox = self._queues[index]
+            while True:
+                item = await inbox.get()
+                if item is _DONE:
+                    break
+                stage.busy += 1
+                try:
+                    output = await stage.handler(item)
+                except Exception as e:
+                    logger.error(f"Pipeline stage {stage.name} failed: {str(e)}")
+                    await results.put((item, e))
+                    continue
+                finally:
+                    stage.busy -= 1
+                if index + 1 < len(self.stages):
+                    await self._queues[index + 1].put(output)
+                else:
+                    await results.put((output, None))
+            running[index] -= 1
+            if running[index] == 0:
+                await close(index + 1)
+
+        tasks = [asyncio.ensure_future(feed())]
+        tasks += [asyncio.ensure_future(work(index, stage))
+                  for index, stage in enumerate(self.stages) for _ in range(stage.workers)]
+        try:
+            while True:
+                entry = await results.get()
+                if entry is _DONE:
+                    break
+                yield entry
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            stage.name: {"busy": stage.busy, "queued": queue.qsize(), "workers": stage.workers}
+            for stage, queue in zip(self.stages, self._queues)
+        }
@@ -0,0 +1,244 @@
+import collections
+import logging
+import re
+import zlib
+from decimal import Decimal
+from fractions import Fraction
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from cache import normalize_text
+
+# Negations and number words change an answer's meaning, so they are never dropped as stop words
+# and answers that differ in any of them are never accepted locally
+MEANINGFUL_WORDS = frozenset({
+    "no", "not", "n't", "never", "nor", "neither", "none", "nothing", "nobody", "nowhere", "cannot", "without",
+    "one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten", "eleven", "twelve",
+    "fifteen", "twenty", "forty", "fifty", "sixty", "hundred", "first", "third", "last", "more", "less",
+    "least", "most", "few", "many", "all", "only", "before", "after", "above", "below", "up", "down",
+})
+
+try:
+    from spacy.lang.en import English
+    from spacy.lang.en.stop_words import STOP_WORDS as SPACY_STOP_WORDS
+    STOP_WORDS = frozenset(SPACY_STOP_WORDS) - MEANINGFUL_WORDS
+except ImportError:  # Optional: falls back to a regex tokenizer without stop-word removal
+    English = None
+    STOP_WORDS = frozenset()
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLDS = {
+    # Short answers (both sides <= short_answer_words) below this n-gram similarity get zero locally.
+    # Off by default: synonyms ('H2O' / 'water') share no n-grams
+    "reject_similarity": 0.0,
+    "short_answer_words": 3,
+    # Absolute tolerance for decimal answers; None derives it from the expected answer's decimal
+    # places (half a unit in the last place: '0.75' accepts 0.745..0.755). Integers compare exactly
+    "numeric_tolerance": None,
+}
+
+HASH_DIMENSIONS = 4096
+NUMBER_PATTERN = re.compile(r"^[-+]?(?:\d+(?:,\d{3})*(?:\.\d+)?|\.\d+)(?:e[-+]?\d+)?$", re.IGNORECASE)
+FRACTION_PATTERN = re.compile(r"^([-+]?\d+)\s*/\s*(\d+)$")
+OPTION_PATTERN = re.compile(r"(?:^|\s)\(?([a-e])[).:]\s+(.+?)(?=\s+\(?[a-e][).:]\s+|$)")
+LETTER_ANSWER_PATTERN = re.compile(r"^(?:option\s+|answer\s*(?:is\s*)?:?\s*)?\(?([a-e])\)?$")
+# A capital after a word's first character: 'CO', 'NaCl', 'H2O' and 'pH' are case-sensitive answers
+INNER_CAPITAL_PATTERN = re.compile(r"\w[A-Z]")
+
+_tokenizer = None
+
+
+def comparable_text(text, casefold: bool = True) -> str:
+    """Normalised answer for local comparison, without trailing sentence punctuation ('.75' keeps its point)."""
+    text = normalize_text(text).rstrip(" .!?")
+    return text.casefold() if casefold else text
+
+
+def plain_case(text: str) -> bool:
+    """True when case carries no meaning: at most each word's first letter is a capital ('Paris', 'the cell')."""
+    return not INNER_CAPITAL_PATTERN.search(text)
+
+
+def word_tokens(text: str) -> List[str]:
+    """Word tokens of normalised text (spaCy's English tokenizer when installed)."""
+    global _tokenizer
+    if English is not None:
+        if _tokenizer is None:
+            _tokenizer = English().tokenizer
+        return [token.text for token in _tokenizer(text) if not token.is_punct and not token.is_space]
+    return re.findall(r"\w+", text)
+
+
+def tokenize(text: str) -> List[str]:
+    """Word tokens minus stop words (all tokens when only stop words are left)."""
+    tokens = word_tokens(text)
+    content = [token for token in tokens if token not in STOP_WORDS]
+    return content or tokens
+
+
+def protected_tokens(tokens: List[str]) -> collections.Counter:
+    """Negations, number words and numbers: a difference in any of them changes the answer's meaning."""
+    return collections.Counter(token for token in tokens
+                               if token in MEANINGFUL_WORDS or any(char.isdigit() for char in token))
+
+
+def same_tokens(expected: str, student: str) -> bool:
+    """
+    Near-exact token equality: the same words in the same order once stop words
+    are dropped ('the mitochondria' / 'mitochondria'), and the same negations and numbers.
+    """
+    expected_tokens, student_tokens = word_tokens(expected), word_tokens(student)
+    return (tokenize(expected) == tokenize(student)
+            and protected_tokens(expected_tokens) == protected_tokens(student_tokens))
+
+
+def parse_decimal(text: str) -> Optional[Decimal]:
+    text = text.replace(" ", "")
+    return Decimal(text.replace(",", "")) if NUMBER_PATTERN.match(text) else None
+
+
+def parse_fraction(text: str) -> Optional[Tuple[int, int]]:
+    fraction = FRACTION_PATTERN.match(text.replace(" ", ""))
+    if not fraction or int(fraction.group(2)) == 0:
+        return None
+    return int(fraction.group(1)), int(fraction.group(2))
+
+
+def compare_numbers(expected: str, student: str, tolerance: Optional[float] = None) -> Optional[Tuple[bool, str]]:
+    """
+    (correct, feedback) for a numeric answer, or None when it is not clear-cut and
+    is left to the LLM. Fractions are only read as numbers when the expected answer
+    is a fraction ('3/4' is not an answer to 'write 3/4 as a decimal'), and an
+    equivalent fraction in other terms ('6/8') may not be what the question asks for.
+    """
+    expected_fraction = parse_fraction(expected)
+    if expected_fraction:
+        student_fraction = parse_fraction(student)
+        if student_fraction is None:
+            return None
+        if student_fraction == expected_fraction:
+            return True, "Matches the expected fraction"
+        if Fraction(*student_fraction) != Fraction(*expected_fraction):
+            return False, f"Numeric answer differs from {expected}"
+        return None
+
+    expected_value, student_value = parse_decimal(expected), parse_decimal(student)
+    if expected_value is None or student_value is None:
+        return None
+    if tolerance is not None:
+        allowed = Decimal(str(tolerance))
+    else:
+        exponent = expected_value.as_tuple().exponent
+        allowed = Decimal(5).scaleb(exponent - 1) if exponent < 0 else Decimal(0)
+    if abs(student_value - expected_value) <= allowed:
+        return True, "Numeric answer matches" if not allowed else f"Numeric answer within {allowed:f} of {expected}"
+    return False, f"Numeric answer differs from {expected}"
+
+
+def parse_options(question: dict) -> Dict[str, str]:
+    """MCQ options as {letter: normalised text}, from an explicit 'options' list or '(a) ... (b) ...' in the question text."""
+    options = question.get('options')
+    if isinstance(options, list) and options:
+        return {chr(ord('a') + i): comparable_text(re.sub(r"^\(?[a-eA-E][).:]\s+", "", str(option)))
+                for i, option in enumerate(options[:5])}
+    found = OPTION_PATTERN.findall(comparable_text(question.get('text', '')))
+    return {letter: text for letter, text in found} if len(found) >= 2 else {}
+
+
+def resolve_option(answer: str, options: Dict[str, str]) -> Optional[str]:
+    """Option letter an answer refers to, by letter ('b', '(b)', 'option b') or by the option's text."""
+    letter = LETTER_ANSWER_PATTERN.match(answer)
+    if letter and letter.group(1) in options:
+        return letter.group(1)
+    for option_letter, option_text in options.items():
+        if answer == option_text or re.sub(r"^\(?[a-e][).:]\s+", "", answer) == option_text:
+            return option_letter
+    return None
+
+
+def hashed_ngrams(texts: List[str]) -> np.ndarray:
+    """
+    L2-normalised hashed feature rows: word unigrams + bigrams and character
+    trigrams of each text, so one matrix product scores the whole batch.
+    """
+    matrix = np.zeros((len(texts), HASH_DIMENSIONS), dtype=np.float32)
+    for row, text in enumerate(texts):
+        tokens = tokenize(text)
+        features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        padded = f" {' '.join(tokens)} "
+        features += [f"#{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+        if features:
+            indices = [zlib.crc32(feature.encode("utf-8")) % HASH_DIMENSIONS for feature in features]
+            np.add.at(matrix[row], indices, 1.0)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def pregrade(questions: List[dict], thresholds: Optional[dict] = None) -> Dict[int, dict]:
+    """
+    Decide clear-cut answers without the LLM. `questions` use the /check-answers
+    shape (text, marks, expectedAnswer, studentAnswer, optional options).
+    Returns {index in `questions`: {"marksAwarded", "maxMarks", "feedback", "method"}}
+    for the answers decided locally; everything else is left for Gemini.
+    Full marks are only given for an exact match, the right MCQ option, a matching
+    number or near-exact token equality, never for mere similarity.
+    """
+    thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+    decided = {}
+    expected, student = [], []
+    for q in questions:
+        # Case is ignored only when neither side uses it meaningfully: 'paris' matches 'Paris', 'Co' never matches 'CO'
+        expected_text = comparable_text(q.get('expectedAnswer', ''), casefold=False)
+        student_text = comparable_text(q.get('studentAnswer', ''), casefold=False)
+        if plain_case(expected_text) and plain_case(student_text):
+            expected_text, student_text = expected_text.casefold(), student_text.casefold()
+        expected.append(expected_text)
+        student.append(student_text)
+    marks = [q.get('marks', 0) for q in questions]
+
+    def decide(i: int, correct: bool, method: str, feedback: str):
+        decided[i] = {
+            "marksAwarded": marks[i] if correct else 0,
+            "maxMarks": marks[i],
+            "feedback": feedback,
+            "method": method
+        }
+
+    similarity_rows = []
+    for i, q in enumerate(questions):
+        if not student[i]:
+            decide(i, False, "blank", "No answer provided")
+        elif not expected[i]:
+            continue  # Nothing to compare against: only the LLM can judge
+        elif student[i] == expected[i]:
+            decide(i, True, "exact", "Matches the expected answer")
+        else:
+            options = parse_options(q)
+            expected_option = resolve_option(comparable_text(expected[i]), options) if options else None
+            student_option = resolve_option(comparable_text(student[i]), options) if expected_option else None
+            if expected_option and student_option:
+                decide(i, student_option == expected_option, "mcq",
+                       f"Selected option ({student_option}); correct option is ({expected_option})")
+                continue
+            numeric = compare_numbers(expected[i], student[i], thresholds["numeric_tolerance"])
+            if numeric is not None:
+                decide(i, numeric[0], "numeric", numeric[1])
+            elif same_tokens(expected[i], student[i]):
+                decide(i, True, "tokens", "Same key terms as the expected answer")
+            else:
+                similarity_rows.append(i)
+
+    # Opt-in rejection of short answers sharing no n-grams with the expected answer, for the whole batch in one pass
+    short = thresholds["short_answer_words"]
+    similarity_rows = [i for i in similarity_rows if len(expected[i].split()) <= short and len(student[i].split()) <= short]
+    if thresholds["reject_similarity"] > 0 and similarity_rows:
+        expected_vectors = hashed_ngrams([expected[i] for i in similarity_rows])
+        student_vectors = hashed_ngrams([student[i] for i in similarity_rows])
+        similarity = np.einsum("ij,ij->i", expected_vectors, student_vectors)
+        for i, score in zip(similarity_rows, similarity.tolist()):
+            if score < thresholds["reject_similarity"]:
+                decide(i, False, "similarity", f"Does not match the expected short answer (similarity {score:.2f})")
+
+    return decided
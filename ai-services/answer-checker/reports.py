@@ -0,0 +1,268 @@
+import asyncio
+import io
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
+
+from cache import content_key
+
+logger = logging.getLogger(__name__)
+
+# Part of every report key: bump when render_report's layout changes so stored reports are rebuilt
+REPORT_VERSION = 1
+REPORT_NAME = re.compile(r"^report_[0-9a-f]{64}\.pdf$")
+
+
+def render_report(results: List[dict], total_marks: str) -> bytes:
+    """Build the result report PDF in memory (runs in a report worker process)."""
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    styles = getSampleStyleSheet()
+    story = []
+
+    story.append(Paragraph("Handwritten Answer Checker Result", styles['Title']))
+    story.append(Spacer(1, 12))
+
+    for i, result in enumerate(results, 1):
+        story.append(Paragraph(f"Question {i}", styles['Heading2']))
+        if 'questionText' in result and result['questionText']:
+            story.append(Paragraph("Question Text:", styles['Heading3']))
+            story.append(Paragraph(result['questionText'].replace("\n", "<br/>"), styles['Normal']))
+        story.append(Paragraph("Extracted Answer:", styles['Heading3']))
+        story.append(Paragraph(result['extractedText'].replace("\n", "<br/>"), styles['Normal']))
+        story.append(Paragraph("Feedback:", styles['Heading3']))
+        story.append(Paragraph(result['feedback'].replace("\n", "<br/>"), styles['Normal']))
+        story.append(Paragraph("Marks Awarded:", styles['Heading3']))
+        story.append(Paragraph(result['marks'], styles['Normal']))
+        story.append(Spacer(1, 12))
+
+    story.append(Paragraph("Total Marks:", styles['Heading2']))
+    story.append(Paragraph(total_marks, styles['Normal']))
+
+    doc.build(story)
+    return buffer.getvalue()
+
+
+def purge_files(paths: Iterable[Path], older_than: float) -> int:
+    """Delete the files last modified before `older_than` (epoch seconds); returns how many went."""
+    removed = 0
+    for path in paths:
+        try:
+            if path.stat().st_mtime < older_than:
+                path.unlink()
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+class ReportStore:
+    """
+    Content-addressed result report PDFs on local disk.
+
+    Reports are named after a hash of their results and total, so a
+    re-graded attempt with unchanged results reuses the stored file and
+    concurrent requests for the same report share one render. Rendering
+    (reportlab is pure Python and CPU-bound) runs in a process pool, never on
+    the event loop. Reports expire `ttl_seconds` after they were last
+    served, and past `max_bytes` the least recently served are deleted until
+    the directory is back under 90% of the limit, sparing those saved or
+    served in the last `grace_seconds` so a fresh report is still there when
+    its link is followed; the janitor task applies both every
+    `cleanup_interval` seconds.
+    `render_observer(seconds)` receives each render's duration, queueing included.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl_seconds: int, workers: int = 1,
+                 cleanup_interval: float = 600, grace_seconds: float = 300,
+                 render_observer: Optional[Callable[[float], None]] = None):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.workers = max(1, workers)
+        self.cleanup_interval = cleanup_interval
+        self.grace_seconds = grace_seconds
+        self.render_observer = render_observer
+        self.hits = 0
+        self.renders = 0
+        self.expired = 0
+        self.evictions = 0
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._janitor = None
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._sizes = {path.name: path.stat().st_size for path in self.directory.glob("report_*.pdf")}
+        self._total_bytes = sum(self._sizes.values())
+        logger.info(f"Report store at {self.directory}: {len(self._sizes)} reports, {self._total_bytes} bytes")
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            logger.info(f"Report process pool started with {self.workers} workers")
+        return self._pool
+
+    @staticmethod
+    def filename(results: List[dict], total_marks: str) -> str:
+        return f"report_{content_key('report', REPORT_VERSION, results, total_marks)}.pdf"
+
+    async def open(self, filename: str) -> Optional[Path]:
+        """Path of a stored report about to be served, refreshing its TTL and LRU clock; None when missing."""
+        if not REPORT_NAME.match(filename):
+            return None
+        if not await asyncio.to_thread(self._touch, filename):
+            return None
+        return self.directory / filename
+
+    async def render(self, results: List[dict], total_marks: str) -> bytes:
+        started = time.perf_counter()
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_pool(), render_report, results, total_marks)
+        except BrokenProcessPool:
+            logger.error("Report process pool crashed; it will be restarted on the next report")
+            self._pool = None
+            raise
+        finally:
+            self.in_flight -= 1
+            if self.render_observer:
+                self.render_observer(time.perf_counter() - started)
+
+    async def save(self, results: List[dict], total_marks: str) -> str:
+        """Filename of the stored report for these results, rendering it first unless it already exists."""
+        filename = self.filename(results, total_marks)
+        pending = self._pending.get(filename)
+        if pending is not None:
+            await asyncio.shield(pending)
+            return filename
+        pending = asyncio.get_running_loop().create_future()
+        self._pending[filename] = pending
+        try:
+            if await asyncio.to_thread(self._touch, filename):
+                with self._lock:
+                    self.hits += 1
+            else:
+                data = await self.render(results, total_marks)
+                await asyncio.to_thread(self._write, filename, data)
+                logger.info(f"PDF generated successfully: {filename}")
+            pending.set_result(filename)
+        except asyncio.CancelledError:
+            pending.cancel()
+            raise
+        except Exception as e:
+            pending.set_exception(e)
+            # Joined callers re-raise it; mark it retrieved so a lone failure is not reported twice
+            pending.exception()
+            raise
+        finally:
+            del self._pending[filename]
+        return filename
+
+    def _touch(self, filename: str) -> bool:
+        """Refresh a stored report's mtime (its TTL and LRU clock); False when it does not exist."""
+        try:
+            os.utime(self.directory / filename)
+            return True
+        except OSError:
+            with self._lock:
+                if self._sizes.pop(filename, None) is not None:
+                    self._total_bytes = sum(self._sizes.values())
+            return False
+
+    def _write(self, filename: str, data: bytes):
+        path = self.directory / filename
+        temp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        with self._lock:
+            self.renders += 1
+            self._total_bytes += len(data) - self._sizes.get(filename, 0)
+            self._sizes[filename] = len(data)
+            over_limit = self._total_bytes > self.max_bytes
+        if over_limit:
+            self.cleanup()
+
+    def cleanup(self) -> int:
+        """Delete expired reports, then the least recently served ones (outside the grace period) while over the quota."""
+        with self._lock:
+            now = time.time()
+            entries = []
+            for filename in list(self._sizes):
+                try:
+                    entries.append((os.stat(self.directory / filename).st_mtime, filename))
+                except OSError:
+                    self._total_bytes -= self._sizes.pop(filename)
+            entries.sort()
+            target = self.max_bytes * 0.9 if self._total_bytes > self.max_bytes else self.max_bytes
+            removed = 0
+            for mtime, filename in entries:
+                expired = now - mtime > self.ttl_seconds
+                if not expired and (self._total_bytes <= target or now - mtime < self.grace_seconds):
+                    break
+                try:
+                    (self.directory / filename).unlink()
+                except OSError:
+                    pass
+                self._total_bytes -= self._sizes.pop(filename)
+                if expired:
+                    self.expired += 1
+                else:
+                    self.evictions += 1
+                removed += 1
+            # Leftovers of writes interrupted by a crash
+            purge_files(self.directory.glob("report_*.tmp"), now - 3600)
+        if removed:
+            logger.info(f"Report store at {self.directory} removed {removed} reports, {self._total_bytes} bytes left")
+        return removed
+
+    async def _run_janitor(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.cleanup)
+            except Exception as e:
+                logger.error(f"Report cleanup failed: {str(e)}")
+            await asyncio.sleep(self.cleanup_interval)
+
+    def start(self):
+        if self._janitor is None:
+            self._janitor = asyncio.create_task(self._run_janitor())
+
+    async def stop(self):
+        if self._janitor is not None:
+            self._janitor.cancel()
+            try:
+                await self._janitor
+            except asyncio.CancelledError:
+                pass
+            self._janitor = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            logger.info("Report process pool stopped")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "reports": len(self._sizes),
+                "bytes": self._total_bytes,
+                "maxBytes": self.max_bytes,
+                "ttlSeconds": self.ttl_seconds,
+                "hits": self.hits,
+                "renders": self.renders,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "inFlight": self.in_flight
+            }
@@ -0,0 +1,299 @@
+"""
+Layout-aware answer segmentation from word bounding boxes.
+
+Words from Tesseract (image_to_data) or a PDF text layer are grouped into
+lines by vertical position. Lines that start with a question number in the
+page's left margin become anchors, and each answer is the region between its
+anchor and the next one, across page breaks. The OCR text is never rewritten:
+digit look-alikes (l, I, |, O, S) are only read as digits inside an anchor.
+
+segment_by_layout() returns None when too few anchors are found; callers
+then fall back to split_answers(), which splits the plain text at the same
+question markers, or into equal chunks of lines or words when there are too
+few markers.
+"""
+import bisect
+import functools
+import logging
+import math
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (page, left, top, right, bottom, text). Coordinates only need to be consistent
+# within a page: OCR pages are in pixels, text-layer pages in PDF points
+Word = Tuple[int, float, float, float, float, str]
+
+# 'layout' segments from word boxes and falls back to regex splitting; 'regex' only splits the text
+SEGMENTATION_MODES = ("layout", "regex")
+UNCLEAR_ANSWER = "Unclear answer"
+
+# Question markers, shared by layout anchors and regex splitting: "1.", "1)", "(1)", "1:" (bare) and
+# "Q1", "Q.1:", "Question 1", "Ans 1 -", "Answer 1:" (prefixed). A number with a digit on either side
+# ("3.14") is not a marker; look-alikes in the number are resolved by anchor_number()
+PREFIXED_MARKER = (r"(?:q(?:uestion|ues|n)?|ans(?:wer)?)[ \t]*[.:#-]?[ \t]*"
+                   r"(?P<prefixed>[0-9lIoOsS|]{1,4})(?![0-9A-Za-z])[ \t]*[.):-]?")
+BARE_MARKER = r"\(?(?<![0-9])(?P<bare>[0-9lIoOsS|]{1,4})[ \t]*[.):](?![0-9])"
+ANCHOR_PATTERN = re.compile(rf"^\s*(?:{PREFIXED_MARKER}|{BARE_MARKER})", re.IGNORECASE)
+DIGIT_LOOKALIKES = str.maketrans("lI|oOsS", "1110055")
+ANCHOR_PREFIX_CHARS = 24
+
+# Regex splitting: any marker at the start of a line, plus prefixed markers after a space within a
+# line ("Question 1 Paris Question 2 Rome"); a bare number inside a line is too often part of the
+# answer ("ended in 1945."). "Answer:" without a number marks the next answer
+DEFAULT_DELIMITER = re.compile(
+    rf"(?im)(?:^[ \t]*|(?<=[ \t]))(?:{PREFIXED_MARKER})[ \t]*"
+    rf"|^[ \t]*(?:{BARE_MARKER}|answer[ \t]*:)[ \t]*"
+)
+# Question number in a custom delimiter's match
+MARKER_NUMBER = re.compile(r"\d+")
+
+
+def anchor_number(token: str) -> Optional[int]:
+    """Question number of an anchor token; look-alikes only count next to a real digit (or alone as '1')."""
+    if not any(c.isdigit() for c in token) and token not in ("l", "I", "|"):
+        return None
+    number = int(token.translate(DIGIT_LOOKALIKES))
+    return number or None
+
+
+def match_anchor(line_text: str) -> Optional[Tuple[int, str]]:
+    """(question number, rest of the line) when the line opens with a question number."""
+    match = ANCHOR_PATTERN.match(line_text[:ANCHOR_PREFIX_CHARS])
+    if not match:
+        return None
+    number = anchor_number(match.group("prefixed") or match.group("bare"))
+    if number is None:
+        return None
+    return number, line_text[match.end():].strip()
+
+
+class Line:
+    __slots__ = ("page", "top", "bottom", "left", "right", "words")
+
+    def __init__(self, word: Word):
+        page, left, top, right, bottom, _ = word
+        self.page, self.left, self.top, self.right, self.bottom = page, left, top, right, bottom
+        self.words = [word]
+
+    def accepts(self, word: Word) -> bool:
+        # Same line when the word's vertical centre falls inside the line's band
+        centre = (word[2] + word[4]) / 2
+        return word[0] == self.page and self.top <= centre <= self.bottom
+
+    def add(self, word: Word):
+        self.words.append(word)
+        self.left = min(self.left, word[1])
+        self.right = max(self.right, word[3])
+        self.top = min(self.top, word[2])
+        self.bottom = max(self.bottom, word[4])
+
+    @property
+    def text(self) -> str:
+        return " ".join(word[5] for word in sorted(self.words, key=lambda w: w[1]))
+
+
+def group_lines(words: Sequence[Word]) -> List[Line]:
+    """Cluster words into lines in reading order (page, then top to bottom)."""
+    lines: List[Line] = []
+    current = None
+    for word in sorted((w for w in words if w[5].strip()), key=lambda w: (w[0], (w[2] + w[4]) / 2, w[1])):
+        if current is not None and current.accepts(word):
+            current.add(word)
+        else:
+            current = Line(word)
+            lines.append(current)
+    return lines
+
+
+def drop_nested_lists(candidates: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """
+    Drop (line index, number) candidates of numbered lists written inside an answer:
+    a later "1." opens such a list, which runs on while the numbers count up by one.
+    """
+    kept = []
+    seen_first = False
+    nested_next = None
+    for index, number in candidates:
+        if nested_next is not None and number == nested_next:
+            nested_next += 1
+            continue
+        nested_next = None
+        if number == 1 and seen_first:
+            nested_next = 2
+            continue
+        seen_first = seen_first or number == 1
+        kept.append((index, number))
+    return kept
+
+
+def longest_increasing(candidates: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """
+    Longest run of (line index, number) candidates whose numbers strictly increase in reading order.
+    Of several candidates with the same number the earliest is kept.
+    """
+    tails: List[int] = []  # smallest number ending an increasing run of each length
+    tail_index: List[int] = []
+    previous = [-1] * len(candidates)
+    for i, (_, number) in enumerate(candidates):
+        length = bisect.bisect_left(tails, number)
+        if length < len(tails) and tails[length] == number:
+            continue
+        if length == len(tails):
+            tails.append(number)
+            tail_index.append(i)
+        else:
+            tails[length] = number
+            tail_index[length] = i
+        previous[i] = tail_index[length - 1] if length else -1
+    chain = []
+    i = tail_index[-1] if tail_index else -1
+    while i >= 0:
+        chain.append(candidates[i])
+        i = previous[i]
+    return chain[::-1]
+
+
+def segment_by_layout(words: Sequence[Word], num_questions: int, margin_ratio: float = 0.12,
+                      min_anchor_ratio: float = 0.5) -> Optional[List[str]]:
+    """
+    Split a document into `num_questions` answers from its word boxes.
+    An anchor must sit within `margin_ratio` of the page's text width from its
+    left edge. Returns None unless at least `min_anchor_ratio` of the questions
+    have an anchor; questions without one get UNCLEAR_ANSWER.
+    """
+    lines = group_lines(words)
+    if not lines or num_questions < 1:
+        return None
+
+    edges: Dict[int, Tuple[float, float]] = {}
+    for line in lines:
+        left, right = edges.get(line.page, (line.left, line.right))
+        edges[line.page] = (min(left, line.left), max(right, line.right))
+
+    candidates = []
+    line_texts = []
+    for index, line in enumerate(lines):
+        text = line.text
+        line_texts.append(text)
+        left_edge, right_edge = edges[line.page]
+        if line.left - left_edge > margin_ratio * max(right_edge - left_edge, 1e-6):
+            continue
+        anchor = match_anchor(text)
+        if anchor and anchor[0] <= num_questions:
+            candidates.append((index, anchor[0]))
+
+    # Lines of dropped candidates stay in the region of the anchor before them
+    anchors = longest_increasing(drop_nested_lists(candidates))
+    if len(anchors) < max(1, math.ceil(min_anchor_ratio * num_questions)):
+        logger.info(f"Layout segmentation found {len(anchors)}/{num_questions} question anchors; falling back")
+        return None
+
+    answers: Dict[int, str] = {}
+    for position, (start, number) in enumerate(anchors):
+        end = anchors[position + 1][0] if position + 1 < len(anchors) else len(lines)
+        region = [match_anchor(line_texts[start])[1]] + line_texts[start + 1:end]
+        answers[number] = " ".join(part for part in region if part).strip()
+    logger.info(f"Layout segmentation anchored {len(anchors)}/{num_questions} answers")
+    return [answers.get(number) or UNCLEAR_ANSWER for number in range(1, num_questions + 1)]
+
+
+def is_readable_answer(text: Optional[str], min_alnum: int = 2) -> bool:
+    """False for placeholders and OCR noise (fewer than `min_alnum` letters/digits, or mostly symbols)."""
+    text = (text or "").strip()
+    if not text or text == UNCLEAR_ANSWER:
+        return False
+    visible = [c for c in text if not c.isspace()]
+    alnum = sum(c.isalnum() for c in visible)
+    return alnum >= min_alnum and alnum >= len(visible) / 2
+
+
+@functools.lru_cache(maxsize=64)
+def delimiter_pattern(delimiter: Optional[str] = None) -> re.Pattern:
+    """Compiled question-marker pattern; custom delimiters are compiled once and invalid ones replaced by the default."""
+    if not delimiter:
+        return DEFAULT_DELIMITER
+    try:
+        return re.compile(delimiter)
+    except re.error:
+        logger.warning(f"Invalid delimiter pattern: {delimiter}. Falling back to default.")
+        return DEFAULT_DELIMITER
+
+
+def chunk_evenly(parts: List[str], num_questions: int) -> List[str]:
+    """`parts` (lines or words) joined into consecutive runs of equal length, at most `num_questions` of them."""
+    size = max(1, (len(parts) + num_questions - 1) // num_questions)
+    return [" ".join(parts[i:i + size]) for i in range(0, len(parts), size)]
+
+
+def split_answers(extracted_text: str, num_questions: int, delimiter: str = None,
+                  min_marker_ratio: float = 0.5) -> List[str]:
+    """
+    Regex segmentation of plain OCR text into `num_questions` answers.
+    Whitespace is collapsed within lines, not across them: the default
+    markers match at the start of a line, and prefixed ones ("Question 2")
+    also within a line. Only a marker's number is read with look-alikes as
+    digits; the answer is the original text up to the next marker. Answers
+    go to the question their marker names ("Answer:" markers count on from
+    the one before); markers out of order or past `num_questions` stay in the
+    answer they interrupt, as layout anchors do. Text before the first marker
+    is dropped as a header, unless that marker is unnumbered (a separator
+    between answers). With markers for fewer than `min_marker_ratio` of the
+    questions, the lines (or, with fewer lines than questions, the words) are
+    cut into equal chunks instead; missing answers are padded with
+    UNCLEAR_ANSWER.
+    """
+    try:
+        lines = (" ".join(line.split()) for line in extracted_text.splitlines())
+        cleaned_text = "\n".join(line for line in lines if line)
+        logger.debug(f"Cleaned text: {cleaned_text}")
+
+        candidates = []
+        matches = []
+        preamble = ""
+        for match in delimiter_pattern(delimiter).finditer(cleaned_text):
+            if match.end() == match.start():
+                continue
+            groups = match.groupdict()
+            token = groups.get("prefixed") or groups.get("bare")
+            digits = None if token else MARKER_NUMBER.search(match.group())
+            if token:
+                number = anchor_number(token)
+                if number is None:
+                    continue
+            elif digits:
+                number = int(digits.group())
+            elif candidates:
+                number = candidates[-1][1] + 1
+            else:
+                # Unnumbered markers used as separators: the text before the first is answer 1
+                preamble = cleaned_text[:match.start()].strip().replace("\n", " ")
+                number = 2 if preamble else 1
+            if 1 <= number <= num_questions:
+                candidates.append((len(matches), number))
+                matches.append(match)
+        markers = longest_increasing(drop_nested_lists(candidates))
+        found = len(markers) + bool(preamble)
+        if markers and found >= math.ceil(min_marker_ratio * num_questions):
+            answers: Dict[int, str] = {1: preamble} if preamble else {}
+            for position, (index, number) in enumerate(markers):
+                end = matches[markers[position + 1][0]].start() if position + 1 < len(markers) else len(cleaned_text)
+                answers[number] = cleaned_text[matches[index].end():end].strip().replace("\n", " ")
+            logger.info(f"Split by question markers: {found}/{num_questions} answers found")
+            return [answers.get(number) or UNCLEAR_ANSWER for number in range(1, num_questions + 1)]
+
+        answers = chunk_evenly(cleaned_text.split("\n"), num_questions) if cleaned_text else []
+        if len(answers) >= num_questions:
+            logger.info(f"Split by lines: {len(answers)} answers found")
+            return answers[:num_questions]
+        answers = chunk_evenly(cleaned_text.split(), num_questions)
+        if len(answers) >= num_questions:
+            logger.info(f"Split by words: {len(answers)} answers found")
+            return answers[:num_questions]
+        answers += [UNCLEAR_ANSWER] * (num_questions - len(answers))
+        logger.info(f"Final split: {len(answers)} answers: {[a[:50] + '...' for a in answers]}")
+        return answers
+    except Exception as e:
+        logger.error(f"Answer splitting failed: {str(e)}")
+        return [extracted_text.strip() if extracted_text.strip() else UNCLEAR_ANSWER] * num_questions
@@ -25,7 +25,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 data.results.forEach((result, index) => {
                     html += `<li>Question ${index + 1}: ${result.extractedText}<br>Status: ${result.status}<br>Feedback: ${result.feedback}<br>Marks: ${result.marks}</li>`;
                 });
-                html += `</ul><p>Total Marks: ${data.totalMarks}</p><p><a href="/static/${data.pdfFilename}" target="_blank">Download PDF</a></p>`;
+                html += `</ul><p>Total Marks: ${data.totalMarks}</p><p><a href="${data.reportUrl}" target="_blank">Download PDF</a></p>`;
                 singleResult.innerHTML = `<div class="success">${html}</div>`;
             }
         } catch (error) {
@@ -54,7 +54,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 data.results.forEach((result, index) => {
                     html += `<li>Question ${index + 1}:<br>Question: ${result.questionText}<br>Answer: ${result.extractedText}<br>Status: ${result.status}<br>Feedback: ${result.feedback}<br>Marks: ${result.marks}</li>`;
                 });
-                html += `</ul><p>Total Marks: ${data.totalMarks}</p><p><a href="/static/${data.pdfFilename}" target="_blank">Download PDF</a></p>`;
+                html += `</ul><p>Total Marks: ${data.totalMarks}</p><p><a href="${data.reportUrl}" target="_blank">Download PDF</a></p>`;
                 dualResult.innerHTML = `<div class="success">${html}</div>`;
             }
         } catch (error) {
@@ -0,0 +1,321 @@
+"""
+Hermetic load benchmark for the AI services.
+
+Starts the local Gemini mock (mock_gemini.py), runs each service under
+uvicorn from a staged copy in a temporary directory (so caches, reports and
+generated papers never touch the working tree), points it at the mock with
+dummy API keys, and drives its endpoints with generated fixtures at each
+concurrency level. Reports p50/p95/p99 latency, throughput, error count and
+peak RSS of the service process tree (including the OCR worker pool).
+
+By default every request carries a distinct payload so the services' caches
+miss; --repeat-payloads sends the same payload to measure the cached path.
+The question generator calls Gemini synchronously (~25 calls per paper
+request), so its endpoints take minutes per level at realistic latencies.
+
+Usage (from ai-services/):
+    python benchmarks/bench_load.py
+    python benchmarks/bench_load.py --endpoints check-answers,generate-sets --concurrency 1,8,32 --requests 64
+    python benchmarks/bench_load.py --latency 1.5 --failure-rate 0.05 --json results.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+import fixtures
+from mock_gemini import MockGeminiServer
+
+AI_SERVICES = Path(__file__).resolve().parent.parent
+
+# endpoint name -> (service, request builder taking the request index)
+Builder = Callable[[int, argparse.Namespace], dict]
+
+
+def check_answer_sheets(n: int, args: argparse.Namespace) -> dict:
+    question_pdf, answer_pdf, marks = fixtures.answer_sheet(n, args.sheet_questions, args.scanned)
+    return {"method": "POST", "url": "/check-answer-sheets",
+            "files": {"question_file": ("questions.pdf", question_pdf, "application/pdf"),
+                      "answer_file": ("answers.pdf", answer_pdf, "application/pdf")},
+            "data": {"marks": json.dumps(marks), "grading_mode": args.grading_mode}}
+
+
+def check_answers(n: int, args: argparse.Namespace) -> dict:
+    return {"method": "POST", "url": "/check-answers", "json": fixtures.check_answers_payload(n)}
+
+
+def upload_and_generate(n: int, args: argparse.Namespace) -> dict:
+    # The service writes uploads to temp_<filename> in its working directory, so names must not collide
+    return {"method": "POST", "url": "/upload-and-generate/",
+            "files": {"files": (f"bank-{n}.pdf", fixtures.question_bank_pdf(n), "application/pdf")},
+            "data": {"student_count": "5", "questions_per_bank": "5", "total_marks": "50"}}
+
+
+def generate_sets(n: int, args: argparse.Namespace) -> dict:
+    return {"method": "POST", "url": "/api/generate-sets", "json": fixtures.generate_sets_payload(n)}
+
+
+def generate_papers(n: int, args: argparse.Namespace) -> dict:
+    return {"method": "POST", "url": "/api/generate-papers", "json": fixtures.generate_papers_payload(n)}
+
+
+ENDPOINTS: Dict[str, tuple] = {
+    "check-answer-sheets": ("answer-checker", check_answer_sheets),
+    "check-answers": ("answer-checker", check_answers),
+    "upload-and-generate": ("question-generator", upload_and_generate),
+    "generate-sets": ("question-generator", generate_sets),
+    "generate-papers": ("question-generator", generate_papers),
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def process_tree_rss(pid: int) -> int:
+    """Resident set size in bytes of `pid` plus all its descendants (Linux /proc; 0 elsewhere)."""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            for line in Path(f"/proc/{current}/status").read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1]) * 1024
+                    break
+            for task in Path(f"/proc/{current}/task").iterdir():
+                pending.extend(int(child) for child in (task / "children").read_text().split())
+        except (OSError, ValueError):
+            continue
+    return total
+
+
+class RSSSampler:
+    """Polls the service's process-tree RSS in a background thread and keeps the peak."""
+
+    def __init__(self, pid: int, interval: float = 0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, process_tree_rss(self.pid))
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "RSSSampler":
+        self.peak = process_tree_rss(self.pid)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+class ServiceProcess:
+    """One service under uvicorn, running from a staged copy of ai-services/<service> plus shared/."""
+
+    def __init__(self, service: str, work_dir: Path, env: Dict[str, str]):
+        self.service = service
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        root = work_dir / service / "ai-services"
+        ignore = shutil.ignore_patterns("__pycache__", "cache", ".env", "venv", "result_*.pdf")
+        shutil.copytree(AI_SERVICES / service, root / service, ignore=ignore)
+        shutil.copytree(AI_SERVICES / "shared", root / "shared", ignore=ignore)
+        self.cwd = root / service
+        # Same runtime directories the Dockerfiles create
+        for directory in ("static/uploads", "static/generated_papers"):
+            (self.cwd / directory).mkdir(parents=True, exist_ok=True)
+        self.log_path = work_dir / f"{service}.log"
+        self.env = {**os.environ, **env}
+        self.process: Optional[subprocess.Popen] = None
+
+    def start(self, timeout: float = 90.0):
+        self._log = open(self.log_path, "wb")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(self.port),
+             "--log-level", "warning"],
+            cwd=self.cwd, env=self.env, stdout=self._log, stderr=subprocess.STDOUT
+        )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"{self.service} exited during startup; see {self.log_path}")
+            try:
+                if httpx.get(f"{self.url}/openapi.json", timeout=1.0).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"{self.service} did not start within {timeout:.0f}s; see {self.log_path}")
+
+    def stop(self):
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self._log.close()
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+async def run_level(base_url: str, requests: List[dict], concurrency: int, timeout: float) -> dict:
+    """Send `requests` with at most `concurrency` in flight; returns latency and error stats."""
+    latencies, statuses = [], {}
+    next_index = 0
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal next_index
+        while next_index < len(requests):
+            request = requests[next_index]
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                response = await client.request(**request)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*[worker(client) for _ in range(concurrency)])
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(requests),
+        "errors": sum(count for status, count in statuses.items() if not status.startswith("2")),
+        "statuses": statuses,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "throughput": len(requests) / elapsed if elapsed else 0.0,
+        "seconds": elapsed,
+    }
+
+
+def service_env(service: str, mock_url: str, args: argparse.Namespace) -> Dict[str, str]:
+    env = {
+        "GEMINI_API_ENDPOINT": mock_url,
+        "GEMINI_RPM": str(args.gemini_rpm),
+        "GEMINI_TPM": str(args.gemini_rpm * 10000),
+        "PYTHONUNBUFFERED": "1",
+    }
+    if service == "answer-checker":
+        env["GEMINI_API_KEY"] = "benchmark-key"
+    else:
+        env["GOOGLE_API_KEY"] = "benchmark-key"
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help=f"comma-separated subset of: {', '.join(ENDPOINTS)}")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=16, help="requests per endpoint and concurrency level")
+    parser.add_argument("--warmup", type=int, default=2, help="unmeasured requests per endpoint before the first level")
+    parser.add_argument("--latency", type=float, default=0.8, help="mock Gemini seconds per call")
+    parser.add_argument("--jitter", type=float, default=0.3)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of mock Gemini calls failing with 429/503")
+    parser.add_argument("--gemini-rpm", type=int, default=100000, help="GEMINI_RPM passed to the services")
+    parser.add_argument("--grading-mode", default="per_question", choices=["per_question", "fused"])
+    parser.add_argument("--sheet-questions", type=int, default=8, help="questions per generated answer sheet")
+    parser.add_argument("--scanned", action="store_true", help="image-only answer sheets (exercises rasterise + OCR; needs Tesseract)")
+    parser.add_argument("--repeat-payloads", action="store_true", help="send one payload repeatedly (cache-hit path)")
+    parser.add_argument("--timeout", type=float, default=300.0, help="per-request client timeout in seconds")
+    parser.add_argument("--json", help="also write the results to this JSON file")
+    parser.add_argument("--keep", action="store_true", help="keep the staged services and their logs")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    endpoints = [name.strip() for name in args.endpoints.split(",") if name.strip()]
+    unknown = [name for name in endpoints if name not in ENDPOINTS]
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(unknown)}")
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    mock = MockGeminiServer(latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate, seed=0).start()
+    work_dir = Path(tempfile.mkdtemp(prefix="examzone-bench-"))
+    print(f"Mock Gemini at {mock.url} (latency {args.latency}s +/- {args.jitter}s, failure rate {args.failure_rate:.0%}); "
+          f"staging services in {work_dir}")
+    print(f"{'endpoint':<22}{'conc':>5}{'reqs':>6}{'errors':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'req/s':>8}{'gemini':>8}{'peak RSS MB':>13}")
+
+    results = []
+    services = list(dict.fromkeys(ENDPOINTS[name][0] for name in endpoints))
+    sequence = 0
+    try:
+        for service in services:
+            process = ServiceProcess(service, work_dir, service_env(service, mock.url, args))
+            try:
+                process.start()
+                for name in [name for name in endpoints if ENDPOINTS[name][0] == service]:
+                    build: Builder = ENDPOINTS[name][1]
+                    if args.warmup:
+                        asyncio.run(run_level(process.url, [build(-1 - i, args) for i in range(args.warmup)], 1, args.timeout))
+                    for level in levels:
+                        requests = [build(0 if args.repeat_payloads else sequence + i, args) for i in range(args.requests)]
+                        sequence += args.requests
+                        calls_before = mock.stats["requests"]
+                        with RSSSampler(process.process.pid) as rss:
+                            stats = asyncio.run(run_level(process.url, requests, level, args.timeout))
+                        stats.update({"endpoint": name, "service": service, "concurrency": level,
+                                      "geminiCalls": mock.stats["requests"] - calls_before, "peakRssBytes": rss.peak})
+                        results.append(stats)
+                        print(f"{name:<22}{level:>5}{stats['requests']:>6}{stats['errors']:>7}"
+                              f"{stats['p50'] * 1000:>9.0f}{stats['p95'] * 1000:>9.0f}{stats['p99'] * 1000:>9.0f}"
+                              f"{stats['throughput']:>8.2f}{stats['geminiCalls']:>8}{rss.peak / 2 ** 20:>13.1f}")
+                        if stats["errors"]:
+                            print(f"    statuses: {stats['statuses']}")
+            finally:
+                process.stop()
+    finally:
+        mock.stop()
+        if args.keep:
+            print(f"Kept staged services and logs in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"Mock Gemini served {mock.stats['requests']} calls ({mock.stats['failures']} injected failures)")
+    if args.json:
+        Path(args.json).write_text(json.dumps({
+            "settings": {key: value for key, value in vars(args).items() if key != "json"},
+            "results": results,
+            "mock": mock.stats,
+        }, indent=2))
+        print(f"Wrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+OCR backend benchmark: warm tesserocr engine vs pytesseract subprocess per call.
+
+Renders synthetic answer-sheet snippets of a few sizes and OCRs each one with
+both backends, reporting engine start-up time and per-image latency.
+
+Usage (from ai-services/):
+    python benchmarks/bench_ocr_backends.py --iterations 20
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from PIL import Image, ImageDraw, ImageFont
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "answer-checker"))
+
+from ocr_backends import PytesseractBackend, TesserocrBackend, PyTessBaseAPI  # noqa: E402
+
+SAMPLE_LINES = [
+    "1. Photosynthesis converts light energy into chemical energy.",
+    "2. The mitochondria is the powerhouse of the cell.",
+    "3. Newton's first law: a body stays at rest unless acted upon.",
+    "4. The area of a circle is pi r squared.",
+]
+
+
+def render_sample(lines: int, width: int = 1600) -> Image.Image:
+    try:
+        font = ImageFont.truetype("DejaVuSans.ttf", 32)
+    except OSError:
+        font = ImageFont.load_default()
+    line_height = 56
+    image = Image.new("L", (width, 40 + lines * line_height), 255)
+    draw = ImageDraw.Draw(image)
+    for i in range(lines):
+        draw.text((30, 20 + i * line_height), SAMPLE_LINES[i % len(SAMPLE_LINES)], fill=0, font=font)
+    return image
+
+
+def bench(backend, images, iterations: int, psm: int) -> dict:
+    timings = []
+    for _ in range(iterations):
+        for image in images:
+            start = time.perf_counter()
+            backend.image_to_string(image, psm)
+            timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {
+        "mean_ms": statistics.mean(timings) * 1000,
+        "p50_ms": timings[len(timings) // 2] * 1000,
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--psm", type=int, default=6)
+    parser.add_argument("--lang", default="eng")
+    args = parser.parse_args()
+
+    images = [render_sample(lines) for lines in (1, 4, 16)]
+    backends = [("pytesseract", PytesseractBackend)]
+    if PyTessBaseAPI is not None:
+        backends.append(("tesserocr", TesserocrBackend))
+    else:
+        print("tesserocr is not installed; only benchmarking pytesseract")
+
+    print(f"{'backend':<12} {'startup ms':>10} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    for name, backend_cls in backends:
+        start = time.perf_counter()
+        try:
+            backend = backend_cls(args.lang)
+            startup_ms = (time.perf_counter() - start) * 1000
+            stats = bench(backend, images, args.iterations, args.psm)
+        except Exception as e:
+            print(f"{name:<12} skipped: {str(e)}")
+            continue
+        print(f"{name:<12} {startup_ms:>10.1f} {stats['mean_ms']:>9.1f} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f}")
+        if hasattr(backend, "close"):
+            backend.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Local pre-grader benchmark: how many answers and Gemini prompts it saves.
+
+Reads /check-answers payloads ({questions: [...], totalMarks, attemptId}) from
+a JSON list or JSONL file, or generates a synthetic exam corpus (MCQ, numeric,
+short factual and descriptive questions with a mix of correct, reformatted,
+wrong, blank and paraphrased answers). Prompts are counted the way
+/check-answers chunks them: an attempt's prompt is only saved when every
+question in it is decided locally.
+
+The exam corpus is not part of the repository: the synthetic corpus only
+exercises every decision path, and its savings are not a measurement of real
+exams. Export /check-answers payloads and pass them with --corpus for that.
+
+Usage (from ai-services/):
+    python benchmarks/bench_pregrader.py --attempts 300
+    python benchmarks/bench_pregrader.py --corpus exports/attempts.jsonl
+"""
+import argparse
+import collections
+import json
+import logging
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "answer-checker"))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "shared"))
+
+from grading import BATCH_PROMPT_TOKENS, chunk_by_token_budget, estimate_tokens  # noqa: E402
+from pregrader import pregrade  # noqa: E402
+
+QUESTIONS = [
+    {"id": "q1", "text": "Which gas do plants absorb? (a) Oxygen (b) Carbon dioxide (c) Nitrogen (d) Helium",
+     "marks": 1, "expectedAnswer": "b", "answers": ["b", "(b)", "Carbon dioxide", "a", "c", "option b"]},
+    {"id": "q2", "text": "Which planet is largest? (a) Mars (b) Earth (c) Jupiter (d) Venus",
+     "marks": 1, "expectedAnswer": "c", "answers": ["c", "Jupiter", "(c)", "b", "d"]},
+    {"id": "q3", "text": "What is 12 x 12?", "marks": 1, "expectedAnswer": "144", "answers": ["144", "144.0", "124", "1,44"]},
+    {"id": "q4", "text": "Write 3/4 as a decimal.", "marks": 1, "expectedAnswer": "0.75", "answers": ["0.75", "3/4", ".75", "0.7"]},
+    {"id": "q5", "text": "What is the capital of France?", "marks": 1, "expectedAnswer": "Paris",
+     "answers": ["Paris", "paris.", "PARIS", "Lyon", "The capital is Paris"]},
+    {"id": "q6", "text": "Name the powerhouse of the cell.", "marks": 2, "expectedAnswer": "Mitochondria",
+     "answers": ["mitochondria", "Mitochondrion", "the mitochondria", "nucleus"]},
+    {"id": "q7", "text": "Define photosynthesis.", "marks": 5,
+     "expectedAnswer": "Photosynthesis is the process by which green plants use sunlight, water and carbon dioxide to make glucose and release oxygen.",
+     "answers": [
+         "Photosynthesis is the process by which green plants use sunlight, water and carbon dioxide to make glucose and release oxygen.",
+         "Photosynthesis is the process in which green plants use sunlight, water and carbon dioxide to make glucose and release oxygen",
+         "Plants make their food from sunlight and give out oxygen.",
+         "It is how plants breathe at night.",
+     ]},
+    {"id": "q8", "text": "Explain Newton's third law with an example.", "marks": 5,
+     "expectedAnswer": "For every action there is an equal and opposite reaction, for example a rocket pushes gas backwards and moves forwards.",
+     "answers": [
+         "Every action has an equal and opposite reaction. When you jump off a boat, the boat moves back.",
+         "For every action there is an equal and opposite reaction, for example a rocket pushes gas backwards and moves forwards.",
+         "Force equals mass times acceleration.",
+     ]},
+]
+
+
+def synthetic_corpus(attempts: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    corpus = []
+    for n in range(attempts):
+        questions = []
+        for q in QUESTIONS:
+            answer = "" if rng.random() < 0.05 else rng.choice(q["answers"])
+            questions.append({key: value for key, value in q.items() if key != "answers"} | {"studentAnswer": answer})
+        corpus.append({"attemptId": f"synthetic-{n}", "questions": questions,
+                       "totalMarks": sum(q["marks"] for q in QUESTIONS)})
+    return corpus
+
+
+def load_corpus(path: str) -> list:
+    text = Path(path).read_text(encoding="utf-8")
+    if text.lstrip().startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def prompt_tokens(questions: list) -> int:
+    return sum(estimate_tokens(str(q.get(field) or "")) + 30
+               for q in questions for field in ("text", "expectedAnswer", "studentAnswer"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="JSON list or JSONL of /check-answers payloads")
+    parser.add_argument("--attempts", type=int, default=300, help="synthetic attempts when no corpus is given")
+    parser.add_argument("--token-budget", type=int, default=6000)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.attempts)
+    # Questions share what the prompt template leaves of the budget, as in GradingEngine
+    question_budget = max(1, args.token_budget - BATCH_PROMPT_TOKENS)
+    methods = collections.Counter()
+    total_questions = 0
+    prompts_before = prompts_after = 0
+    tokens_before = tokens_after = 0
+    elapsed = 0.0
+    distinct = collections.defaultdict(dict)
+    for payload in corpus:
+        questions = payload.get("questions") or []
+        total_questions += len(questions)
+        start = time.perf_counter()
+        decided = pregrade(questions)
+        elapsed += time.perf_counter() - start
+        methods.update(ev["method"] for ev in decided.values())
+        remaining = [(i, q) for i, q in enumerate(questions, 1) if i - 1 not in decided]
+        prompts_before += len(chunk_by_token_budget(list(enumerate(questions, 1)), question_budget))
+        prompts_after += len(chunk_by_token_budget(remaining, question_budget)) if remaining else 0
+        tokens_before += prompt_tokens(questions)
+        tokens_after += prompt_tokens([q for _, q in remaining])
+        for i, q in enumerate(questions):
+            if str(q.get("studentAnswer") or "").strip():
+                distinct[(q.get("text"), q.get("expectedAnswer"))].setdefault(q["studentAnswer"], i not in decided)
+
+    # /check-answers/bulk: one prompt group per question over its distinct non-blank answers
+    def bulk_prompts(only_undecided: bool) -> int:
+        return sum(
+            len(chunk_by_token_budget([(n, {"studentAnswer": answer}) for n, answer in enumerate(selected)], args.token_budget))
+            for answers in distinct.values()
+            for selected in [[a for a, undecided in answers.items() if undecided or not only_undecided]] if selected
+        )
+
+    decided_total = sum(methods.values())
+    source = args.corpus or f"synthetic ({len(corpus)} attempts x {len(QUESTIONS)} questions; not the exam corpus)"
+    print(f"Corpus: {source}")
+    print(f"Answers decided locally: {decided_total}/{total_questions} ({decided_total / max(1, total_questions):.1%})")
+    for method, count in methods.most_common():
+        print(f"  {method:<11} {count}")
+    print(f"Gemini prompts (/check-answers): {prompts_before} -> {prompts_after} "
+          f"({prompts_before - prompts_after} saved, {(prompts_before - prompts_after) / max(1, prompts_before):.1%})")
+    print(f"Gemini prompts (/check-answers/bulk): {bulk_prompts(False)} -> {bulk_prompts(True)}")
+    print(f"Estimated prompt tokens: {tokens_before} -> {tokens_after} "
+          f"({(tokens_before - tokens_after) / max(1, tokens_before):.1%} saved)")
+    print(f"Pre-grader time: {elapsed * 1000:.1f} ms total, {elapsed * 1e6 / max(1, total_questions):.1f} us per answer")
+
+
+if __name__ == "__main__":
+    main()
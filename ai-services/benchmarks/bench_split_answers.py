@@ -0,0 +1,107 @@
+"""
+Answer segmentation micro-benchmarks (pytest-benchmark).
+
+Synthetic OCR output from 1 KB to 1 MB (a whole class's answer sheets
+concatenated) is split with the regex splitter, with and without question
+markers, and with the layout segmenter on matching word boxes. The bytes
+processed are recorded in each benchmark's extra_info for throughput.
+
+Usage (from ai-services/; needs pytest and pytest-benchmark):
+    python -m pytest benchmarks/bench_split_answers.py
+    python -m pytest benchmarks/bench_split_answers.py --benchmark-json split.json
+    python benchmarks/bench_split_answers.py -k 1MB
+"""
+import random
+import sys
+from pathlib import Path
+from typing import List, Tuple
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "answer-checker"))
+
+from segmentation import Word, segment_by_layout, split_answers  # noqa: E402
+
+from fixtures import TOPICS  # noqa: E402
+
+SIZES = {"1KB": 1 << 10, "16KB": 16 << 10, "128KB": 128 << 10, "1MB": 1 << 20}
+MARKERS = ["{n}. ", "{n}) ", "Q{n} ", "{n}: ", "({n}) "]
+# Typical Tesseract confusions and debris on handwritten sheets
+NOISE = [("l", "1"), ("O", "0"), ("rn", "m"), ("e", "c")]
+DEBRIS = [" ~", " |", " —", " ;", "..", " ©"]
+
+
+def noisy(words: List[str], rng: random.Random) -> List[str]:
+    out = []
+    for word in words:
+        if rng.random() < 0.08:
+            old, new = rng.choice(NOISE)
+            word = word.replace(old, new, 1)
+        if rng.random() < 0.03:
+            word += rng.choice(DEBRIS)
+        out.append(word)
+    return out
+
+
+def synthetic_sheet(size: int, marked: bool = True, seed: int = 0) -> Tuple[str, int, List[Word]]:
+    """(OCR text of about `size` bytes, number of answers, word boxes of the same answers)."""
+    rng = random.Random(seed)
+    vocabulary = " ".join(answer for _, answer in TOPICS).split()
+    lines, words = [], []
+    y, page, n = 40, 1, 0
+    while sum(len(line) + 1 for line in lines) < size:
+        n += 1
+        body = noisy([rng.choice(vocabulary) for _ in range(rng.randint(8, 60))], rng)
+        prefix = rng.choice(MARKERS).format(n=n) if marked else ""
+        per_line = rng.randint(6, 12)
+        for start in range(0, len(body), per_line):
+            chunk = body[start:start + per_line]
+            if start == 0 and prefix:
+                chunk = [prefix.strip()] + chunk
+            lines.append(("  " if start else "") + " ".join(chunk))
+            x = 40 if start == 0 else 70
+            for token in chunk:
+                words.append((page, x, y, x + 9 * len(token), y + 18, token))
+                x += 9 * len(token) + 8
+            y += 28
+            if y > 1100:
+                page, y = page + 1, 40
+    return "\n".join(lines), n, words
+
+
+@pytest.fixture(scope="module", params=list(SIZES), ids=list(SIZES))
+def sheet(request):
+    return request.param, synthetic_sheet(SIZES[request.param])
+
+
+@pytest.fixture(scope="module", params=list(SIZES), ids=list(SIZES))
+def unmarked_sheet(request):
+    return request.param, synthetic_sheet(SIZES[request.param], marked=False)
+
+
+def test_split_by_markers(benchmark, sheet):
+    label, (text, count, _) = sheet
+    benchmark.group = f"split_answers {label}"
+    benchmark.extra_info["bytes"] = len(text.encode())
+    answers = benchmark(split_answers, text, count)
+    assert len(answers) == count
+
+
+def test_split_by_chunks(benchmark, unmarked_sheet):
+    label, (text, count, _) = unmarked_sheet
+    benchmark.group = f"split_answers {label}"
+    benchmark.extra_info["bytes"] = len(text.encode())
+    answers = benchmark(split_answers, text, count)
+    assert len(answers) == count
+
+
+def test_segment_by_layout(benchmark, sheet):
+    label, (text, count, words) = sheet
+    benchmark.group = f"split_answers {label}"
+    benchmark.extra_info["bytes"] = len(text.encode())
+    answers = benchmark(segment_by_layout, words, count)
+    assert answers is not None and len(answers) == count
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, *sys.argv[1:]]))
@@ -0,0 +1,143 @@
+"""
+Generated inputs for the load benchmarks: answer-sheet PDFs, question-bank
+PDFs and JSON payloads for both services. Every builder takes a request
+index `n` so consecutive requests differ (and miss the services' caches)
+unless the caller passes the same index.
+"""
+import io
+import random
+from typing import List, Tuple
+
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+from bench_pregrader import QUESTIONS, synthetic_corpus
+
+TOPICS = [
+    ("photosynthesis", "Plants use sunlight, water and carbon dioxide to make glucose and oxygen"),
+    ("Newton's third law", "Every action has an equal and opposite reaction"),
+    ("the water cycle", "Water evaporates, condenses into clouds and falls as precipitation"),
+    ("the Pythagorean theorem", "In a right triangle a^2 + b^2 = c^2"),
+    ("osmosis", "Water moves through a semi-permeable membrane from low to high solute concentration"),
+    ("an ecosystem", "A community of organisms interacting with their physical environment"),
+    ("inflation", "A general rise in prices that reduces the purchasing power of money"),
+    ("the French Revolution", "It began in 1789 and ended the absolute monarchy in France"),
+]
+
+
+def text_pdf(lines: List[str]) -> bytes:
+    """Single- or multi-page PDF with a text layer (the services read it without OCR)."""
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    y = height - 60
+    for line in lines:
+        if y < 60:
+            pdf.showPage()
+            y = height - 60
+        pdf.drawString(50, y, line)
+        y -= 22
+    pdf.save()
+    return buffer.getvalue()
+
+
+def scanned_pdf(lines: List[str], dpi: int = 150) -> bytes:
+    """Image-only PDF of the same lines, so the answer checker has to rasterise and OCR it."""
+    from PIL import Image, ImageDraw, ImageFont
+
+    page_width, page_height = int(8.27 * dpi), int(11.69 * dpi)
+    line_height = dpi // 4
+    try:
+        font = ImageFont.load_default(size=dpi // 7)
+    except TypeError:  # Pillow < 10.1 has a single fixed-size default font
+        font = ImageFont.load_default()
+    pages, page, y = [], None, 0
+    for line in lines:
+        if page is None or y > page_height - 2 * line_height:
+            page = Image.new("L", (page_width, page_height), 255)
+            pages.append(page)
+            y = line_height * 2
+        ImageDraw.Draw(page).text((dpi // 2, y), line, fill=0, font=font)
+        y += line_height
+    buffer = io.BytesIO()
+    pages[0].save(buffer, format="PDF", resolution=dpi, save_all=True, append_images=pages[1:])
+    return buffer.getvalue()
+
+
+def answer_sheet(n: int, questions: int = 8, scanned: bool = False) -> Tuple[bytes, bytes, List[int]]:
+    """(question PDF, answer PDF, marks) for one student; answers vary with `n`."""
+    rng = random.Random(n)
+    topics = [TOPICS[i % len(TOPICS)] for i in range(questions)]
+    question_lines = [f"{i}. Explain {topic} in your own words." for i, (topic, _) in enumerate(topics, 1)]
+    answer_lines = []
+    for i, (topic, model_answer) in enumerate(topics, 1):
+        words = model_answer.split()
+        keep = rng.randint(max(1, len(words) // 2), len(words))
+        answer_lines.append(f"{i}. {' '.join(words[:keep])} (student {n})")
+    render = scanned_pdf if scanned else text_pdf
+    return text_pdf(question_lines), render(answer_lines), [rng.choice([2, 3, 5]) for _ in range(questions)]
+
+
+def check_answers_payload(n: int) -> dict:
+    """One /check-answers attempt with the pre-grader benchmark's mix of answer kinds."""
+    attempt = synthetic_corpus(1, seed=n)[0]
+    attempt["attemptId"] = f"bench-{n}"
+    return attempt
+
+
+def question_bank_pdf(n: int, questions: int = 30) -> bytes:
+    """Numbered question bank in the layout /upload-and-generate/ extracts from."""
+    rng = random.Random(n)
+    lines = []
+    for i in range(1, questions + 1):
+        a, b = rng.randint(2, 99), rng.randint(2, 99)
+        topic, _ = TOPICS[i % len(TOPICS)]
+        lines.append(rng.choice([
+            f"{i}. Calculate the value of {a} x {b} and show your working",
+            f"{i}. Explain {topic} with a suitable example from chapter {a % 12 + 1}",
+            f"{i}. A box contains {a % 9 + 1} red and {b % 9 + 1} blue balls. One ball is drawn; find the probability it is red",
+        ]))
+    return text_pdf(lines)
+
+
+def normalized_questions(count: int, seed: int = 0) -> List[dict]:
+    rng = random.Random(seed)
+    base = [q["text"] for q in QUESTIONS] + [f"Explain {topic}." for topic, _ in TOPICS]
+    return [{
+        "questionText": f"{base[i % len(base)]} ({i + 1})",
+        "marks": rng.choice([1, 2, 5]),
+        "topic": "General",
+        "difficulty": rng.choice(["easy", "medium", "hard"]),
+        "options": [],
+        "correctAnswer": ""
+    } for i in range(count)]
+
+
+def generate_sets_payload(n: int, questions: int = 60, sets: int = 10) -> dict:
+    return {
+        "questions": normalized_questions(questions, seed=n),
+        "number_of_sets": sets,
+        "total_marks": 100,
+        "minimum_questions": 10,
+        "balance_difficulty": True,
+        "shuffle_variants": True
+    }
+
+
+def generate_papers_payload(n: int, students: int = 5) -> dict:
+    return {
+        "exam_id": f"bench-{n}",
+        "class_id": "bench-class",
+        "student_count": students,
+        "questions_per_bank": 5,
+        "sets_per_student": 2,
+        "custom_title": "Benchmark Examination",
+        "course_name": "General Science",
+        "section": "A",
+        "total_marks": 50,
+        "student_details": [
+            {"name": f"Student {i + 1}", "reg_no": f"{n:04d}{i:03d}", "student_id": f"student-{n}-{i}"}
+            for i in range(students)
+        ],
+        "question_sources": []
+    }
@@ -0,0 +1,194 @@
+"""
+Local stand-in for the Gemini REST API, for benchmarks and load tests.
+
+Serves GET /v1beta/models and POST /v1beta/models/<model>:generateContent
+with a configurable latency and failure rate. Replies are shaped after the
+prompt (enhance, check, fused sheet, /check-answers batch, bulk question
+group, question completion, question normalisation) so both services parse
+them like real Gemini output.
+
+Point a service at it with GEMINI_API_ENDPOINT=http://127.0.0.1:<port> and a
+dummy GEMINI_API_KEY / GOOGLE_API_KEY.
+
+Usage (from ai-services/):
+    python benchmarks/mock_gemini.py --port 8089 --latency 0.8 --jitter 0.4 --failure-rate 0.02
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+MODELS = ["models/gemini-2.0-flash-001", "models/gemini-pro"]
+
+FAILURES = [
+    (429, "RESOURCE_EXHAUSTED", "Resource has been exhausted (e.g. check quota)."),
+    (503, "UNAVAILABLE", "The model is overloaded. Please try again later."),
+]
+
+
+def marks_for(rng: random.Random, max_marks: int) -> int:
+    return rng.choice([max_marks, max_marks, max_marks // 2, 0])
+
+
+def respond(prompt: str, rng: random.Random) -> str:
+    """Reply text for a prompt built by one of the services."""
+    if '"questionEvaluations"' in prompt:
+        evaluated = [(int(n), int(m)) for n, m in re.findall(r"\nQuestion (\d+) \(Max (\d+) marks\)", prompt)]
+        return json.dumps({
+            "questionEvaluations": [
+                {"questionNumber": n, "marksAwarded": marks_for(rng, m), "maxMarks": m,
+                 "feedback": "The answer covers the main points."}
+                for n, m in evaluated
+            ],
+            "overallFeedback": "Good attempt overall; revise the weaker topics."
+        })
+    if '"evaluations"' in prompt:
+        header = re.search(r"Question \(Max (\d+) marks\)", prompt)
+        max_marks = int(header.group(1)) if header else 1
+        return json.dumps({"evaluations": [
+            {"answerNumber": int(n), "marksAwarded": marks_for(rng, max_marks), "feedback": "Partially correct."}
+            for n in re.findall(r"\nAnswer (\d+):\n", prompt)
+        ]})
+    if '"results"' in prompt:
+        return json.dumps({"results": [
+            {"questionNumber": int(n), "cleanedText": answer.strip(), "status": rng.choice(["Correct", "Correct", "Wrong"]),
+             "feedback": "Matches the key idea of the question."}
+            for n, answer in re.findall(r"Extracted Answer (\d+): (.*)", prompt)
+        ]})
+    if "Status: [Correct/Wrong/Unclear]" in prompt:
+        status = rng.choice(["Correct", "Correct", "Wrong", "Unclear"])
+        return f"Status: {status}\nFeedback: The answer was judged {status.lower()} against the question."
+    extracted = re.search(r"Extracted Text: (.*)", prompt)
+    if extracted:
+        return extracted.group(1).strip() or "Unclear answer"
+    if "Provide response in this exact JSON format" in prompt:
+        question = re.search(r"Question: (.*)", prompt)
+        return json.dumps({
+            "questionText": question.group(1).strip() if question else "",
+            "marks": 5, "topic": "General", "difficulty": rng.choice(["easy", "medium", "hard"]),
+            "options": [], "correctAnswer": ""
+        })
+    completion = re.search(r'Question: "(.*)"', prompt)
+    if completion:
+        question = completion.group(1).strip()
+        return question if question.endswith(("?", ".", "!")) else f"{question}?"
+    return "OK"
+
+
+class MockGeminiServer:
+    """
+    Threaded HTTP server; each request sleeps `latency` +/- `jitter` seconds
+    and fails with 429/503 with probability `failure_rate`.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.5,
+                 jitter: float = 0.0, failure_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.stats = {"requests": 0, "failures": 0, "promptChars": 0}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockGeminiServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _draw(self, prompt: str):
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["promptChars"] += len(prompt)
+            delay = max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+            failure = self.rng.choice(FAILURES) if self.rng.random() < self.failure_rate else None
+            if failure:
+                self.stats["failures"] += 1
+            reply = None if failure else respond(prompt, self.rng)
+        return delay, failure, reply
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, status: int, body: dict):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path.split("?")[0].rstrip("/").endswith("/models"):
+                    self.send_json(200, {"models": [
+                        {"name": name, "supportedGenerationMethods": ["generateContent", "countTokens"]} for name in MODELS
+                    ]})
+                else:
+                    self.send_json(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                if ":generateContent" not in self.path:
+                    self.send_json(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+                    return
+                prompt = "".join(part.get("text", "") for content in request.get("contents", [])
+                                 for part in content.get("parts", []))
+                delay, failure, reply = server._draw(prompt)
+                time.sleep(delay)
+                if failure:
+                    code, status, message = failure
+                    self.send_json(code, {"error": {"code": code, "message": message, "status": status}})
+                    return
+                prompt_tokens = len(prompt) // 4 + 1
+                reply_tokens = len(reply) // 4 + 1
+                self.send_json(200, {
+                    "candidates": [{"content": {"parts": [{"text": reply}], "role": "model"}, "finishReason": "STOP", "index": 0}],
+                    "usageMetadata": {"promptTokenCount": prompt_tokens, "candidatesTokenCount": reply_tokens,
+                                      "totalTokenCount": prompt_tokens + reply_tokens}
+                })
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.8, help="seconds per generateContent call")
+    parser.add_argument("--jitter", type=float, default=0.3, help="uniform +/- seconds added to the latency")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of calls answered with 429/503")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    server = MockGeminiServer(args.host, args.port, args.latency, args.jitter, args.failure_rate, args.seed)
+    print(f"Mock Gemini listening on {server.url} (latency {args.latency}s +/- {args.jitter}s, failure rate {args.failure_rate:.0%})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Served {server.stats['requests']} requests ({server.stats['failures']} injected failures)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,14 @@
 from fastapi import FastAPI, File, UploadFile, Form, HTTPException
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from starlette.requests import Request
+import anyio
 import random
 import os
 import logging
 import shutil
+import time
 from typing import List, Optional
 from pathlib import Path
 import pdfplumber
@@ -15,28 +17,43 @@ import zipfile
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
 import re
+import sys
 import google.generativeai as genai
 from google.api_core import exceptions
 import pandas as pd
 from dotenv import load_dotenv
 
+# Modules shared between the AI services (ai-services/shared; copied next to main.py in the image)
+sys.path.append(str(Path(__file__).resolve().parent.parent / "shared"))
+from admission import AdmissionController, AdmissionMiddleware  # noqa: E402
+from gemini_client import GeminiClient, GeminiError, configure_genai  # noqa: E402
+from metrics import CONTENT_TYPE, Registry, admission_families, gemini_client_families, instrument_app  # noqa: E402
+
 # Load environment variables
 load_dotenv()
 
 app = FastAPI()
 
+# Prometheus metrics served on /metrics: latency per pipeline stage (extract, complete, sample,
+# render, plus the Gemini calls behind complete/normalize), HTTP latency and Gemini counters
+metrics_registry = Registry("question_generator_")
+STAGE_SECONDS = metrics_registry.histogram(
+    "stage_duration_seconds", "Time spent in each pipeline stage", ("stage",))
+http_in_flight = instrument_app(app, metrics_registry)
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Configure Gemini API
+# Configure Gemini API (GEMINI_API_ENDPOINT: alternative endpoint reached over REST, e.g. the benchmark mock)
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT") or None
 if not GOOGLE_API_KEY:
     logger.error("GOOGLE_API_KEY not set. Please set it in .env file.")
     raise RuntimeError("GOOGLE_API_KEY environment variable is required")
 else:
     try:
-        genai.configure(api_key=GOOGLE_API_KEY)
+        configure_genai(GOOGLE_API_KEY, GEMINI_API_ENDPOINT)
         models = genai.list_models()
         logger.info(f"Attempting to list models with API key: {GOOGLE_API_KEY[:8]}...")
         if models:
@@ -61,6 +78,24 @@ else:
         logger.error(f"Unexpected error during Gemini API setup: {str(e)}")
         GOOGLE_API_KEY = None
 
+# One shared client for every Gemini call: the model object is reused, requests and tokens go
+# through token buckets, transient errors are retried with jittered backoff, and an open
+# circuit breaker sends callers straight to their manual fallbacks while Gemini is down
+gemini = None
+if GOOGLE_API_KEY:
+    gemini = GeminiClient(
+        available_model,
+        api_key=GOOGLE_API_KEY,
+        api_endpoint=GEMINI_API_ENDPOINT,
+        requests_per_minute=int(os.getenv("GEMINI_RPM") or 60),
+        tokens_per_minute=int(os.getenv("GEMINI_TPM") or 1000000),
+        max_retries=int(os.getenv("GEMINI_MAX_RETRIES") or 2),
+        timeout=float(os.getenv("GEMINI_TIMEOUT_SECONDS") or 60),
+        failure_threshold=int(os.getenv("GEMINI_BREAKER_THRESHOLD") or 5),
+        reset_timeout=float(os.getenv("GEMINI_BREAKER_RESET_SECONDS") or 30),
+        latency_observer=lambda seconds: STAGE_SECONDS.observe(seconds, stage="gemini")
+    )
+
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
@@ -73,6 +108,7 @@ def shuffle_array(array: List[str]) -> List[str]:
     random.shuffle(array_copy)
     return array_copy
 
+@STAGE_SECONDS.time(stage="extract")
 def extract_text_from_pdf(file: UploadFile) -> List[str]:
     temp_file_path = f"temp_{file.filename}"
     with open(temp_file_path, "wb") as temp_file:
@@ -123,6 +159,7 @@ def extract_text_from_pdf(file: UploadFile) -> List[str]:
     logger.info(f"Extracted {len(questions)} questions from PDF: {questions}")
     return questions
 
+@STAGE_SECONDS.time(stage="extract")
 def extract_text_from_docx(file: UploadFile) -> List[str]:
     doc = docx.Document(file.file)
     text = "\n".join([para.text for para in doc.paragraphs])
@@ -130,12 +167,14 @@ def extract_text_from_docx(file: UploadFile) -> List[str]:
     questions = [re.sub(r"^\s*\d+\.?\s*", "", q).strip() for q in questions]
     return questions
 
+@STAGE_SECONDS.time(stage="extract")
 def extract_text_from_txt(file: UploadFile) -> List[str]:
     content = file.file.read().decode("utf-8")
     questions = [q.strip() for q in content.split("\n") if q.strip()]
     questions = [re.sub(r"^\s*\d+\.?\s*", "", q).strip() for q in questions]
     return questions
 
+@STAGE_SECONDS.time(stage="complete")
 def validate_and_complete_question(question: str) -> str:
     if not GOOGLE_API_KEY:
         logger.warning("Gemini API unavailable; attempting manual completion.")
@@ -147,7 +186,6 @@ def validate_and_complete_question(question: str) -> str:
                      question.strip().endswith("the")) and not question.endswith("?") and not any(char in question for char in "?.!")
 
     try:
-        model = genai.GenerativeModel(available_model if available_model else 'models/gemini-2.0-flash-001')
         prompt = f"""
         Check if the following question is complete and well-formatted. If it’s incomplete, assume it’s a math or probability question unless clearly otherwise, and complete it into a clear, proper question with a solvable context or solution. Return only the final question.
 
@@ -174,8 +212,7 @@ def validate_and_complete_question(question: str) -> str:
         Input: "Photosynthesis"
         Output: "What is photosynthesis?"
         """
-        response = model.generate_content(prompt)
-        completed_question = response.text.strip()
+        completed_question = gemini.generate(prompt).strip()
         
         if is_incomplete and is_math_related:
             if "probability" in question.lower():
@@ -187,7 +224,7 @@ def validate_and_complete_question(question: str) -> str:
         
         logger.info(f"Completed question: '{question}' -> '{completed_question}'")
         return completed_question
-    except exceptions.GoogleAPIError as e:
+    except GeminiError as e:
         logger.error(f"Gemini API error: {str(e)}")
         return complete_question_manually(question)
     except Exception as e:
@@ -209,6 +246,7 @@ def complete_question_manually(question: str) -> str:
             return f"Solve: {question.strip()} = 10"
     return question + "?" if not question.endswith("?") else question
 
+@STAGE_SECONDS.time(stage="render")
 def generate_pdf(student_name: str, reg_no: str, set_no: str, custom_title: str, course_name: str, section: str, total_marks: int, questions: List[str], output_path: str):
     c = canvas.Canvas(output_path, pagesize=letter)
     c.setFont("Helvetica-Bold", 14)
@@ -302,7 +340,7 @@ async def read_root(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 @app.post("/upload-and-generate/")
-async def upload_and_generate(
+def upload_and_generate(
     files: List[UploadFile] = File(...),
     student_count: int = Form(...),
     questions_per_bank: int = Form(...),
@@ -374,20 +412,21 @@ async def upload_and_generate(
         student_name = f"Student_{i+1}"
         assignments[student_name] = []
         
-        for bank_idx, bank in enumerate(question_banks):
-            available_questions = [q for idx, q in enumerate(bank) if idx not in used_questions_per_bank[bank_idx]]
-            if len(available_questions) < questions_per_bank:
-                used_questions_per_bank[bank_idx].clear()
-                available_questions = bank.copy()
-            
-            shuffled_questions = shuffle_array(available_questions)
-            selected = shuffled_questions[:questions_per_bank]
-            
-            for question in selected:
-                question_idx = bank.index(question)
-                used_questions_per_bank[bank_idx].add(question_idx)
-            
-            assignments[student_name].extend(selected)
+        with STAGE_SECONDS.time(stage="sample"):
+            for bank_idx, bank in enumerate(question_banks):
+                available_questions = [q for idx, q in enumerate(bank) if idx not in used_questions_per_bank[bank_idx]]
+                if len(available_questions) < questions_per_bank:
+                    used_questions_per_bank[bank_idx].clear()
+                    available_questions = bank.copy()
+                
+                shuffled_questions = shuffle_array(available_questions)
+                selected = shuffled_questions[:questions_per_bank]
+                
+                for question in selected:
+                    question_idx = bank.index(question)
+                    used_questions_per_bank[bank_idx].add(question_idx)
+                
+                assignments[student_name].extend(selected)
         
         assignments[student_name] = [validate_and_complete_question(q) for q in assignments[student_name]]
         unique_sets[student_name] = assignments[student_name].copy()
@@ -450,6 +489,73 @@ async def get_zip():
         raise HTTPException(status_code=404, detail="ZIP file not found")
     return FileResponse(zip_path, media_type='application/zip', filename="student_questions.zip")
 
+@app.get("/gemini/stats")
+async def gemini_stats():
+    if not gemini:
+        return JSONResponse(status_code=503, content={"error": "Gemini API unavailable"})
+    return JSONResponse(content=gemini.metrics())
+
+# Admission control per endpoint class ('generate': /upload-and-generate/, /api/generate-papers; 'llm':
+# /api/normalize-questions, /api/generate-sets). Each admits ADMISSION_<CLASS>_MAX_IN_FLIGHT requests and
+# _MAX_MB of request bodies at once; the rest wait up to _MAX_WAIT_SECONDS in a queue of _MAX_QUEUE,
+# then get 429 + Retry-After (413 if one body exceeds _MAX_MB). Requests are admitted before any
+# threadpool worker is taken
+generate_admission = AdmissionController.from_env("generate", max_in_flight=4, max_queue=8, max_wait=10, max_mb=64)
+llm_admission = AdmissionController.from_env("llm", max_in_flight=8, max_queue=16, max_wait=10, max_mb=16)
+ADMISSION_CONTROLLERS = (generate_admission, llm_admission)
+app.add_middleware(AdmissionMiddleware, routes={
+    "/upload-and-generate/": generate_admission,
+    "/api/generate-papers": generate_admission,
+    "/api/normalize-questions": llm_admission,
+    "/api/generate-sets": llm_admission,
+})
+
+# Extraction, completion and rendering run in the AnyIO worker threadpool; /ready reports
+# "saturated" (503) once the share of busy threads reaches READY_MAX_SATURATION, or once an
+# admission class has every slot and queue place taken (READY_MAX_ADMISSION_SATURATION)
+READY_MAX_SATURATION = float(os.getenv("READY_MAX_SATURATION") or 1.0)
+READY_MAX_ADMISSION_SATURATION = float(os.getenv("READY_MAX_ADMISSION_SATURATION") or 1.0)
+
+def threadpool_usage() -> dict:
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    return {
+        "busy": limiter.borrowed_tokens,
+        "capacity": limiter.total_tokens,
+        "saturation": round(limiter.borrowed_tokens / limiter.total_tokens, 4)
+    }
+
+THREADPOOL_BUSY = metrics_registry.gauge("threadpool_busy", "Worker threads in use")
+THREADPOOL_CAPACITY = metrics_registry.gauge("threadpool_capacity", "Worker threads available")
+metrics_registry.collector(lambda: gemini_client_families(gemini))
+metrics_registry.collector(lambda: admission_families(ADMISSION_CONTROLLERS))
+
+@app.get("/metrics")
+async def metrics():
+    # The threadpool limiter belongs to the event loop, so it is sampled here rather than in a collector
+    pool = threadpool_usage()
+    THREADPOOL_BUSY.set(pool["busy"])
+    THREADPOOL_CAPACITY.set(pool["capacity"])
+    return Response(content=metrics_registry.render(), media_type=CONTENT_TYPE)
+
+@app.get("/health")
+async def health():
+    return JSONResponse(content={"status": "ok"})
+
+@app.get("/ready")
+async def ready():
+    pool = threadpool_usage()
+    admission = {controller.name: controller.stats() for controller in ADMISSION_CONTROLLERS}
+    saturated = ["threadpool"] if pool["saturation"] >= READY_MAX_SATURATION else []
+    saturated += [f"admission:{name}" for name, stats in admission.items() if stats["saturation"] >= READY_MAX_ADMISSION_SATURATION]
+    return JSONResponse(status_code=503 if saturated else 200, content={
+        "status": "saturated" if saturated else "ready",
+        "saturated": saturated,
+        "threadpool": pool,
+        "admission": admission,
+        "httpInFlight": http_in_flight.value(),
+        "geminiCircuit": gemini.breaker.state if gemini else None
+    })
+
 # PHASE 6.3 - AI Integration Bridge Endpoint
 # This endpoint accepts structured JSON from Node.js backend
 # NO CHANGES TO EXISTING AI LOGIC - only new interface
@@ -501,7 +607,7 @@ class GenerateSetsRequest(BaseModel):
 
 # PHASE 6.3 - AI Normalization Endpoint
 @app.post("/api/normalize-questions")
-async def normalize_questions(request: QuestionSourceRequest):
+def normalize_questions(request: QuestionSourceRequest):
     """
     TASK 2 - AI Question Normalization
     
@@ -588,6 +694,7 @@ async def normalize_questions(request: QuestionSourceRequest):
         raise HTTPException(status_code=500, detail=f"Normalization failed: {str(e)}")
 
 
+@STAGE_SECONDS.time(stage="normalize")
 def normalize_single_question_with_ai(question_text: str, question_num: int, total_marks: int, total_questions: int, question_mode: str = 'teacher_provided') -> dict:
     """
     Use Gemini AI to normalize a single question and extract metadata
@@ -608,8 +715,6 @@ def normalize_single_question_with_ai(question_text: str, question_num: int, tot
         }
     
     try:
-        model = genai.GenerativeModel(available_model)
-        
         # PHASE 6.3.6: Different prompts based on mode
         if question_mode == 'teacher_provided':
             prompt = f"""Analyze this teacher-provided exam question and extract metadata. DO NOT modify the question content.
@@ -651,8 +756,7 @@ Total questions: {total_questions}
 Suggested marks per question: {max(1, total_marks // max(1, total_questions))}
 """
         
-        response = model.generate_content(prompt)
-        response_text = response.text.strip()
+        response_text = gemini.generate(prompt).strip()
         
         # Extract JSON from response
         json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
@@ -700,6 +804,7 @@ async def generate_sets(request: GenerateSetsRequest):
         
         generated_sets = []
         
+        sampling_started = time.perf_counter()
         for set_num in range(request.number_of_sets):
             # Balance difficulty across sets
             if request.balance_difficulty:
@@ -744,6 +849,7 @@ async def generate_sets(request: GenerateSetsRequest):
                 "questionCount": len(set_questions)
             })
         
+        STAGE_SECONDS.observe(time.perf_counter() - sampling_started, stage="sample")
         logger.info(f"[Generate Sets] Generated {len(generated_sets)} sets")
         
         return JSONResponse(content={
@@ -758,7 +864,7 @@ async def generate_sets(request: GenerateSetsRequest):
 
 
 @app.post("/api/generate-papers")
-async def generate_papers_json(request: GeneratePapersRequest):
+def generate_papers_json(request: GeneratePapersRequest):
     """
     PHASE 6.3 - Generate papers from structured JSON payload
     Uses existing AI logic as BLACK BOX
@@ -794,8 +900,9 @@ async def generate_papers_json(request: GeneratePapersRequest):
         # Generate papers for each student
         for idx, student in enumerate(request.student_details):
             # Use existing question assignment logic
-            shuffled_questions = shuffle_array(sample_questions)
-            selected_questions = shuffled_questions[:request.questions_per_bank]
+            with STAGE_SECONDS.time(stage="sample"):
+                shuffled_questions = shuffle_array(sample_questions)
+                selected_questions = shuffled_questions[:request.questions_per_bank]
             
             # Validate and complete questions using existing AI logic
             completed_questions = [validate_and_complete_question(q) for q in selected_questions]
@@ -0,0 +1,266 @@
+"""
+Admission control for the AI services' expensive endpoints.
+
+An AdmissionController guards one class of endpoints (OCR, bulk, LLM...):
+at most `max_in_flight` requests at once and, together, at most `max_pages`
+pages and `max_bytes` bytes of input (0 = no limit). Requests that do not
+fit wait in a FIFO queue of at most `max_queue` entries for up to
+`max_wait` seconds; past either limit they are rejected at once with
+429 and a Retry-After estimated from recent request durations, instead of
+piling up until memory or the Gemini quota runs out. A request larger than
+a whole budget can never be admitted and gets 413.
+
+Async endpoints call acquire()/admit() once they know their cost;
+AdmissionMiddleware admits whole requests by path, costed by Content-Length,
+for services whose handlers run in the threadpool. With hold=False it only
+turns away bodies over a budget before they are read, and the endpoints take
+their own tickets.
+"""
+import asyncio
+import collections
+import contextlib
+import json
+import logging
+import math
+import os
+import time
+from typing import Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+REJECTION_REASONS = ("queue_full", "timeout", "too_large")
+
+
+class AdmissionRejected(Exception):
+    """Request turned away: 429 when over capacity (with Retry-After), 413 when it exceeds a budget outright."""
+
+    def __init__(self, message: str, reason: str, retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+        self.status_code = 413 if reason == "too_large" else 429
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Retry-After": str(self.retry_after)} if self.retry_after is not None else {}
+
+
+class AdmissionTicket:
+    """An admitted request's share of the budgets; release() is idempotent."""
+
+    __slots__ = ("controller", "pages", "nbytes", "started", "released")
+
+    def __init__(self, controller: "AdmissionController", pages: int, nbytes: int):
+        self.controller = controller
+        self.pages = pages
+        self.nbytes = nbytes
+        self.started = time.perf_counter()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller._release(self)
+
+
+class AdmissionController:
+    def __init__(self, name: str, max_in_flight: int = 0, max_queue: int = 0, max_wait: float = 5.0,
+                 max_pages: int = 0, max_bytes: int = 0):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.in_flight = 0
+        self.pages = 0
+        self.nbytes = 0
+        self.admitted = 0
+        self.rejected = {reason: 0 for reason in REJECTION_REASONS}
+        # Smoothed time an admitted request holds its slot, for Retry-After
+        self.mean_seconds = 1.0
+        self._waiters: Deque[Tuple[int, int, asyncio.Future]] = collections.deque()
+
+    @classmethod
+    def from_env(cls, name: str, max_in_flight: int, max_queue: int, max_wait: float,
+                 max_pages: int = 0, max_mb: float = 0) -> "AdmissionController":
+        """
+        Limits from ADMISSION_<NAME>_MAX_IN_FLIGHT, _MAX_QUEUE, _MAX_WAIT_SECONDS, _MAX_PAGES
+        and _MAX_MB, defaulting to the arguments when unset or empty (0 is honoured: no limit);
+        ADMISSION_ENABLED=false admits everything.
+        """
+        if os.getenv("ADMISSION_ENABLED", "true").lower() != "true":
+            return cls(name)
+        prefix = f"ADMISSION_{name.upper()}_"
+
+        def setting(key: str, default: float) -> float:
+            # Unset or empty takes the default; an explicit 0 means no limit (or no queue)
+            value = os.getenv(prefix + key, "").strip()
+            return float(value) if value else default
+
+        return cls(
+            name,
+            max_in_flight=int(setting("MAX_IN_FLIGHT", max_in_flight)),
+            max_queue=int(setting("MAX_QUEUE", max_queue)),
+            max_wait=setting("MAX_WAIT_SECONDS", max_wait),
+            max_pages=int(setting("MAX_PAGES", max_pages)),
+            max_bytes=int(setting("MAX_MB", max_mb) * 1024 * 1024)
+        )
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _fits(self, pages: int, nbytes: int) -> bool:
+        return ((not self.max_in_flight or self.in_flight < self.max_in_flight)
+                and (not self.max_pages or self.pages + pages <= self.max_pages)
+                and (not self.max_bytes or self.nbytes + nbytes <= self.max_bytes))
+
+    def _take(self, pages: int, nbytes: int) -> AdmissionTicket:
+        self.in_flight += 1
+        self.pages += pages
+        self.nbytes += nbytes
+        self.admitted += 1
+        return AdmissionTicket(self, pages, nbytes)
+
+    def _release(self, ticket: AdmissionTicket):
+        self.in_flight -= 1
+        self.pages -= ticket.pages
+        self.nbytes -= ticket.nbytes
+        self.mean_seconds += 0.2 * (time.perf_counter() - ticket.started - self.mean_seconds)
+        self._wake()
+
+    def _wake(self):
+        # Strict FIFO: a large request at the head is not overtaken by smaller ones behind it
+        while self._waiters:
+            pages, nbytes, future = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            if not self._fits(pages, nbytes):
+                break
+            self._waiters.popleft()
+            future.set_result(self._take(pages, nbytes))
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free: the queue ahead drained at the recent pace, 1 to 120."""
+        slots = self.max_in_flight or max(self.in_flight, 1)
+        return max(1, min(120, math.ceil(self.mean_seconds * (self.waiting + 1) / slots)))
+
+    def _reject(self, reason: str, message: str) -> AdmissionRejected:
+        self.rejected[reason] += 1
+        logger.warning(f"Admission '{self.name}' rejected a request ({reason}): {message}")
+        return AdmissionRejected(message, reason, None if reason == "too_large" else self.retry_after())
+
+    def check(self, pages: int = 0, nbytes: int = 0):
+        """Raise AdmissionRejected (413) for a request that exceeds a whole budget and could never be admitted."""
+        if self.max_pages and pages > self.max_pages:
+            raise self._reject("too_large", f"{pages} pages exceed the limit of {self.max_pages}")
+        if self.max_bytes and nbytes > self.max_bytes:
+            raise self._reject("too_large", f"{nbytes} bytes exceed the limit of {self.max_bytes}")
+
+    async def acquire(self, pages: int = 0, nbytes: int = 0) -> AdmissionTicket:
+        self.check(pages, nbytes)
+        if not self._waiters and self._fits(pages, nbytes):
+            return self._take(pages, nbytes)
+        if self.waiting >= self.max_queue:
+            raise self._reject("queue_full", "Server is at capacity, please retry later")
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (pages, nbytes, future)
+        self._waiters.append(entry)
+        try:
+            return await asyncio.wait_for(future, self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+            if future.done() and not future.cancelled():
+                future.result().release()  # admitted just as the wait ended
+            # The head may have been what blocked the requests behind it
+            self._wake()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise self._reject("timeout", f"No capacity within {self.max_wait:g}s, please retry later") from None
+
+    @contextlib.asynccontextmanager
+    async def admit(self, pages: int = 0, nbytes: int = 0):
+        ticket = await self.acquire(pages, nbytes)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def saturation(self) -> float:
+        """(in flight + waiting) / (slots + queue): 1.0 means the next request that does not fit is rejected."""
+        if not self.max_in_flight:
+            return 0.0
+        return round((self.in_flight + self.waiting) / (self.max_in_flight + self.max_queue), 4)
+
+    def stats(self) -> dict:
+        return {
+            "inFlight": self.in_flight,
+            "waiting": self.waiting,
+            "maxInFlight": self.max_in_flight,
+            "maxQueue": self.max_queue,
+            "pages": self.pages,
+            "maxPages": self.max_pages,
+            "bytes": self.nbytes,
+            "maxBytes": self.max_bytes,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "retryAfter": self.retry_after(),
+            "saturation": self.saturation()
+        }
+
+
+def content_length(scope) -> int:
+    """Declared request body size in bytes; 0 when missing or malformed."""
+    try:
+        return int(dict(scope["headers"]).get(b"content-length") or 0)
+    except ValueError:
+        return 0
+
+
+async def send_rejection(send, e: AdmissionRejected):
+    body = json.dumps({"error": str(e), "retryAfter": e.retry_after}).encode("utf-8")
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    headers += [(key.lower().encode(), value.encode()) for key, value in e.headers.items()]
+    await send({"type": "http.response.start", "status": e.status_code, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware: POST requests to the paths in `routes` hold a ticket from
+    their controller, costed by Content-Length, until the response is sent.
+    With hold=False, requests whose Content-Length exceeds their controller's
+    byte budget get 413 before the body is read and the rest pass through.
+    """
+
+    def __init__(self, app, routes: Dict[str, AdmissionController], hold: bool = True):
+        self.app = app
+        self.routes = routes
+        self.hold = hold
+
+    async def __call__(self, scope, receive, send):
+        controller = None
+        if scope["type"] == "http" and scope["method"] == "POST":
+            controller = self.routes.get(scope["path"])
+        if controller is None:
+            await self.app(scope, receive, send)
+            return
+        nbytes = content_length(scope)
+        ticket = None
+        try:
+            if self.hold:
+                ticket = await controller.acquire(nbytes=nbytes)
+            else:
+                controller.check(nbytes=nbytes)
+        except AdmissionRejected as e:
+            await send_rejection(send, e)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if ticket:
+                ticket.release()
@@ -0,0 +1,383 @@
+"""
+Shared Gemini client for the ExamZone AI services.
+
+One GeminiClient per service wraps every generate call with:
+- a cached model object per model name (no GenerativeModel per request),
+- token buckets for requests and (estimated) tokens per minute,
+- retries with full-jitter exponential backoff on transient errors,
+- a circuit breaker that fails fast while Gemini keeps failing,
+- counters for monitoring (GeminiClient.metrics()).
+
+Backends: GenaiBackend (google.generativeai) and FakeBackend, a local
+stand-in for tests and benchmarks that needs no API key or network.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+try:
+    from google.api_core import exceptions as google_exceptions
+except ImportError:  # Only needed with the real backend
+    google_exceptions = None
+
+logger = logging.getLogger(__name__)
+
+
+class GeminiError(Exception):
+    """A Gemini call failed after retries (or could not be attempted)."""
+
+
+class CircuitOpenError(GeminiError):
+    """Raised without calling Gemini while the circuit breaker is open."""
+
+
+class TransientError(Exception):
+    """Retryable failure raised by backends that have no google.api_core exception for it (e.g. FakeBackend)."""
+
+
+def is_transient(error: Exception) -> bool:
+    """Quota, overload, timeout and 5xx errors are worth retrying; bad requests and auth errors are not."""
+    if isinstance(error, (TransientError, asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    if google_exceptions is not None:
+        return isinstance(error, (
+            google_exceptions.ResourceExhausted,
+            google_exceptions.TooManyRequests,
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.DeadlineExceeded,
+            google_exceptions.InternalServerError,
+            google_exceptions.Aborted,
+        ))
+    return False
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) used for the token bucket before the real usage is known."""
+    return len(text) // 4 + 1
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at `rate_per_minute`.
+    reserve() takes tokens immediately (the balance may go negative) and
+    returns how long the caller must wait before its reservation is covered,
+    so concurrent callers queue up fairly instead of all retrying at once.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1.0) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= min(amount, self.capacity)
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def adjust(self, amount: float):
+        """Return (positive) or charge (negative) tokens once the real cost of a call is known."""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive transient failures and
+    rejects calls for `reset_timeout` seconds; then lets one trial call
+    through (half-open) and closes again if it succeeds. Every trial must
+    be settled: record_success(), record_failure(), or abandon_trial() when
+    it ended without an answer (e.g. it was cancelled).
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._trial = 0
+        self._lock = threading.Lock()
+
+    def admit(self) -> Optional[int]:
+        """0 for a normal call, a trial id for the half-open trial call, None when the call is rejected."""
+        with self._lock:
+            if self.state == "closed":
+                return 0
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._trial += 1
+                return self._trial
+            return None
+
+    def allow(self) -> bool:
+        return self.admit() is not None
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.times_opened += 1
+                    logger.warning(f"Gemini circuit breaker opened after {self.failures} consecutive failures")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def abandon_trial(self, trial: int):
+        """Back to open if trial `trial` is still unsettled; the next call becomes a new trial at once."""
+        with self._lock:
+            if self.state == "half_open" and trial == self._trial:
+                self.state = "open"
+
+
+def configure_genai(api_key: Optional[str], api_endpoint: Optional[str] = None):
+    """
+    Configure google.generativeai. A custom `api_endpoint` (e.g. the local
+    benchmark mock, http://127.0.0.1:8089) is reached over the REST transport.
+    """
+    import google.generativeai as genai
+    options = {"transport": "rest", "client_options": {"api_endpoint": api_endpoint}} if api_endpoint else {}
+    genai.configure(api_key=api_key, **options)
+    return genai
+
+
+class GenaiBackend:
+    """google.generativeai: configures the API key once and hands out GenerativeModel objects."""
+
+    name = "genai"
+
+    def __init__(self, api_key: Optional[str] = None, api_endpoint: Optional[str] = None):
+        self._genai = configure_genai(api_key, api_endpoint)
+        # The REST transport has no working generate_content_async; those calls run in a thread
+        self.supports_async = not api_endpoint
+
+    def create_model(self, model_name: str):
+        return self._genai.GenerativeModel(model_name)
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+        self.usage_metadata = None
+
+
+class FakeModel:
+    def __init__(self, backend: "FakeBackend", model_name: str):
+        self.backend = backend
+        self.model_name = model_name
+
+    def generate_content(self, prompt: str, **kwargs) -> FakeResponse:
+        delay, error = self.backend.next_call(prompt)
+        if delay:
+            time.sleep(delay)
+        if error:
+            raise error
+        return FakeResponse(self.backend.responder(prompt))
+
+    async def generate_content_async(self, prompt: str, **kwargs) -> FakeResponse:
+        delay, error = self.backend.next_call(prompt)
+        if delay:
+            await asyncio.sleep(delay)
+        if error:
+            raise error
+        return FakeResponse(self.backend.responder(prompt))
+
+
+class FakeBackend:
+    """
+    Local stand-in for Gemini. `responder` maps a prompt to the reply text;
+    `latency` seconds are slept per call; `failures` lists exceptions (or
+    None for success) to raise on successive calls before behaving normally.
+    Records every prompt in `prompts`.
+    """
+
+    name = "fake"
+    supports_async = True
+
+    def __init__(self, responder: Optional[Callable[[str], str]] = None, latency: float = 0.0,
+                 failures: Sequence[Optional[Exception]] = ()):
+        self.responder = responder or (lambda prompt: "")
+        self.latency = latency
+        self.failures = list(failures)
+        self.prompts = []
+        self._lock = threading.Lock()
+
+    def next_call(self, prompt: str):
+        with self._lock:
+            self.prompts.append(prompt)
+            error = self.failures.pop(0) if self.failures else None
+        return self.latency, error
+
+    def create_model(self, model_name: str) -> FakeModel:
+        return FakeModel(self, model_name)
+
+
+class GeminiClient:
+    def __init__(self, model_name: str, backend=None, api_key: Optional[str] = None, api_endpoint: Optional[str] = None,
+                 requests_per_minute: float = 60, tokens_per_minute: float = 1_000_000,
+                 max_retries: int = 3, base_delay: float = 1.0, max_delay: float = 30.0,
+                 timeout: Optional[float] = 60.0, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 latency_observer: Optional[Callable[[float], None]] = None):
+        self.model_name = model_name
+        self.backend = backend if backend is not None else GenaiBackend(api_key, api_endpoint)
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        # Called with the latency of every successful call, e.g. a metrics histogram's observe
+        self.latency_observer = latency_observer
+        self._models: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self._metrics = {
+            "requests": 0,
+            "successes": 0,
+            "failures": 0,
+            "retries": 0,
+            "circuitRejections": 0,
+            "rateLimitWaitSeconds": 0.0,
+            "latencySecondsTotal": 0.0,
+            "latencySecondsMax": 0.0,
+            "tokens": 0,
+        }
+
+    def model(self, model_name: Optional[str] = None):
+        """The cached model object for `model_name` (default: the client's model)."""
+        model_name = model_name or self.model_name
+        with self._lock:
+            model = self._models.get(model_name)
+            if model is None:
+                model = self._models[model_name] = self.backend.create_model(model_name)
+        return model
+
+    def _count(self, key: str, amount: float = 1):
+        with self._lock:
+            self._metrics[key] += amount
+
+    def _admit(self, prompt: str) -> Tuple[float, int]:
+        """
+        Circuit check plus rate-limit reservation; returns seconds to wait before
+        sending and the breaker trial id (0 unless this is the half-open trial call).
+        """
+        trial = self.breaker.admit()
+        if trial is None:
+            self._count("circuitRejections")
+            raise CircuitOpenError("Gemini circuit breaker is open; failing fast")
+        wait = max(self.request_bucket.reserve(1), self.token_bucket.reserve(estimate_tokens(prompt)))
+        if wait:
+            self._count("rateLimitWaitSeconds", wait)
+        return wait, trial
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: uniform in [0, min(max_delay, base * 2^attempt)]
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _record(self, prompt: str, response, started: float) -> str:
+        latency = time.perf_counter() - started
+        text = response.text
+        estimated = estimate_tokens(prompt)
+        usage = getattr(response, "usage_metadata", None)
+        tokens = getattr(usage, "total_token_count", None) or estimated + estimate_tokens(text)
+        # Charge the token bucket for what the call really cost beyond the prompt estimate
+        self.token_bucket.adjust(estimated - tokens)
+        self.breaker.record_success()
+        if self.latency_observer:
+            self.latency_observer(latency)
+        with self._lock:
+            self._metrics["successes"] += 1
+            self._metrics["tokens"] += tokens
+            self._metrics["latencySecondsTotal"] += latency
+            self._metrics["latencySecondsMax"] = max(self._metrics["latencySecondsMax"], latency)
+        return text
+
+    def _failed(self, error: Exception, attempt: int) -> bool:
+        """Record a failed attempt; returns True when it should be retried."""
+        transient = is_transient(error)
+        if transient:
+            self.breaker.record_failure()
+        else:
+            # Gemini answered (a bad request, a blocked prompt...): it is reachable
+            self.breaker.record_success()
+        if transient and attempt < self.max_retries:
+            self._count("retries")
+            logger.warning(f"Gemini call failed ({type(error).__name__}: {str(error)[:200]}), retry {attempt + 1}/{self.max_retries}")
+            return True
+        self._count("failures")
+        return False
+
+    async def generate_async(self, prompt: str, model_name: Optional[str] = None, **kwargs) -> str:
+        model = self.model(model_name)
+        self._count("requests")
+        for attempt in range(self.max_retries + 1):
+            wait, trial = self._admit(prompt)
+            try:
+                if wait:
+                    await asyncio.sleep(wait)
+                started = time.perf_counter()
+                try:
+                    if self.backend.supports_async:
+                        call = model.generate_content_async(prompt, **kwargs)
+                    else:
+                        call = asyncio.to_thread(model.generate_content, prompt, **kwargs)
+                    response = await asyncio.wait_for(call, self.timeout)
+                    return self._record(prompt, response, started)
+                except Exception as e:
+                    if not self._failed(e, attempt):
+                        raise GeminiError(f"Gemini call failed: {str(e)}") from e
+            finally:
+                # A cancelled trial call settles nothing; without this the breaker would stay half-open
+                if trial:
+                    self.breaker.abandon_trial(trial)
+            await asyncio.sleep(self._backoff(attempt))
+        raise GeminiError("Gemini call failed")  # Unreachable: the last attempt raises above
+
+    def generate(self, prompt: str, model_name: Optional[str] = None, **kwargs) -> str:
+        """Blocking variant for synchronous code paths."""
+        model = self.model(model_name)
+        self._count("requests")
+        if self.timeout and isinstance(self.backend, GenaiBackend):
+            kwargs.setdefault("request_options", {"timeout": self.timeout})
+        for attempt in range(self.max_retries + 1):
+            wait, trial = self._admit(prompt)
+            try:
+                if wait:
+                    time.sleep(wait)
+                started = time.perf_counter()
+                try:
+                    response = model.generate_content(prompt, **kwargs)
+                    return self._record(prompt, response, started)
+                except Exception as e:
+                    if not self._failed(e, attempt):
+                        raise GeminiError(f"Gemini call failed: {str(e)}") from e
+            finally:
+                if trial:
+                    self.breaker.abandon_trial(trial)
+            time.sleep(self._backoff(attempt))
+        raise GeminiError("Gemini call failed")
+
+    def metrics(self) -> dict:
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics["latencySecondsMean"] = round(metrics["latencySecondsTotal"] / metrics["successes"], 4) if metrics["successes"] else 0.0
+        for key in ("rateLimitWaitSeconds", "latencySecondsTotal", "latencySecondsMax"):
+            metrics[key] = round(metrics[key], 4)
+        metrics["circuitState"] = self.breaker.state
+        metrics["circuitOpened"] = self.breaker.times_opened
+        metrics["backend"] = self.backend.name
+        metrics["model"] = self.model_name
+        return metrics
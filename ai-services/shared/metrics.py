@@ -0,0 +1,289 @@
+"""
+Minimal Prometheus instrumentation shared by the AI services.
+
+A Registry holds counters, gauges and histograms (optionally labelled) plus
+collector callbacks that read live values (queue depths, cache stats, Gemini
+client counters) at scrape time. Registry.render() produces the Prometheus
+text exposition format served on /metrics.
+"""
+import contextlib
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds: covers sub-millisecond splitting up to minute-long OCR of large scans
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelValues = Tuple[str, ...]
+# (name, type, help, [(labels dict, value)]) as returned by collector callbacks
+Family = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in labels.items()) + "}"
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterable[Tuple[str, Dict[str, str], float]]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in values.items():
+            yield f"{self.name}_total", dict(zip(self.labelnames, key)), value
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        key = self._key(labels)
+        with self._lock:
+            return self._values.get(key, 0.0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in values.items():
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # label values -> [bucket counts..., sum, count]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def time(self, **labels) -> "Timer":
+        """Context manager / decorator observing the elapsed wall time in seconds."""
+        return Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(state) for key, state in self._values.items()}
+        for key, state in values.items():
+            labels = dict(zip(self.labelnames, key))
+            for i, bound in enumerate(self.buckets):
+                yield f"{self.name}_bucket", {**labels, "le": format_value(bound)}, state[i]
+            yield f"{self.name}_sum", labels, state[-2]
+            yield f"{self.name}_count", labels, state[-1]
+
+
+class Timer(contextlib.ContextDecorator):
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+        self.started = 0.0
+
+    def _recreate_cm(self):
+        # Used as a decorator, every call gets its own timer (calls may overlap across threads)
+        return Timer(self.histogram, self.labels)
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class Registry:
+    def __init__(self, prefix: str = ""):
+        self.prefix = prefix
+        self._metrics: List[Metric] = []
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def _register(self, metric: Metric) -> Metric:
+        metric.name = self.prefix + metric.name
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def collector(self, collect: Callable[[], Iterable[Family]]):
+        """Register a callback returning (name, type, help, [(labels, value)]) families at scrape time."""
+        self._collectors.append(collect)
+        return collect
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(f"{name}{format_labels(labels)} {format_value(value)}" for name, labels, value in metric.samples())
+        for collect in self._collectors:
+            for name, metric_type, documentation, samples in collect():
+                name = self.prefix + name
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                suffix = "_total" if metric_type == "counter" else ""
+                lines.extend(f"{name}{suffix}{format_labels(labels)} {format_value(value)}" for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+def gemini_client_families(client) -> List[Family]:
+    """Counters and gauges for a GeminiClient, read from its metrics() at scrape time."""
+    if client is None:
+        return []
+    metrics = client.metrics()
+    model = {"model": metrics["model"]}
+    return [
+        ("gemini_requests", "counter", "Gemini generate calls", [(model, metrics["requests"])]),
+        ("gemini_failures", "counter", "Gemini calls that failed after retries", [(model, metrics["failures"])]),
+        ("gemini_retries", "counter", "Gemini attempts retried after a transient error", [(model, metrics["retries"])]),
+        ("gemini_circuit_rejections", "counter", "Gemini calls rejected by the open circuit breaker",
+         [(model, metrics["circuitRejections"])]),
+        ("gemini_tokens", "counter", "Gemini tokens used (prompt + response)", [(model, metrics["tokens"])]),
+        ("gemini_rate_limit_wait_seconds", "counter", "Time spent waiting on the Gemini token buckets",
+         [(model, metrics["rateLimitWaitSeconds"])]),
+        ("gemini_circuit_open", "gauge", "1 while the Gemini circuit breaker is open or half-open",
+         [(model, 0 if metrics["circuitState"] == "closed" else 1)]),
+    ]
+
+
+def admission_families(controllers) -> List[Family]:
+    """Gauges and counters for AdmissionControllers, labelled by endpoint class."""
+    stats = {controller.name: controller.stats() for controller in controllers}
+    return [
+        ("admission_in_flight", "gauge", "Admitted requests being handled",
+         [({"class": name}, s["inFlight"]) for name, s in stats.items()]),
+        ("admission_waiting", "gauge", "Requests queued for admission",
+         [({"class": name}, s["waiting"]) for name, s in stats.items()]),
+        ("admission_saturation", "gauge", "(in flight + waiting) / (slots + queue)",
+         [({"class": name}, s["saturation"]) for name, s in stats.items()]),
+        ("admission_admitted", "counter", "Requests admitted",
+         [({"class": name}, s["admitted"]) for name, s in stats.items()]),
+        ("admission_rejected", "counter", "Requests rejected with 429/413, by reason",
+         [({"class": name, "reason": reason}, count)
+          for name, s in stats.items() for reason, count in s["rejected"].items()]),
+    ]
+
+
+class HTTPMetrics:
+    """
+    ASGI middleware: request latency by method, route template and status,
+    plus the number of requests in flight.
+    """
+
+    def __init__(self, app, latency: Histogram, in_flight: Gauge):
+        self.app = app
+        self.latency = latency
+        self.in_flight = in_flight
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        self.in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self.in_flight.dec()
+            route = scope.get("route")
+            # Route templates keep label cardinality bounded; unmatched paths are lumped together
+            self.latency.observe(time.perf_counter() - started, method=scope["method"],
+                                 route=getattr(route, "path", "unmatched"), status=str(status["code"]))
+
+
+def instrument_app(app, registry: Registry) -> Gauge:
+    """Add HTTPMetrics to a FastAPI app; returns the in-flight gauge for readiness checks."""
+    latency = registry.histogram("http_request_duration_seconds", "HTTP request latency",
+                                 ("method", "route", "status"))
+    in_flight = registry.gauge("http_requests_in_flight", "HTTP requests being handled")
+    in_flight.set(0)
+    app.add_middleware(HTTPMetrics, latency=latency, in_flight=in_flight)
+    return in_flight
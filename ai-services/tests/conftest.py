@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# The services import their modules flat (see the Dockerfiles), so tests do the same
+AI_SERVICES = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(AI_SERVICES / "answer-checker"))
+sys.path.insert(0, str(AI_SERVICES / "shared"))
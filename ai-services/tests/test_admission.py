@@ -0,0 +1,58 @@
+import asyncio
+
+from admission import AdmissionController, AdmissionMiddleware
+
+
+def call(controller, hold=True, path="/upload", content_length=None):
+    """Run one POST through AdmissionMiddleware guarding /upload; returns (status, whether the app ran)."""
+    ran = []
+    headers = [] if content_length is None else [(b"content-length", str(content_length).encode())]
+    scope = {"type": "http", "method": "POST", "path": path, "headers": headers}
+    sent = []
+
+    async def app(scope, receive, send):
+        ran.append(True)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(AdmissionMiddleware(app, {"/upload": controller}, hold=hold)(scope, receive, send))
+    return sent[0]["status"], bool(ran)
+
+
+def test_size_check_rejects_oversized_bodies_before_the_app():
+    controller = AdmissionController("ocr", max_in_flight=1, max_bytes=100)
+    assert call(controller, hold=False, content_length=101) == (413, False)
+    assert controller.rejected["too_large"] == 1
+
+
+def test_size_check_does_not_take_a_ticket():
+    controller = AdmissionController("ocr", max_in_flight=1, max_bytes=100)
+    controller._take(0, 0)  # the only slot is busy; the endpoint would queue for its own ticket
+    assert call(controller, hold=False, content_length=100) == (200, True)
+    assert call(controller, hold=False) == (200, True)
+    assert controller.in_flight == 1
+
+
+def test_holding_middleware_admits_by_content_length():
+    controller = AdmissionController("llm", max_in_flight=1, max_bytes=100)
+    assert call(controller, content_length=50) == (200, True)
+    assert call(controller, content_length=500) == (413, False)
+    assert call(controller, path="/other", content_length=500) == (200, True)
+    assert controller.in_flight == 0
+
+
+def test_from_env_honours_zero(monkeypatch):
+    monkeypatch.setenv("ADMISSION_OCR_MAX_PAGES", "0")
+    monkeypatch.setenv("ADMISSION_OCR_MAX_MB", "0")
+    monkeypatch.setenv("ADMISSION_OCR_MAX_QUEUE", "0")
+    monkeypatch.setenv("ADMISSION_OCR_MAX_IN_FLIGHT", "")
+    controller = AdmissionController.from_env("ocr", max_in_flight=4, max_queue=8, max_wait=10, max_pages=200, max_mb=256)
+    assert (controller.max_pages, controller.max_bytes, controller.max_queue) == (0, 0, 0)
+    assert controller.max_in_flight == 4
+    assert controller.max_wait == 10
@@ -0,0 +1,137 @@
+import asyncio
+import time
+
+import pytest
+
+from gemini_client import (CircuitBreaker, CircuitOpenError, FakeBackend, GeminiClient, GeminiError, TokenBucket,
+                           TransientError, is_transient)
+
+
+def make_client(failures=(), latency=0.0, **kwargs) -> GeminiClient:
+    options = {"max_retries": 2, "base_delay": 0.0, "max_delay": 0.0, "failure_threshold": 2, "reset_timeout": 0.05,
+               "requests_per_minute": 60_000, **kwargs}
+    backend = FakeBackend(lambda prompt: f"echo {prompt}", latency=latency, failures=failures)
+    return GeminiClient("fake-model", backend=backend, **options)
+
+
+def open_breaker(client: GeminiClient):
+    with pytest.raises(GeminiError):
+        client.generate("prompt")
+    assert client.breaker.state == "open"
+    time.sleep(client.breaker.reset_timeout)
+
+
+def test_is_transient():
+    assert is_transient(TransientError("overloaded"))
+    assert is_transient(asyncio.TimeoutError())
+    assert is_transient(ConnectionError())
+    assert not is_transient(ValueError("bad request"))
+
+
+def test_transient_errors_are_retried():
+    client = make_client(failures=[TransientError("busy"), TransientError("busy")], failure_threshold=5)
+    assert client.generate("hi") == "echo hi"
+    assert client.metrics()["retries"] == 2
+    assert client.breaker.state == "closed"
+
+
+def test_non_transient_error_is_not_retried():
+    client = make_client(failures=[ValueError("bad request")])
+    with pytest.raises(GeminiError):
+        client.generate("hi")
+    assert len(client.backend.prompts) == 1
+    assert client.metrics()["retries"] == 0
+
+
+def test_breaker_opens_and_rejects_without_calling():
+    client = make_client(failures=[TransientError("down")] * 3)
+    open_breaker(client)
+    client.breaker.reset_timeout = 60
+    calls, rejections = len(client.backend.prompts), client.metrics()["circuitRejections"]
+    with pytest.raises(CircuitOpenError):
+        client.generate("hi")
+    assert len(client.backend.prompts) == calls
+    assert client.metrics()["circuitRejections"] == rejections + 1
+
+
+def test_half_open_trial_success_closes():
+    client = make_client(failures=[TransientError("down")] * 2)
+    open_breaker(client)
+    assert client.generate("hi") == "echo hi"
+    assert client.breaker.state == "closed"
+
+
+def test_half_open_trial_failure_reopens():
+    client = make_client(failures=[TransientError("down")] * 3, max_retries=1)
+    open_breaker(client)
+    with pytest.raises(GeminiError):
+        client.generate("hi")
+    assert client.breaker.state == "open"
+
+
+def test_non_transient_trial_settles_the_breaker():
+    # Two transient failures open the breaker, then the trial call gets a non-transient error
+    client = make_client(failures=[TransientError("down"), TransientError("down"), ValueError("bad request")])
+    open_breaker(client)
+    with pytest.raises(GeminiError):
+        client.generate("hi")
+    assert client.breaker.state == "closed"
+    assert client.generate("again") == "echo again"
+
+
+def test_cancelled_trial_does_not_leave_the_breaker_half_open():
+    client = make_client(failures=[TransientError("down")] * 2)
+    open_breaker(client)
+    client.backend.latency = 1.0
+
+    async def cancel_trial():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(client.generate_async("slow"), 0.05)
+
+    asyncio.run(cancel_trial())
+    assert client.breaker.state == "open"
+    client.backend.latency = 0.0
+    assert client.generate("hi") == "echo hi"
+    assert client.breaker.state == "closed"
+
+
+def test_breaker_allows_one_trial_at_a_time():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    trial = breaker.admit()
+    assert trial
+    assert breaker.admit() is None
+    breaker.abandon_trial(trial)
+    assert breaker.admit() == trial + 1
+
+
+def test_stale_trial_does_not_abandon_a_newer_one():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    first = breaker.admit()
+    breaker.record_failure()
+    second = breaker.admit()
+    breaker.abandon_trial(first)
+    assert breaker.state == "half_open"
+    breaker.abandon_trial(second)
+    assert breaker.state == "open"
+
+
+def test_token_bucket_waits_once_empty():
+    bucket = TokenBucket(rate_per_minute=60, capacity=2)
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(1.0, abs=0.05)
+    # Later callers queue behind earlier reservations
+    assert bucket.reserve() == pytest.approx(2.0, abs=0.05)
+
+
+def test_token_bucket_adjust_refunds_and_caps():
+    bucket = TokenBucket(rate_per_minute=60, capacity=2)
+    bucket.reserve(2)
+    bucket.adjust(2)
+    assert bucket.reserve(2) == 0.0
+    # Refunds never fill the bucket past its capacity
+    bucket.adjust(100)
+    assert bucket.reserve(2) == 0.0
+    assert bucket.reserve(1) == pytest.approx(1.0, abs=0.05)
@@ -0,0 +1,47 @@
+import asyncio
+import json
+import re
+
+from gemini_client import FakeBackend, GeminiClient
+from grading import GradingEngine
+from segmentation import UNCLEAR_ANSWER, segment_by_layout
+
+
+def reply(prompt: str) -> str:
+    if "Respond only with JSON" in prompt:
+        numbers = [int(n) for n in re.findall(r"Extracted Answer (\d+):", prompt)]
+        return json.dumps({"results": [{"questionNumber": n, "cleanedText": "Paris", "status": "Correct",
+                                        "feedback": "Right"} for n in numbers]})
+    return "Status: Correct\nFeedback: Right"
+
+
+def make_engine():
+    backend = FakeBackend(reply)
+    return GradingEngine(GeminiClient("fake-model", backend=backend, requests_per_minute=60_000)), backend
+
+
+def sheet(*lines):
+    """Word boxes for one page, one text line per row."""
+    words = []
+    for row, text in enumerate(lines):
+        x = 40
+        for token in text.split():
+            words.append((1, x, 40 + 30 * row, x + 9 * len(token), 58 + 30 * row, token))
+            x += 9 * len(token) + 8
+    return words
+
+
+def test_padded_question_is_unclear_without_gemini():
+    # Question 2's number was not read, so its text stays in answer 1 and answer 2 is padding
+    answers = segment_by_layout(sheet("1. Paris", "Berlin", "3. Rome", "4. Madrid"), 4)
+    assert answers[1] == UNCLEAR_ANSWER
+    for mode in ("per_question", "fused"):
+        engine, backend = make_engine()
+        results, total = asyncio.run(engine.grade(answers, [2, 4, 2, 2], mode=mode))
+        assert results[1]["status"] == "Unclear"
+        assert results[1]["marks"] == "2/4"
+        assert total == 2 + 2 + 2 + 2
+        if mode == "fused":
+            assert not any("Extracted Answer 2:" in prompt for prompt in backend.prompts)
+        else:
+            assert len(backend.prompts) == 3 * 2  # enhance + check for the readable answers only
@@ -0,0 +1,34 @@
+import asyncio
+
+from pipeline import Pipeline, Stage
+
+
+def test_stats_count_busy_workers_and_queued_items():
+    release = asyncio.Event()
+    snapshots = []
+
+    async def slow(item):
+        await release.wait()
+        return item
+
+    async def main():
+        pipeline = Pipeline([Stage("fast", lambda item: asyncio.sleep(0, item)), Stage("slow", slow)], queue_size=2)
+
+        async def source():
+            for item in range(5):
+                yield item
+
+        async def watch():
+            await asyncio.sleep(0.05)
+            snapshots.append(pipeline.stats())
+            release.set()
+
+        watcher = asyncio.ensure_future(watch())
+        results = [item async for item, error in pipeline.run(source())]
+        await watcher
+        return results, pipeline.stats()
+
+    results, after = asyncio.run(main())
+    assert sorted(results) == list(range(5))
+    assert snapshots[0]["slow"] == {"busy": 1, "queued": 2, "workers": 1}
+    assert after["slow"]["busy"] == after["fast"]["busy"] == 0
@@ -0,0 +1,88 @@
+import pytest
+
+from pregrader import compare_numbers, pregrade, same_tokens
+
+PHOTOSYNTHESIS = ("Photosynthesis is the process by which green plants use sunlight, water and carbon dioxide "
+                  "to make glucose and release oxygen.")
+
+
+def grade(expected: str, student: str, marks: int = 5, **question):
+    return pregrade([{"text": "Question", "marks": marks, "expectedAnswer": expected, "studentAnswer": student,
+                      **question}]).get(0)
+
+
+@pytest.mark.parametrize("expected, student", [("144", "145"), ("1945", "1939"), ("144", "144.4"), ("0.75", "0.7")])
+def test_wrong_numbers_get_zero(expected, student):
+    result = grade(expected, student)
+    assert result["method"] == "numeric"
+    assert result["marksAwarded"] == 0
+
+
+@pytest.mark.parametrize("expected, student", [("144", "144.0"), ("1,000", "1000"), ("0.75", ".75"),
+                                               ("0.75", "0.752"), ("3.14", "3.14159"), ("1e3", "1000")])
+def test_equal_numbers_get_full_marks(expected, student):
+    result = grade(expected, student)
+    assert result["method"] == "numeric"
+    assert result["marksAwarded"] == 5
+
+
+def test_integers_compare_exactly():
+    assert compare_numbers("144", "145") == (False, "Numeric answer differs from 144")
+    assert compare_numbers("100000", "100001")[0] is False
+
+
+def test_explicit_tolerance_is_absolute():
+    assert compare_numbers("9.81", "9.9", tolerance=0.1)[0] is True
+    assert compare_numbers("9.81", "9.95", tolerance=0.1)[0] is False
+
+
+def test_fraction_answer_to_decimal_question_goes_to_llm():
+    # 'Write 3/4 as a decimal.' answered '3/4'
+    assert grade("0.75", "3/4") is None
+
+
+def test_fractions_compare_when_expected_is_a_fraction():
+    assert grade("3/4", "3 / 4")["marksAwarded"] == 5
+    assert grade("3/4", "2/3")["marksAwarded"] == 0
+    # Same value in other terms may not be what the question asks for
+    assert grade("3/4", "6/8") is None
+    assert grade("3/4", "0.75") is None
+
+
+def test_negated_answer_is_not_accepted():
+    assert grade(PHOTOSYNTHESIS, PHOTOSYNTHESIS.replace("is the process", "is not the process")) is None
+    assert grade("Water boils at 100 degrees", "Water never boils at 100 degrees") is None
+
+
+def test_different_number_token_is_not_accepted():
+    assert grade("The war ended in 1945", "The war ended in 1918") is None
+
+
+def test_near_verbatim_answer_is_accepted_on_token_equality():
+    answer = PHOTOSYNTHESIS.replace("by which", "in which")
+    if not same_tokens(PHOTOSYNTHESIS, answer):
+        pytest.skip("needs spaCy's stop words")
+    result = grade(PHOTOSYNTHESIS, answer)
+    assert result["method"] == "tokens"
+    assert result["marksAwarded"] == 5
+
+
+def test_paraphrase_goes_to_llm():
+    assert grade(PHOTOSYNTHESIS, "Plants make their food from sunlight and give out oxygen.") is None
+
+
+def test_case_matters_when_the_expected_answer_uses_it():
+    assert grade("CO", "Co") is None
+    assert grade("NaCl", "nacl") is None
+    assert grade("Paris", "paris.")["marksAwarded"] == 5
+
+
+def test_mcq_option_by_letter_or_text():
+    text = "Which gas do plants absorb? (a) Oxygen (b) Carbon dioxide (c) Nitrogen"
+    assert grade("b", "Carbon dioxide", text=text)["marksAwarded"] == 5
+    assert grade("b", "(a)", text=text)["marksAwarded"] == 0
+
+
+def test_blank_answer_gets_zero_and_missing_expected_is_left_to_llm():
+    assert grade("Paris", "  ")["method"] == "blank"
+    assert grade("", "Paris") is None
@@ -0,0 +1,56 @@
+import asyncio
+import os
+import time
+
+from reports import ReportStore
+
+RESULTS = [{"questionText": "Capital of France?", "extractedText": "Paris", "feedback": "Correct", "marks": "1/1"}]
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def age(path, seconds):
+    old = time.time() - seconds
+    os.utime(path, (old, old))
+
+
+def test_serving_refreshes_the_expiry_clock(tmp_path):
+    store = ReportStore(str(tmp_path), max_bytes=1 << 20, ttl_seconds=3600)
+
+    async def save_and_open():
+        try:
+            filename = await store.save(RESULTS, "1/1")
+            age(tmp_path / filename, 7200)
+            return filename, await store.open(filename)
+        finally:
+            await store.stop()
+
+    filename, path = run(save_and_open())
+    assert path == tmp_path / filename
+    assert store.cleanup() == 0
+    assert path.is_file()
+
+
+def test_missing_or_malformed_reports_do_not_open(tmp_path):
+    store = ReportStore(str(tmp_path), max_bytes=1 << 20, ttl_seconds=3600)
+    assert run(store.open("report_" + "0" * 64 + ".pdf")) is None
+    assert run(store.open("../secrets.pdf")) is None
+
+
+def test_quota_eviction_spares_recent_reports(tmp_path):
+    store = ReportStore(str(tmp_path), max_bytes=1 << 20, ttl_seconds=3600, grace_seconds=60)
+
+    async def save_both():
+        try:
+            return [await store.save(RESULTS, total) for total in ("1/1", "0/1")]
+        finally:
+            await store.stop()
+
+    old, recent = run(save_both())
+    age(tmp_path / old, 120)
+    store.max_bytes = 1
+    assert store.cleanup() == 1
+    assert not (tmp_path / old).exists()
+    assert (tmp_path / recent).is_file()
@@ -0,0 +1,84 @@
+from segmentation import UNCLEAR_ANSWER, longest_increasing, segment_by_layout, split_answers
+
+
+def layout(*lines, indent=()):
+    """Word boxes for one page, one text line per row; rows in `indent` start further right."""
+    words = []
+    for row, text in enumerate(lines):
+        x = 120 if row in indent else 40
+        for token in text.split():
+            words.append((1, x, 40 + 30 * row, x + 9 * len(token), 58 + 30 * row, token))
+            x += 9 * len(token) + 8
+    return words
+
+
+def test_repeated_number_keeps_the_earliest_candidate():
+    assert longest_increasing([(0, 1), (1, 1), (2, 2), (3, 2)]) == [(0, 1), (2, 2)]
+
+
+def test_numbered_list_inside_an_answer_is_not_an_anchor():
+    words = layout("1. Causes were:", "1. Militarism", "2. Alliances", "3. Imperialism",
+                   "2. The archduke was shot in Sarajevo", "3. It ended in 1918")
+    assert segment_by_layout(words, 3) == [
+        "Causes were: 1. Militarism 2. Alliances 3. Imperialism",
+        "The archduke was shot in Sarajevo",
+        "It ended in 1918",
+    ]
+
+
+def test_layout_keeps_answer_text_unnormalised():
+    words = layout("Name: Sol", "1. Pi is about so", "2) lo and behold")
+    assert segment_by_layout(words, 3) == ["Pi is about so", "lo and behold", UNCLEAR_ANSWER]
+
+
+def test_split_answers_keeps_answer_text_unnormalised():
+    assert split_answers("1. Pi is about so\n2. Oslo", 2) == ["Pi is about so", "Oslo"]
+
+
+def test_numbers_inside_marked_answers_are_not_markers():
+    text = ("1. Pi is about 3.14 and 22/7 is close.\n"
+            "2. Water boils at 100 degrees.\n"
+            "At 2.5 km up it boils near 92.\n"
+            "3. The war ended in 1945.\n")
+    assert split_answers(text, 3) == [
+        "Pi is about 3.14 and 22/7 is close.",
+        "Water boils at 100 degrees. At 2.5 km up it boils near 92.",
+        "The war ended in 1945.",
+    ]
+
+
+def test_markers_only_match_at_line_starts():
+    text = "Name: Sam\n1. In 1914. Then\n5. came the war\n2) Berlin\nQuestion 3 Paris"
+    assert split_answers(text, 4) == ["In 1914. Then 5. came the war", "Berlin", "Paris", UNCLEAR_ANSWER]
+
+
+def test_unnumbered_separators_keep_the_first_answer():
+    assert split_answers("Paris\nAnswer: Berlin\nAnswer: Rome", 3) == ["Paris", "Berlin", "Rome"]
+    assert split_answers("Paris --- Berlin --- Rome", 3, delimiter="---") == ["Paris", "Berlin", "Rome"]
+
+
+def test_unmarked_text_is_chunked():
+    assert split_answers("one two three four", 2) == ["one two", "three four"]
+
+
+def test_look_alikes_are_only_read_in_marker_numbers():
+    assert split_answers("l. Paris is big\nSo. what\n2) Oslo", 2) == ["Paris is big So. what", "Oslo"]
+
+
+def test_prefixed_markers_drop_their_punctuation():
+    assert split_answers("Q1. Paris\nQ2. Newton\nQ3. H2O", 3) == ["Paris", "Newton", "H2O"]
+    assert split_answers("Q1: Paris\nQ2) Newton", 2) == ["Paris", "Newton"]
+
+
+def test_regex_and_layout_share_the_marker_grammar():
+    text = "Ans 1. Paris\nAnswer 2: Newton\nQuestion 3 - H2O"
+    assert split_answers(text, 3) == ["Paris", "Newton", "H2O"]
+    assert segment_by_layout(layout(*text.split("\n")), 3) == ["Paris", "Newton", "H2O"]
+
+
+def test_prefixed_markers_split_within_a_line():
+    assert split_answers("Question 1 Paris Question 2 Rome", 2) == ["Paris", "Rome"]
+
+
+def test_unmarked_lines_are_chunked_before_words():
+    assert split_answers("the sun\nis a star\nwater\nis wet", 2) == ["the sun is a star", "water is wet"]
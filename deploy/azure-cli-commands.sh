@@ -127,14 +127,14 @@ build_and_push_images() {
     
     # Build and push AI Question Generator
     log_info "Building AI Question Generator image..."
-    docker build -t $ACR_LOGIN_SERVER/$AI_GENERATOR_APP:$IMAGE_TAG ./ai-services/question-generator
+    docker build -t $ACR_LOGIN_SERVER/$AI_GENERATOR_APP:$IMAGE_TAG -f ./ai-services/question-generator/Dockerfile ./ai-services
     log_info "Pushing AI Question Generator image..."
     docker push $ACR_LOGIN_SERVER/$AI_GENERATOR_APP:$IMAGE_TAG
     log_success "AI Question Generator image pushed"
     
     # Build and push AI Answer Checker
     log_info "Building AI Answer Checker image..."
-    docker build -t $ACR_LOGIN_SERVER/$AI_CHECKER_APP:$IMAGE_TAG ./ai-services/answer-checker
+    docker build -t $ACR_LOGIN_SERVER/$AI_CHECKER_APP:$IMAGE_TAG -f ./ai-services/answer-checker/Dockerfile ./ai-services
     log_info "Pushing AI Answer Checker image..."
     docker push $ACR_LOGIN_SERVER/$AI_CHECKER_APP:$IMAGE_TAG
     log_success "AI Answer Checker image pushed"
@@ -51,12 +51,12 @@ docker push "$REGISTRY/$GITHUB_USERNAME/examzone-backend:latest"
 
 # Build and push AI generator
 Write-Host "Building AI question generator..." -ForegroundColor Blue
-docker build -t "$REGISTRY/$GITHUB_USERNAME/examzone-ai-generator:latest" ./ai-services/question-generator
+docker build -t "$REGISTRY/$GITHUB_USERNAME/examzone-ai-generator:latest" -f ./ai-services/question-generator/Dockerfile ./ai-services
 docker push "$REGISTRY/$GITHUB_USERNAME/examzone-ai-generator:latest"
 
 # Build and push AI checker
 Write-Host "Building AI answer checker..." -ForegroundColor Blue
-docker build -t "$REGISTRY/$GITHUB_USERNAME/examzone-ai-checker:latest" ./ai-services/answer-checker
+docker build -t "$REGISTRY/$GITHUB_USERNAME/examzone-ai-checker:latest" -f ./ai-services/answer-checker/Dockerfile ./ai-services
 docker push "$REGISTRY/$GITHUB_USERNAME/examzone-ai-checker:latest"
 
 Write-Host "All images pushed to GHCR" -ForegroundColor Green
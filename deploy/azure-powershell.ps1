@@ -133,14 +133,14 @@ function Build-AndPushImages {
     
     # Build and push AI Question Generator
     Write-Info "Building AI Question Generator image..."
-    docker build -t "$ACR_LOGIN_SERVER/${AI_GENERATOR_APP}:$IMAGE_TAG" ./ai-services/question-generator
+    docker build -t "$ACR_LOGIN_SERVER/${AI_GENERATOR_APP}:$IMAGE_TAG" -f ./ai-services/question-generator/Dockerfile ./ai-services
     Write-Info "Pushing AI Question Generator image..."
     docker push "$ACR_LOGIN_SERVER/${AI_GENERATOR_APP}:$IMAGE_TAG"
     Write-Success "AI Question Generator image pushed"
     
     # Build and push AI Answer Checker
     Write-Info "Building AI Answer Checker image..."
-    docker build -t "$ACR_LOGIN_SERVER/${AI_CHECKER_APP}:$IMAGE_TAG" ./ai-services/answer-checker
+    docker build -t "$ACR_LOGIN_SERVER/${AI_CHECKER_APP}:$IMAGE_TAG" -f ./ai-services/answer-checker/Dockerfile ./ai-services
     Write-Info "Pushing AI Answer Checker image..."
     docker push "$ACR_LOGIN_SERVER/${AI_CHECKER_APP}:$IMAGE_TAG"
     Write-Success "AI Answer Checker image pushed"